@@ -10,7 +10,7 @@ def main() -> int:
         print('No arguments provided. Use -h or --help for help.')
         return 1
     if sys.argv[1] == '-h' or sys.argv[1] == '--help':
-        print('Usage: python -m gltf_materialx_converter <command> [options] where command is mtlx2gltf or gltf2mtlx')
+        print('Usage: python -m gltf_materialx_converter <command> [options] where command is gltf, mtlx, serve, verify or merge-manifests')
 
     # Check if the command is valid
     # Check if the command is valid
@@ -19,6 +19,12 @@ def main() -> int:
         cmdArgs[0] = 'materialx_to_gltf.py'
     elif cmdArgs[0] == 'mtlx':
         cmdArgs[0] = 'gltf_to_materialx.py'
+    elif cmdArgs[0] == 'serve':
+        cmdArgs[0] = 'server.py'
+    elif cmdArgs[0] == 'verify':
+        cmdArgs[0] = 'verify.py'
+    elif cmdArgs[0] == 'merge-manifests':
+        cmdArgs[0] = 'manifest.py'
     else:
         print('Unknown command specified:', cmdArgs[0])
         return 1
@@ -0,0 +1,591 @@
+'''
+@file bake.py
+Baking of procedural graph outputs into fallback images for viewers which do not support
+procedural textures. Graphs are evaluated on the CPU with NumPy over a grid of texture
+coordinates. Standard library nodes implemented by node graphs are evaluated through their
+implementation, so only a small set of primitive nodes is evaluated directly. Graphs using
+nodes outside of this set are not baked.
+
+NumPy is an optional dependency. Baking is unavailable if it is not installed.
+'''
+import os
+import json
+import zlib
+import base64
+import struct
+import hashlib
+import threading
+import MaterialX as mx
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+## @var DEFAULT_BAKE_RESOLUTION
+#  @brief Default width and height of baked fallback images.
+DEFAULT_BAKE_RESOLUTION = 64
+
+## @var BAKE_CACHE_SIZE
+#  @brief Maximum number of baked images kept by a FallbackBaker.
+BAKE_CACHE_SIZE = 256
+
+## @var BAKE_TYPE_SIZES
+#  @brief Number of components of the types which can be evaluated.
+BAKE_TYPE_SIZES = {'boolean': 1, 'integer': 1, 'float': 1, 'vector2': 2, 'vector3': 3, 'vector4': 4, 'color3': 3, 'color4': 4}
+
+## @var BAKE_COLOR_TYPES
+#  @brief Types which are encoded as sRGB when written to an image.
+BAKE_COLOR_TYPES = ('color3', 'color4')
+
+## @var BAKE_CHANNEL_NAMES
+#  @brief Output names of the separate nodes and input names of the combine nodes, per component.
+BAKE_CHANNEL_NAMES = {
+    'vector2': ('x', 'y'),
+    'vector3': ('x', 'y', 'z'),
+    'vector4': ('x', 'y', 'z', 'w'),
+    'color3': ('r', 'g', 'b'),
+    'color4': ('r', 'g', 'b', 'a')
+}
+
+def have_numpy():
+    '''
+    Check if NumPy is available for baking.
+    @return True if NumPy is installed.
+    '''
+    return np is not None
+
+def srgb_to_linear(values):
+    '''
+    Convert sRGB encoded values to linear values.
+    @param values: The values as an array.
+    @return The linear values.
+    '''
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+def linear_to_srgb(values):
+    '''
+    Convert linear values to sRGB encoded values.
+    @param values: The values as an array, clamped to 0 to 1.
+    @return The sRGB encoded values.
+    '''
+    return np.where(values <= 0.0031308, values * 12.92, 1.055 * np.power(values, 1.0 / 2.4) - 0.055)
+
+def encode_png(pixels):
+    '''
+    Encode 8-bit pixels as a PNG image.
+    @param pixels: Array of shape (height, width, channels) of type uint8, with 3 or 4 channels.
+    Rows are ordered from top to bottom.
+    @return The PNG file content.
+    '''
+    height, width, channels = pixels.shape
+    color_type = 6 if channels == 4 else 2
+
+    def chunk(chunk_type, data):
+        return struct.pack('>I', len(data)) + chunk_type + data + struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff)
+
+    # Each row starts with filter type 0
+    rows = np.zeros((height, width * channels + 1), dtype=np.uint8)
+    rows[:, 1:] = pixels.reshape(height, width * channels)
+    header = struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) +
+            chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)) + chunk(b'IEND', b''))
+
+def get_image_pixels(value, type):
+    '''
+    Convert an evaluated output to 8-bit image pixels. Colors are sRGB encoded, and other types are
+    written as is. Single values are written as grey, and 2 component values to the red and green channels.
+    @param value: The evaluated value, of shape (height, width, components).
+    @param type: The output type.
+    @return Array of shape (height, width, 3 or 4) of type uint8.
+    '''
+    value = np.clip(value, 0.0, 1.0)
+    if type in BAKE_COLOR_TYPES:
+        value = np.concatenate([linear_to_srgb(value[..., :3]), value[..., 3:]], axis=-1)
+    components = value.shape[-1]
+    if components == 1:
+        value = np.repeat(value, 3, axis=-1)
+    elif components == 2:
+        value = np.concatenate([value, np.zeros_like(value[..., :1])], axis=-1)
+    return (value * 255.0 + 0.5).astype(np.uint8)
+
+def _hash_lattice(ix, iy, seed):
+    '''
+    Hash integer lattice coordinates to pseudo random 32-bit values.
+    '''
+    h = ix.astype(np.uint32) * np.uint32(0x27d4eb2d) ^ iy.astype(np.uint32) * np.uint32(0x165667b1) ^ np.uint32(seed * 0x9e3779b9 & 0xffffffff)
+    h ^= h >> np.uint32(15)
+    h *= np.uint32(0x2c1b3c6d)
+    h ^= h >> np.uint32(12)
+    h *= np.uint32(0x297a2d39)
+    h ^= h >> np.uint32(15)
+    return h
+
+def perlin_noise(uv, seed=0):
+    '''
+    Evaluate 2D gradient noise. The result is in the range of about -1 to 1. The noise has the
+    character of the MaterialX noise nodes but does not match them exactly.
+    @param uv: Array of texture coordinates of shape (..., 2).
+    @param seed: Seed selecting an independent noise pattern. Default is 0.
+    @return Array of noise values of shape (..., 1).
+    '''
+    cell = np.floor(uv)
+    offset = uv - cell
+    cell = cell.astype(np.int64)
+    fade = offset * offset * offset * (offset * (offset * 6.0 - 15.0) + 10.0)
+
+    def corner(dx, dy):
+        angle = _hash_lattice(cell[..., 0] + dx, cell[..., 1] + dy, seed) * (2.0 * np.pi / 4294967296.0)
+        return np.cos(angle) * (offset[..., 0] - dx) + np.sin(angle) * (offset[..., 1] - dy)
+
+    bottom = corner(0, 0) + (corner(1, 0) - corner(0, 0)) * fade[..., 0]
+    top = corner(0, 1) + (corner(1, 1) - corner(0, 1)) * fade[..., 0]
+    return ((bottom + (top - bottom) * fade[..., 1]) * np.sqrt(2.0))[..., np.newaxis]
+
+def _componentwise(operation):
+    def evaluate(evaluator, get, type):
+        return {'out': operation(get('in1'), get('in2'))}
+    return evaluate
+
+def _unary(operation):
+    def evaluate(evaluator, get, type):
+        return {'out': operation(get('in'))}
+    return evaluate
+
+def _modulo(a, b):
+    return a - b * np.floor(a / b)
+
+def _separate(evaluator, get, type):
+    value = get('in')
+    return {f'out{name}': value[..., index:index + 1] for index, name in enumerate(BAKE_CHANNEL_NAMES[evaluator.get_input_type('in')])}
+
+def _combine(evaluator, get, type):
+    count = BAKE_TYPE_SIZES[type]
+    values = np.broadcast_arrays(*[get(f'in{index + 1}') for index in range(count)])
+    return {'out': np.concatenate(values, axis=-1)}
+
+def _convert(evaluator, get, type):
+    value = get('in')
+    count = BAKE_TYPE_SIZES[type]
+    if value.shape[-1] == 1:
+        return {'out': np.repeat(value, count, axis=-1)}
+    if value.shape[-1] >= count:
+        return {'out': value[..., :count]}
+    padding = np.ones(value.shape[:-1] + (count - value.shape[-1],))
+    return {'out': np.concatenate([value, padding], axis=-1)}
+
+def _extract(evaluator, get, type):
+    index = int(get('index').flat[0])
+    return {'out': get('in')[..., index:index + 1]}
+
+def _switch(evaluator, get, type):
+    which = get('which')
+    if which.size != 1:
+        raise ValueError('Switch nodes with varying selection are not supported')
+    return {'out': get(f'in{int(which.flat[0]) + 1}')}
+
+def _rotate2d(evaluator, get, type):
+    value = get('in')
+    angle = np.radians(get('amount'))
+    sin, cos = np.sin(angle), np.cos(angle)
+    x, y = value[..., 0:1], value[..., 1:2]
+    return {'out': np.concatenate(np.broadcast_arrays(cos * x + sin * y, -sin * x + cos * y), axis=-1)}
+
+def _mix(evaluator, get, type):
+    background = get('bg')
+    return {'out': background + (get('fg') - background) * get('mix')}
+
+def _clamp(evaluator, get, type):
+    return {'out': np.clip(get('in'), get('low'), get('high'))}
+
+def _dotproduct(evaluator, get, type):
+    return {'out': np.sum(get('in1') * get('in2'), axis=-1, keepdims=True)}
+
+def _remap(evaluator, get, type):
+    low = get('inlow')
+    value = (get('in') - low) / (get('inhigh') - low)
+    outlow = get('outlow')
+    return {'out': outlow + value * (get('outhigh') - outlow)}
+
+def _conditional(comparison):
+    def evaluate(evaluator, get, type):
+        condition = comparison(get('value1'), get('value2'))
+        if type == 'boolean':
+            return {'out': condition.astype(np.float64)}
+        return {'out': np.where(condition, get('in1'), get('in2'))}
+    return evaluate
+
+def _split(axis, low, high):
+    def evaluate(evaluator, get, type):
+        value = get(low)
+        step = (get('texcoord')[..., axis:axis + 1] >= get('center')).astype(np.float64)
+        return {'out': value + (get(high) - value) * step}
+    return evaluate
+
+def _ramplr(evaluator, get, type):
+    left = get('valuel')
+    return {'out': left + (get('valuer') - left) * np.clip(get('texcoord')[..., 0:1], 0.0, 1.0)}
+
+def _ramptb(evaluator, get, type):
+    bottom = get('valueb')
+    return {'out': bottom + (get('valuet') - bottom) * np.clip(get('texcoord')[..., 1:2], 0.0, 1.0)}
+
+def _noise2d(evaluator, get, type):
+    texcoord = get('texcoord')
+    noise = np.concatenate([perlin_noise(texcoord, seed) for seed in range(BAKE_TYPE_SIZES[type])], axis=-1)
+    return {'out': noise * get('amplitude') + get('pivot')}
+
+def _texcoord(evaluator, get, type):
+    return {'out': evaluator.uv}
+
+def _image(evaluator, get, type):
+    sampled = evaluator.sample_image(get('file'), get('texcoord'), evaluator.get_input_colorspace('file'),
+                                     BAKE_TYPE_SIZES[type], get('uaddressmode'), get('vaddressmode'))
+    return {'out': sampled if sampled is not None else get('default')}
+
+## @var BAKE_OPERATIONS
+#  @brief Node categories which are evaluated directly, and their evaluation functions.
+#  Each function takes the evaluator, an input getter and the node type and returns the outputs by name.
+BAKE_OPERATIONS = {
+    'constant': lambda evaluator, get, type: {'out': get('value')},
+    'dot': lambda evaluator, get, type: {'out': get('in')},
+    'add': _componentwise(lambda a, b: a + b),
+    'subtract': _componentwise(lambda a, b: a - b),
+    'multiply': _componentwise(lambda a, b: a * b),
+    'divide': _componentwise(lambda a, b: a / np.where(b == 0.0, 1.0, b)),
+    'modulo': _componentwise(_modulo),
+    'power': _componentwise(lambda a, b: np.nan_to_num(np.power(a, b))),
+    'min': _componentwise(np.minimum),
+    'max': _componentwise(np.maximum),
+    'absval': _unary(np.abs),
+    'floor': _unary(np.floor),
+    'ceil': _unary(np.ceil),
+    'fract': _unary(lambda a: a - np.floor(a)),
+    'sin': _unary(np.sin),
+    'cos': _unary(np.cos),
+    'sqrt': _unary(lambda a: np.sqrt(np.maximum(a, 0.0))),
+    'sign': _unary(np.sign),
+    'invert': lambda evaluator, get, type: {'out': get('amount') - get('in')},
+    'clamp': _clamp,
+    'dotproduct': _dotproduct,
+    'remap': _remap,
+    'mix': _mix,
+    'convert': _convert,
+    'extract': _extract,
+    'separate2': _separate,
+    'separate3': _separate,
+    'separate4': _separate,
+    'combine2': _combine,
+    'combine3': _combine,
+    'combine4': _combine,
+    'switch': _switch,
+    'ifgreater': _conditional(np.greater),
+    'ifgreatereq': _conditional(np.greater_equal),
+    'ifequal': _conditional(np.equal),
+    'rotate2d': _rotate2d,
+    'texcoord': _texcoord,
+    'ramplr': _ramplr,
+    'ramptb': _ramptb,
+    'splitlr': _split(0, 'valuel', 'valuer'),
+    'splittb': _split(1, 'valueb', 'valuet'),
+    'noise2d': _noise2d,
+    'image': _image
+}
+
+class _Scope():
+    '''
+    Evaluation state of a node graph. The interface inputs of an implementation graph
+    are the inputs of the node it implements.
+    '''
+    __slots__ = ('graph', 'interface', 'outputs')
+
+    def __init__(self, graph, interface):
+        self.graph = graph
+        self.interface = interface
+        self.outputs = {}
+
+class GraphEvaluator():
+    '''
+    @brief Class evaluating MaterialX node graph outputs over a grid of texture coordinates.
+
+    Values are NumPy arrays whose last axis holds the components of the value type. Uniform
+    values have a single texel so they broadcast over the grid. Node outputs are evaluated once
+    per graph, so outputs evaluated together share their upstream nodes.
+    '''
+
+    def __init__(self, resolution=DEFAULT_BAKE_RESOLUTION, images=None):
+        '''
+        Constructor
+        @param resolution: Width and height of the grid. Default is DEFAULT_BAKE_RESOLUTION.
+        @param images: Optional dictionary of loaded images by file name, shared between evaluators. Default is None.
+        @throws ImportError if NumPy is not installed.
+        '''
+        if np is None:
+            raise ImportError('NumPy is required for baking')
+        self.resolution = resolution
+        self.images = images if images is not None else {}
+        self.image_handler = None
+
+        # Texel centers, with the first row at the top of the image where v is 1
+        coordinates = (np.arange(resolution) + 0.5) / resolution
+        u, v = np.meshgrid(coordinates, 1.0 - coordinates)
+        self.uv = np.stack([u, v], axis=-1)
+
+        self.node = None
+        self.scopes = {}
+
+    def evaluate(self, outputs):
+        '''
+        Evaluate outputs of a node graph.
+        @param outputs: The graph outputs.
+        @return List of values of shape (resolution, resolution, components), in output order.
+        @throws ValueError if an output depends on a node or value which cannot be evaluated.
+        '''
+        results = []
+        for output in outputs:
+            graph = output.getParent()
+            scope = self.scopes.get(graph.getNamePath())
+            if scope is None:
+                scope = self.scopes[graph.getNamePath()] = _Scope(graph, lambda name, graph=graph: self.get_graph_input(graph, name))
+            value = self.evaluate_output(output, scope)
+            results.append(np.broadcast_to(value, self.uv.shape[:-1] + value.shape[-1:]))
+        return results
+
+    def get_graph_input(self, graph, name):
+        '''
+        Get the value of an interface input of a node graph.
+        '''
+        graph_input = graph.getInput(name)
+        if not graph_input:
+            raise ValueError(f'Missing graph input: {name}')
+        return self.get_value(graph_input, graph_input.getType())
+
+    def get_value(self, element, type):
+        '''
+        Get the value of an unconnected input, or the default geometric property it refers to.
+        '''
+        geomprop = element.getDefaultGeomPropString() if element.isA(mx.Input) else ''
+        if geomprop:
+            if geomprop != 'UV0':
+                raise ValueError(f'Unsupported geometric property: {geomprop}')
+            return self.uv
+        if type == 'filename':
+            file_name = element.getResolvedValueString()
+            source_uri = element.getActiveSourceUri()
+            if file_name and source_uri and not os.path.isabs(file_name):
+                file_name = os.path.join(os.path.dirname(source_uri), file_name)
+            return file_name
+        if type == 'string':
+            return element.getValueString()
+        if type not in BAKE_TYPE_SIZES:
+            raise ValueError(f'Unsupported type: {type}')
+        value = element.getValue() if element.hasValueString() else None
+        if value is None:
+            return np.zeros((1, 1, BAKE_TYPE_SIZES[type]))
+        values = value.asTuple() if hasattr(value, 'asTuple') else (float(value),)
+        return np.array(values, dtype=np.float64).reshape(1, 1, -1)
+
+    def evaluate_output(self, output, scope):
+        '''
+        Evaluate an output of a node graph in a scope.
+        '''
+        if output.getInterfaceName():
+            return scope.interface(output.getInterfaceName())
+        node = output.getConnectedNode()
+        if not node:
+            return self.get_value(output, output.getType())
+        return self.get_node_output(node, output.getOutputString(), scope)
+
+    def get_node_output(self, node, output_name, scope):
+        '''
+        Evaluate an output of a node, evaluating the node if it is not yet evaluated in the scope.
+        '''
+        outputs = scope.outputs.get(node.getName())
+        if outputs is None:
+            outputs = scope.outputs[node.getName()] = self.evaluate_node(node, scope)
+        if output_name:
+            if output_name not in outputs:
+                raise ValueError(f'Missing output: {output_name} on node: {node.getNamePath()}')
+            return outputs[output_name]
+        return outputs.get('out', next(iter(outputs.values())))
+
+    def evaluate_node(self, node, scope):
+        '''
+        Evaluate all outputs of a node.
+        '''
+        nodedef = node.getNodeDef()
+        if not nodedef:
+            raise ValueError(f'No definition found for node: {node.getNamePath()}')
+        inputs = {}
+
+        def get(name):
+            if name not in inputs:
+                inputs[name] = self.get_node_input(node, nodedef, name, scope)
+            return inputs[name]
+
+        category = node.getCategory()
+        operation = BAKE_OPERATIONS.get(category)
+        if operation:
+            previous_node, self.node = self.node, (node, nodedef)
+            try:
+                return operation(self, get, node.getType())
+            finally:
+                self.node = previous_node
+
+        implementation = nodedef.getImplementation()
+        if not implementation or not implementation.isA(mx.NodeGraph):
+            raise ValueError(f'Unsupported node: {category}')
+        implementation_scope = _Scope(implementation, get)
+        return {output.getName(): self.evaluate_output(output, implementation_scope) for output in implementation.getOutputs()}
+
+    def get_node_input(self, node, nodedef, name, scope):
+        '''
+        Evaluate an input of a node, using the definition default if the node does not specify it.
+        '''
+        node_input = node.getInput(name)
+        nodedef_input = nodedef.getActiveInput(name)
+        if not node_input:
+            if not nodedef_input:
+                raise ValueError(f'Missing input: {name} on node: {node.getNamePath()}')
+            return self.get_value(nodedef_input, nodedef_input.getType())
+
+        if node_input.getNodeName():
+            connected = node_input.getConnectedNode()
+            if not connected:
+                raise ValueError(f'Missing node: {node_input.getNodeName()}')
+            return self.get_node_output(connected, node_input.getOutputString(), scope)
+        if node_input.getInterfaceName():
+            return scope.interface(node_input.getInterfaceName())
+        if node_input.getNodeGraphString():
+            raise ValueError(f'Unsupported node graph connection on node: {node.getNamePath()}')
+        if not node_input.hasValueString() and nodedef_input:
+            return self.get_value(nodedef_input, nodedef_input.getType())
+        return self.get_value(node_input, node_input.getType())
+
+    def get_input_type(self, name):
+        '''
+        Get the type of an input of the node being evaluated.
+        '''
+        node, nodedef = self.node
+        node_input = node.getInput(name) or nodedef.getActiveInput(name)
+        return node_input.getType()
+
+    def get_input_colorspace(self, name):
+        '''
+        Get the color space of an input of the node being evaluated.
+        '''
+        node, nodedef = self.node
+        node_input = node.getInput(name)
+        return node_input.getActiveColorSpace() if node_input else ''
+
+    def load_image(self, file_name):
+        '''
+        Load an image as an array of shape (height, width, 4), with rows from top to bottom.
+        Loaded images are cached by file name.
+        @param file_name: The image file.
+        @return The image, or None if it cannot be loaded.
+        '''
+        if file_name in self.images:
+            return self.images[file_name]
+        image = None
+        if file_name and os.path.isfile(file_name):
+            try:
+                import MaterialX.PyMaterialXRender as mx_render
+                if not self.image_handler:
+                    self.image_handler = mx_render.ImageHandler.create(mx_render.StbImageLoader.create())
+                image = self.image_handler.acquireImage(mx.FilePath(file_name))
+            except ImportError:
+                image = None
+        self.images[file_name] = image
+        return image
+
+    def sample_image(self, file_name, texcoord, colorspace, components, uaddressmode='periodic', vaddressmode='periodic'):
+        '''
+        Sample an image at texture coordinates using the nearest texel. Only the texels
+        which are sampled are read from the image.
+        @return The linear values of shape (..., components), or None if the image cannot be loaded.
+        '''
+        image = self.load_image(file_name)
+        if image is None or image.getWidth() == 0:
+            return None
+        width, height = image.getWidth(), image.getHeight()
+        texcoord = np.broadcast_to(texcoord, self.uv.shape)
+
+        def wrap(coordinate, size, mode):
+            if mode == 'periodic':
+                coordinate = coordinate - np.floor(coordinate)
+            elif mode == 'mirror':
+                coordinate = np.abs(_modulo(coordinate + 1.0, 2.0) - 1.0)
+            return np.clip((coordinate * size).astype(np.int64), 0, size - 1)
+
+        x = wrap(texcoord[..., 0], width, uaddressmode)
+        y = wrap(1.0 - texcoord[..., 1], height, vaddressmode)
+        texels, inverse = np.unique(y * width + x, return_inverse=True)
+        colors = np.array([image.getTexelColor(int(texel % width), int(texel // width)).asTuple() for texel in texels])
+        values = colors[inverse.reshape(x.shape)]
+        if image.getChannelCount() == 1:
+            values[..., 1:3] = values[..., 0:1]
+        if colorspace == 'srgb_texture':
+            values[..., :3] = srgb_to_linear(values[..., :3])
+        return values[..., :components] if components > 1 else values[..., :1]
+
+class FallbackBaker():
+    '''
+    @brief Class baking procedural graph outputs into PNG data URIs, caching the results by a key
+    such as a hash of the exported graph. Loaded images are shared between bakes. A single baker
+    can be used for many documents, such as all documents of a library export, and by several
+    threads at once.
+    '''
+
+    def __init__(self, cache_size=BAKE_CACHE_SIZE):
+        '''
+        Constructor
+        @param cache_size: Maximum number of cached images. Default is BAKE_CACHE_SIZE.
+        '''
+        self.cache_size = cache_size
+        self.cache = {}
+        self.images = {}
+        self.lock = threading.Lock()
+
+    def bake(self, outputs, resolution=DEFAULT_BAKE_RESOLUTION, key=None):
+        '''
+        Bake outputs of a node graph. The outputs are evaluated together so that they share
+        their upstream nodes.
+        @param outputs: The graph outputs.
+        @param resolution: Width and height of the images. Default is DEFAULT_BAKE_RESOLUTION.
+        @param key: Optional cache key of the graph. Default is None meaning the results are not cached.
+        @return List of data URIs in output order, and an error message. The list is None if
+        the outputs cannot be evaluated.
+        '''
+        cache_key = None
+        if key is not None:
+            cache_key = (key, resolution, tuple(output.getName() for output in outputs))
+            with self.lock:
+                uris = self.cache.get(cache_key)
+            if uris is not None:
+                return uris, ''
+
+        try:
+            with np.errstate(all='ignore'):
+                values = GraphEvaluator(resolution, self.images).evaluate(outputs)
+        except (ValueError, IndexError, KeyError) as e:
+            return None, str(e)
+        uris = []
+        for output, value in zip(outputs, values):
+            png = encode_png(get_image_pixels(value, output.getType()))
+            uris.append('data:image/png;base64,' + base64.b64encode(png).decode('ascii'))
+
+        if cache_key is not None:
+            with self.lock:
+                if len(self.cache) >= self.cache_size:
+                    self.cache.pop(next(iter(self.cache)))
+                self.cache[cache_key] = uris
+        return uris, ''
+
+def get_graph_key(*values):
+    '''
+    Get a cache key for JSON values, such as an exported procedural and the images it references.
+    @param values: The JSON values.
+    @return The key string.
+    '''
+    return hashlib.blake2b(json.dumps(values, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
@@ -0,0 +1,394 @@
+'''
+@file batch.py
+File batch conversion shared by the command line utilities. A file runner converts a single input
+file and returns a result which can be sent between processes, so that the files of a batch can be
+converted in this process or by a ConversionWorkerPool, with the results collected in input order.
+'''
+import os
+import json
+import time
+import collections
+import jsonschema
+from jsonschema import validate as json_validate
+import MaterialX as mx
+
+try:
+    from . import utilities as MxGLTFPTUtil
+    from . import jobs as MxGLTFPTJobs
+    from . import report as MxGLTFPTReport
+    from . import tracing as MxGLTFPTTrace
+    from . import shadergen as MxGLTFPTShaderGen
+except ImportError:
+    import utilities as MxGLTFPTUtil
+    import jobs as MxGLTFPTJobs
+    import report as MxGLTFPTReport
+    import tracing as MxGLTFPTTrace
+    import shadergen as MxGLTFPTShaderGen
+
+def write_glTF_file(output_file, json_string, schema, logger):
+    '''
+    Validate a glTF JSON string against a schema if specified, and write it to file.
+    @param output_file: The file to write to.
+    @param json_string: The glTF JSON string to write.
+    @param schema: The JSON schema to validate against. Can be None.
+    @param logger: The logger to report to.
+    '''
+    if schema:
+        json_data = json.loads(json_string)  # Parse json_string to a dictionary
+        try:
+            json_validate(instance=json_data, schema=schema)  # Validate JSON data against the schema
+            logger.info('- JSON validation successful')
+        except jsonschema.exceptions.ValidationError as e:
+            logger.info('- JSON validation errors, ' + str(e))
+
+    with open(output_file, 'w') as f:
+        logger.info(f'Writing glTF: {output_file}')
+        f.write(json_string)
+
+def remove_files(file_list, logger):
+    '''
+    Remove previously written output files.
+    @param file_list: The files to remove.
+    @param logger: The logger to report to.
+    '''
+    for output_file in file_list:
+        if os.path.exists(output_file):
+            logger.info(f'Removing: {output_file}')
+            os.remove(output_file)
+
+def get_materialX_output_file(input_file):
+    '''
+    Get the MaterialX file written for a glTF file.
+    @param input_file: The glTF file.
+    @return The MaterialX file next to the glTF file.
+    '''
+    return input_file.replace('.gltf', '_fromgltf.mtlx')
+
+class FileJobRunner():
+    '''
+    @brief Base class for converting single files, in this process or in a ConversionWorkerPool.
+
+    A request is a dictionary with the 'path' of the file to convert. The result is the dictionary
+    returned by convert_file(), which has at least the conversion 'status' and the list of 'outputs'
+    written, with the 'statistics' of the conversion and the time taken in seconds as 'time' added.
+    If the conversion raises an exception, the result has an 'error' status and a 'message'.
+    '''
+
+    def __init__(self, diagnostics, logger, trace_allocations=False):
+        '''
+        Constructor
+        @param diagnostics: The Diagnostics collector to use. It is cleared before each file.
+        @param logger: The logger to report to.
+        @param trace_allocations: Trace the Python memory allocated by each file. Default is False.
+        '''
+        self.diagnostics = diagnostics
+        self.logger = logger
+        self.trace_allocations = trace_allocations
+
+    def convert_file(self, input_file, statistics):
+        '''
+        Convert a file. Implemented by derived classes.
+        @param input_file: The file to convert.
+        @param statistics: The FileStatistics to record to.
+        @return The result dictionary.
+        '''
+        raise NotImplementedError()
+
+    def run(self, request):
+        '''
+        Run a request.
+        @param request: The request dictionary.
+        @return The result dictionary.
+        '''
+        start_time = time.perf_counter()
+        statistics = MxGLTFPTReport.FileStatistics()
+        input_file = request['path']
+        self.logger.info(f'Processing: {input_file}')
+        self.diagnostics.clear()
+        try:
+            with MxGLTFPTTrace.span('convert_file', 'file', file=input_file), \
+                 statistics.measure_memory(self.trace_allocations):
+                result = self.convert_file(input_file, statistics)
+        except Exception as e:
+            result = {'status': 'error', 'message': f'{type(e).__name__}: {e}', 'outputs': []}
+        result['statistics'] = statistics
+        result['time'] = time.perf_counter() - start_time
+        return result
+
+class MaterialXFileRunner(FileJobRunner):
+    '''
+    @brief Class for converting MaterialX files to glTF files.
+
+    In addition to the status and outputs, the result has the files included by the document
+    as 'includes', which is None if the document could not be read, and the converted glTF JSON
+    object as 'json_data' when bundling. Documents are read into working documents which reference
+    the standard library.
+    '''
+
+    def __init__(self, converter, stdlib, output_folder, selection=None, schema=None, bundle=None,
+                 split_materials=False, diagnostics=None, logger=None, trace_allocations=False):
+        '''
+        Constructor
+        @param converter: The converter to use.
+        @param stdlib: The standard library to reference.
+        @param output_folder: The folder to write to.
+        @param selection: Optional ConversionFilter. Default is None.
+        @param schema: Optional JSON schema to validate written files against. Default is None.
+        @param bundle: Name of the bundle file. Converted data is returned instead of being written
+        if specified. Default is None.
+        @param split_materials: Write a file per material. Default is False.
+        @param diagnostics: The Diagnostics collector to use.
+        @param logger: The logger to report to.
+        @param trace_allocations: Trace the Python memory allocated by each file. Default is False.
+        '''
+        super().__init__(diagnostics, logger, trace_allocations)
+        self.converter = converter
+        self.stdlib = stdlib
+        self.output_folder = output_folder
+        self.selection = selection
+        self.schema = schema
+        self.bundle = bundle
+        self.split_materials = split_materials
+
+    def convert_file(self, input_file, statistics):
+        '''
+        Read, validate and convert a MaterialX document, writing its outputs.
+        @param input_file: The file to convert.
+        @param statistics: The FileStatistics to record to.
+        @return The result dictionary.
+        '''
+        converter, diagnostics, logger = self.converter, self.diagnostics, self.logger
+        result = {'status': 'failed', 'outputs': [], 'includes': None, 'json_data': None}
+        try:
+            with statistics.phase('read'):
+                mxdoc = MxGLTFPTUtil.create_reference_document(self.stdlib)
+                result['includes'] = MxGLTFPTUtil.read_materialX_document(mxdoc, input_file)
+            with statistics.phase('validate'):
+                valid, errors = MxGLTFPTUtil.validate_document(mxdoc)
+            statistics.counts = MxGLTFPTReport.get_materialX_counts(mxdoc)
+        except (mx.ExceptionFileMissing, mx.ExceptionParseError) as e:
+            valid, errors = False, str(e)
+
+        if not valid:
+            logger.warning(f'MaterialX document: {input_file} is invalid. Erors: {errors}')
+            result['status'] = 'invalid'
+            return result
+
+        # Add to bundle. The bundle is written once all documents are converted.
+        written = result['outputs']
+        if self.bundle:
+            with statistics.phase('convert'):
+                json_data, status = converter.materialX_to_glTF_data(mxdoc, selection=self.selection, diagnostics=diagnostics)
+            result['json_data'] = json_data
+            if status:
+                logger.info(f'- {status}')
+            written.append(os.path.join(self.output_folder, self.bundle))
+            if not json_data:
+                return result
+
+        # Convert to one glTF file per material
+        elif self.split_materials:
+            base_name = os.path.splitext(os.path.basename(input_file))[0]
+            with statistics.phase('convert'):
+                results = list(converter.materialX_to_glTF_per_material(mxdoc, self.selection, None, diagnostics))
+            for material_name, json_string, status in results:
+                if json_string:
+                    outputFile = os.path.join(self.output_folder, f'{base_name}_{material_name}.gltf')
+                    with statistics.phase('write'):
+                        write_glTF_file(outputFile, json_string, self.schema, logger)
+                    written.append(outputFile)
+                else:
+                    logger.warning(f'Error: {material_name}: {status}')
+
+        # Convert to glTF JSON
+        else:
+            with statistics.phase('convert'):
+                json_string, status = converter.materialX_to_glTF(mxdoc, self.selection, None, diagnostics)
+            if json_string:
+                # Write string to file replacing .mtlx with .json extension name
+                outputFile = os.path.join(self.output_folder, os.path.basename(input_file).replace('.mtlx', '.gltf'))
+                with statistics.phase('write'):
+                    write_glTF_file(outputFile, json_string, self.schema, logger)
+                written.append(outputFile)
+            else:
+                logger.warning(f'Error: {status}')
+
+        result['status'] = 'ok' if written else 'failed'
+        return result
+
+class glTFFileRunner(FileJobRunner):
+    '''
+    @brief Class for converting glTF files to MaterialX files written next to them.
+    See get_materialX_output_file().
+    '''
+
+    def __init__(self, converter, stdlib, selection=None, shader_checker=None,
+                 size_tolerance=MxGLTFPTShaderGen.DEFAULT_SIZE_TOLERANCE, diagnostics=None, logger=None, trace_allocations=False):
+        '''
+        Constructor
+        @param converter: The converter to use.
+        @param stdlib: The standard library to use.
+        @param selection: Optional ConversionFilter. Default is None.
+        @param shader_checker: Optional ShaderGenChecker used to generate shaders for each converted
+        document and compare them with those of the original MaterialX file. Default is None.
+        @param size_tolerance: Fraction by which generated shader source can grow before it is
+        reported as a regression. Default is DEFAULT_SIZE_TOLERANCE.
+        @param diagnostics: The Diagnostics collector to use.
+        @param logger: The logger to report to.
+        @param trace_allocations: Trace the Python memory allocated by each file. Default is False.
+        '''
+        super().__init__(diagnostics, logger, trace_allocations)
+        self.converter = converter
+        self.stdlib = stdlib
+        self.selection = selection
+        self.shader_checker = shader_checker
+        self.size_tolerance = size_tolerance
+
+    def check_shaders(self, input_file, mtlxdoc, statistics):
+        '''
+        Generate shaders for a converted document and compare them with those of the original document.
+        @param input_file: The glTF file.
+        @param mtlxdoc: The converted MaterialX document.
+        @param statistics: The FileStatistics to record to.
+        '''
+        logger = self.logger
+        mtlxdoc.setDataLibrary(self.stdlib)
+        with statistics.phase('shadergen'):
+            results = self.shader_checker.check_document(mtlxdoc)
+        for result in results:
+            if result['status'] == 'ok':
+                logger.info(f"Shader {result['name']}: {result['source_size']} characters, {result['uniforms']} uniforms, {result['time'] * 1000:.1f} ms")
+            else:
+                logger.warning(f"Shader generation failed for {result['name']}: {result['message']}")
+
+        regressions = []
+        original_file = input_file.replace('.gltf', '.mtlx')
+        if os.path.exists(original_file):
+            with statistics.phase('shadergen'):
+                original_doc = MxGLTFPTUtil.create_reference_document(self.stdlib)
+                MxGLTFPTUtil.read_materialX_document(original_doc, original_file)
+                original = self.shader_checker.check_document(original_doc)
+            regressions = MxGLTFPTShaderGen.find_regressions(original, results, self.size_tolerance)
+            for regression in regressions:
+                logger.warning(f"Shader regression from {original_file} for {regression['key']}: {regression['message']}")
+        statistics.counts['shaders'] = len(results)
+        statistics.counts['shader_failures'] = len([result for result in results if result['status'] != 'ok'])
+        statistics.counts['shader_regressions'] = len(regressions)
+
+    def convert_file(self, input_file, statistics):
+        '''
+        Read and convert a glTF document, writing the MaterialX document.
+        @param input_file: The file to convert.
+        @param statistics: The FileStatistics to record to.
+        @return The result dictionary.
+        '''
+        logger = self.logger
+        with statistics.phase('read'):
+            json_string = MxGLTFPTUtil.load_json_file(input_file)
+        if not json_string:
+            logger.warning(f'Unable to load glTF file: {input_file}')
+            return {'status': 'failed', 'outputs': []}
+
+        with statistics.phase('convert'):
+            mtlxdoc = self.converter.gltf_string_to_materialX(json_string, self.stdlib, self.selection, None, self.diagnostics)
+        with statistics.phase('validate'):
+            valid, status = MxGLTFPTUtil.validate_document(mtlxdoc)
+        statistics.counts = MxGLTFPTReport.get_materialX_counts(mtlxdoc)
+        with statistics.phase('serialize'):
+            mtlx_string = MxGLTFPTUtil.materialX_doc_to_string(mtlxdoc)
+
+        if not valid:
+            logger.warning(f'Created invalid MaterialX document. Error: {status}')
+        output_file = get_materialX_output_file(input_file)
+        with statistics.phase('write'), open(output_file, 'w') as f:
+            logger.info(f'Writing re-converted mtlx: {output_file}')
+            f.write(mtlx_string)
+        if self.shader_checker and valid:
+            self.check_shaders(input_file, mtlxdoc, statistics)
+        return {'status': 'ok' if valid else 'invalid', 'outputs': [output_file]}
+
+def get_worker_pool(runner, workers=1, max_jobs=0, memory_budget=0):
+    '''
+    Create a pool of worker processes to convert files with, if a worker count or limit is given.
+    @param runner: The FileJobRunner to use.
+    @param workers: Number of worker processes. Default is 1.
+    @param max_jobs: Number of files a worker converts before being replaced. Default is 0 meaning no limit.
+    @param memory_budget: Worker RSS in bytes above which the worker is replaced. Default is 0 meaning no limit.
+    @return The ConversionWorkerPool, or None to convert files in this process.
+    '''
+    if workers <= 1 and max_jobs <= 0 and memory_budget <= 0:
+        return None
+    return MxGLTFPTJobs.ConversionWorkerPool(runner, workers, max_jobs, memory_budget)
+
+def run_file_batch(input_files, runner, pool=None, max_pending=0):
+    '''
+    Convert a batch of files, yielding the results in input order. Files which raise an error, or whose
+    worker process exits while converting them, are reported to the logger of the runner.
+    @param input_files: The files to convert.
+    @param runner: The FileJobRunner to use in this process if no pool is given.
+    @param pool: Optional ConversionWorkerPool to convert the files with. Default is None.
+    @param max_pending: Maximum number of files in flight in the pool. Default is 0 meaning twice the number of workers.
+    @return Generator of the input file and result dictionary of each file.
+    '''
+    def get_result(input_file, result):
+        # The result of a worker which exited has no outputs or statistics
+        result.setdefault('outputs', [])
+        result.setdefault('statistics', MxGLTFPTReport.FileStatistics())
+        result.setdefault('time', 0.0)
+        if result.get('status') == 'error':
+            runner.logger.warning(f"Error: {input_file}: {result.get('message')}")
+        return input_file, result
+
+    if not pool:
+        for input_file in input_files:
+            yield get_result(input_file, runner.run({'path': input_file}))
+        return
+
+    if max_pending <= 0:
+        max_pending = 2 * pool.worker_count
+    pending = collections.deque()
+    for input_file in input_files:
+        pending.append((input_file, pool.submit({'path': input_file})))
+        while len(pending) >= max_pending:
+            input_file, ticket = pending.popleft()
+            yield get_result(input_file, pool.get_result(ticket))
+    while pending:
+        input_file, ticket = pending.popleft()
+        yield get_result(input_file, pool.get_result(ticket))
+
+def apply_document_result(input_file, result, dependencies, logger, bundle_data=None, watcher=None):
+    '''
+    Record the result of converting a MaterialX document. The included files and outputs are stored in
+    the dependency table, outputs of a previous conversion which are no longer written are removed, and
+    included files are watched.
+    @param input_file: The converted file.
+    @param result: The result dictionary. See MaterialXFileRunner.
+    @param dependencies: The DependencyTable to update.
+    @param logger: The logger to report removed files to.
+    @param bundle_data: Dictionary of converted data per document to update when bundling.
+    Default is None meaning documents are not bundled.
+    @param watcher: Optional FileWatcher to add the included files to. Default is None.
+    @return The conversion status and the list of files written.
+    '''
+    includes = result.get('includes')
+    if includes is None:
+        # Keep the previous includes so that the document is retried when they change
+        includes = dependencies.get_includes(input_file)
+    if watcher:
+        watcher.add_files(includes)
+
+    previous_outputs = dependencies.remove_document(input_file)
+    status, written = result.get('status'), result.get('outputs', [])
+    if status not in ('ok', 'failed'):
+        dependencies.set_document(input_file, includes, previous_outputs, False)
+        return status, []
+    if bundle_data is not None:
+        bundle_data[os.path.abspath(input_file)] = result.get('json_data')
+        if not result.get('json_data'):
+            return status, written
+
+    # Remove outputs from a previous conversion which are no longer produced
+    dependencies.set_document(input_file, includes, written)
+    if bundle_data is None:
+        remove_files(set(previous_outputs) - set(os.path.abspath(f) for f in written), logger)
+    return status, written
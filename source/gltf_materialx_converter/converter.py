@@ -4,10 +4,27 @@
 @file converter.py
 This module contains the core functionality for MaterialX glTF ProceduralTexture graph conversion.
 '''
+import os
 import json
+import copy
+import fnmatch
+import dataclasses
 import MaterialX as mx
 import logging as lg 
 
+try:
+    from . import diagnostics as MxGLTFPTDiag
+    from . import tracing as MxGLTFPTTrace
+    from . import optimize as MxGLTFPTOptimize
+    from . import cost as MxGLTFPTCost
+    from . import bake as MxGLTFPTBake
+except ImportError:
+    import diagnostics as MxGLTFPTDiag
+    import tracing as MxGLTFPTTrace
+    import optimize as MxGLTFPTOptimize
+    import cost as MxGLTFPTCost
+    import bake as MxGLTFPTBake
+
 '''
 Package globals
 '''
@@ -111,6 +128,18 @@ KHR_TEXTURE_PROCEDURALS_NODEGROUP = 'nodegroup'
 # @brief The block for procedural textures.
 KHR_TEXTURE_PROCEDURALS_PROCEDURALS_BLOCK = 'procedurals'
 
+## @var KHR_TEXTURE_PROCEDURALS_DEFINITIONS_BLOCK
+# @brief The block for custom node definitions and their procedural implementations.
+KHR_TEXTURE_PROCEDURALS_DEFINITIONS_BLOCK = 'procedural_definitions'
+
+## @var KHR_TEXTURE_PROCEDURALS_NODEDEF
+# @brief The node type of a node definition, and the reference from an implementation to its definition.
+KHR_TEXTURE_PROCEDURALS_NODEDEF = 'nodedef'
+
+## @var KHR_TEXTURE_PROCEDURALS_FALLBACK_NAME
+# @brief Name of the fallback image used by procedural textures.
+KHR_TEXTURE_PROCEDURALS_FALLBACK_NAME = 'KHR_texture_procedural_fallback'
+
 ## @var MTLX_DEFAULT_MATERIAL_NAME
 #  @brief Default name for a MaterialX material for generation.
 MTLX_DEFAULT_MATERIAL_NAME = 'MATERIAL_0'
@@ -171,21 +200,386 @@ MTLX_UNLIT_CATEGORY_STRING = 'surface_unlit'
 #  @brief String identifier for multi-output types in MaterialX.
 MULTI_OUTPUT_TYPE_STRING = 'multioutput'
 
+## @var MTLX_STANDARD_UI_METADATA
+#  @brief Standard UI metadata defined by MaterialX.
+MTLX_STANDARD_UI_METADATA = ('xpos', 'ypos', 'width', 'height', 'uicolor')
+
+## @var MTLX_SUPPORTED_METADATA
+#  @brief Default MaterialX metadata transferred for inputs, outputs and nodes.
+MTLX_SUPPORTED_METADATA = ('colorspace', 'unit', 'unittype', 
+                           'uiname', 'uimin', 'uimax', 'uisoftmin', 'uisoftmax', 'uistep', 'uifolder', 'uiadvanced', 'uivisible',
+                           'defaultgeomprop', 'uniform', 
+                           'doc') + MTLX_STANDARD_UI_METADATA
+
+## @var MTLX_SUPPORTED_GRAPH_METADATA
+#  @brief Default MaterialX metadata transferred for node graphs.
+MTLX_SUPPORTED_GRAPH_METADATA = ('colorspace', 'unit', 'unittype', 'uiname', 'doc') + MTLX_STANDARD_UI_METADATA
+
+## @var MTLX_EDITOR_METADATA
+#  @brief MaterialX metadata only used by editors, such as documentation, UI hints and layout.
+MTLX_EDITOR_METADATA = ('doc', 'uiname', 'uimin', 'uimax', 'uisoftmin', 'uisoftmax', 'uistep', 'uifolder',
+                        'uiadvanced', 'uivisible') + MTLX_STANDARD_UI_METADATA
+
+## @var EXPORT_PROFILE_AUTHORING
+#  @brief Export profile which keeps all metadata and writes indented JSON.
+EXPORT_PROFILE_AUTHORING = 'authoring'
+
+## @var EXPORT_PROFILE_DELIVERY
+#  @brief Export profile for runtimes which only render. Editor metadata is not exported,
+#  JSON is written without whitespace and floats are rounded.
+EXPORT_PROFILE_DELIVERY = 'delivery'
+
+## @var EXPORT_PROFILES
+#  @brief ConversionOptions values of each named export profile.
+EXPORT_PROFILES = {
+    EXPORT_PROFILE_AUTHORING: {
+        'metadata': MTLX_SUPPORTED_METADATA,
+        'graph_metadata': MTLX_SUPPORTED_GRAPH_METADATA,
+        'excluded_node_attributes': (),
+        'compact_json': False,
+        'float_precision': None
+    },
+    EXPORT_PROFILE_DELIVERY: {
+        'metadata': tuple(meta for meta in MTLX_SUPPORTED_METADATA if meta not in MTLX_EDITOR_METADATA),
+        'graph_metadata': tuple(meta for meta in MTLX_SUPPORTED_GRAPH_METADATA if meta not in MTLX_EDITOR_METADATA),
+        'excluded_node_attributes': MTLX_EDITOR_METADATA,
+        'compact_json': True,
+        'float_precision': 6
+    }
+}
+
+def round_json_floats(value, precision):
+    '''
+    Round the floats in a JSON value.
+    @param value: The JSON value. Not modified.
+    @param precision: The number of decimal places to round to.
+    @return The rounded copy of the value.
+    '''
+    if isinstance(value, float):
+        # Adding zero turns negative zero into zero
+        return round(value, precision) + 0.0
+    if isinstance(value, dict):
+        return {key: round_json_floats(item, precision) for key, item in value.items()}
+    if isinstance(value, list):
+        return [round_json_floats(item, precision) for item in value]
+    return value
+
+@dataclasses.dataclass(frozen=True)
+class ConversionOptions():
+    '''
+    @brief Immutable set of options for a single conversion.
+
+    Options are passed to each conversion call, so a single converter can be shared
+    between threads with each call using different options. New options are created
+    from existing ones using replace().
+
+    **Attributes**
+    - add_asset_info : bool
+        - Option to add asset information during the conversion to MaterialX. Default is False.
+
+    - metadata : tuple of str
+        - MaterialX and / or 3rd party meta-data to transfer for inputs, outputs and nodes.
+
+    - graph_metadata : tuple of str
+        - MaterialX and / or 3rd party meta-data to transfer for node graphs.
+
+    - optimize : tuple of str
+        - Optimization passes to run on node graphs before export to glTF. See optimize.OPTIMIZE_PASSES.
+        Default is no passes.
+
+    - elide_defaults : bool
+        - Option to leave node input values which equal the node definition default implicit,
+        both when exporting to glTF and when importing to MaterialX. Default is False.
+
+    - excluded_node_attributes : tuple of str
+        - Node attributes which are not exported to glTF. Default is none.
+
+    - compact_json : bool
+        - Option to write glTF JSON without indentation or spaces. Default is False.
+
+    - float_precision : int
+        - Number of decimal places to round floats in glTF JSON to. Default is None meaning floats are not rounded.
+
+    - cost_weights : dict
+        - Cost of a node by category or node group, used to estimate the runtime cost of exported
+        procedurals. Default is None meaning cost.DEFAULT_COST_WEIGHTS.
+
+    - max_nodes : int
+        - Maximum number of nodes per exported procedural. Default is 0 meaning no limit.
+
+    - max_texture_fetches : int
+        - Maximum number of texture fetches per exported procedural. Default is 0 meaning no limit.
+
+    - max_cost : float
+        - Maximum estimated cost per exported procedural. Default is 0 meaning no limit.
+
+    - budget_action : str
+        - Action when a procedural exceeds a limit. 'warn' records a warning and 'fail' records an
+        error and fails the conversion. Default is 'warn'.
+
+    - bake_fallbacks : bool
+        - Option to bake the procedural output used by each material input into its fallback
+        texture when exporting to glTF. Requires NumPy. Default is False.
+
+    - bake_resolution : int
+        - Width and height of baked fallback textures. Default is bake.DEFAULT_BAKE_RESOLUTION.
+    '''
+    add_asset_info: bool = False
+    metadata: tuple = MTLX_SUPPORTED_METADATA
+    graph_metadata: tuple = MTLX_SUPPORTED_GRAPH_METADATA
+    optimize: tuple = ()
+    elide_defaults: bool = False
+    excluded_node_attributes: tuple = ()
+    compact_json: bool = False
+    float_precision: int = None
+    cost_weights: dict = None
+    max_nodes: int = 0
+    max_texture_fetches: int = 0
+    max_cost: float = 0.0
+    budget_action: str = MxGLTFPTCost.BUDGET_WARN
+    bake_fallbacks: bool = False
+    bake_resolution: int = MxGLTFPTBake.DEFAULT_BAKE_RESOLUTION
+
+    def replace(self, **changes):
+        '''
+        Create a copy of the options with some values changed.
+        @param changes: The option values to change, specified as keyword arguments.
+        @return The new options.
+        '''
+        for key in ['metadata', 'graph_metadata', 'optimize', 'excluded_node_attributes']:
+            if key in changes:
+                changes[key] = tuple(changes[key])
+        return dataclasses.replace(self, **changes)
+
+    def with_profile(self, profile):
+        '''
+        Create a copy of the options with the values of a named export profile.
+        @param profile: The profile name. See EXPORT_PROFILES.
+        @return The new options.
+        @throws ValueError if the profile is not known.
+        '''
+        if profile not in EXPORT_PROFILES:
+            raise ValueError(f'Unknown export profile: {profile}')
+        return self.replace(**EXPORT_PROFILES[profile])
+
+class ConversionFilter():
+    '''
+    @brief Class for selecting the materials, shaders and node graphs to convert by name or glob pattern.
+
+    Node graphs which are referenced by a selected shader are converted unless explicitly excluded.
+    Node graphs which are not referenced by any material are only converted if no include patterns 
+    are specified, or if they match a node graph include pattern.
+
+    Once any include pattern is specified, materials and shaders are only selected by their own
+    include patterns. Shaders without include patterns are selected through a selected material,
+    and materials without include patterns are only traversed to find selected shaders.
+    A node graph only selection therefore converts no materials.
+    '''
+
+    def __init__(self, materials=None, shaders=None, nodegraphs=None,
+                 exclude_materials=None, exclude_shaders=None, exclude_nodegraphs=None):
+        '''
+        Constructor
+        @param materials: List of material names or glob patterns to include. Default is None meaning all,
+        unless other include patterns are specified.
+        @param shaders: List of shader names or glob patterns to include. Default is None meaning all,
+        unless other include patterns are specified.
+        @param nodegraphs: List of node graph names or glob patterns to include. Default is None meaning all.
+        @param exclude_materials: List of material names or glob patterns to exclude. Default is None.
+        @param exclude_shaders: List of shader names or glob patterns to exclude. Default is None.
+        @param exclude_nodegraphs: List of node graph names or glob patterns to exclude. Default is None.
+        '''
+        self.materials = list(materials or [])
+        self.shaders = list(shaders or [])
+        self.nodegraphs = list(nodegraphs or [])
+        self.exclude_materials = list(exclude_materials or [])
+        self.exclude_shaders = list(exclude_shaders or [])
+        self.exclude_nodegraphs = list(exclude_nodegraphs or [])
+
+    def is_empty(self):
+        '''
+        Check if the filter selects everything.
+        @return True if no include or exclude patterns are specified.
+        '''
+        return not (self.materials or self.shaders or self.nodegraphs or 
+                    self.exclude_materials or self.exclude_shaders or self.exclude_nodegraphs)
+
+    def has_includes(self):
+        '''
+        Check if any include patterns are specified.
+        @return True if include patterns are specified.
+        '''
+        return bool(self.materials or self.shaders or self.nodegraphs)
+
+    def match(self, name, patterns):
+        '''
+        Check if a name matches any of a list of names or glob patterns.
+        @param name: The name to check.
+        @param patterns: The list of names or glob patterns.
+        @return True if the name matches.
+        '''
+        return any(name == pattern or fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+    def accept(self, name, includes, excludes):
+        '''
+        Check if a name passes a set of include and exclude patterns.
+        @param name: The name to check.
+        @param includes: The include patterns. An empty list includes all names.
+        @param excludes: The exclude patterns.
+        @return True if the name is accepted.
+        '''
+        if includes and not self.match(name, includes):
+            return False
+        return not self.match(name, excludes)
+
+    def accept_material(self, name):
+        '''
+        Check if a material should be converted, or traversed to find selected shaders.
+        @param name: The material name.
+        @return True if the material is accepted.
+        '''
+        if self.match(name, self.exclude_materials):
+            return False
+        if self.materials:
+            return self.match(name, self.materials)
+        return not self.has_includes() or bool(self.shaders)
+
+    def accept_shader(self, name, material=None):
+        '''
+        Check if a shader should be converted.
+        @param name: The shader name.
+        @param material: The name of the material the shader belongs to. Default is None.
+        @return True if the shader is accepted.
+        '''
+        if self.match(name, self.exclude_shaders):
+            return False
+        if self.shaders:
+            return self.match(name, self.shaders)
+        if not self.has_includes():
+            return True
+        return material is not None and self.match(material, self.materials)
+
+    def accept_nodegraph(self, name, referenced):
+        '''
+        Check if a node graph should be converted.
+        @param name: The node graph name.
+        @param referenced: True if the node graph is referenced by a selected shader.
+        @return True if the node graph is accepted.
+        '''
+        if self.match(name, self.exclude_nodegraphs):
+            return False
+        if referenced:
+            return True
+        if self.has_includes():
+            return self.match(name, self.nodegraphs)
+        return True
+
+    def accept_unconnected_nodegraphs(self):
+        '''
+        Check if node graphs which are not referenced by a material can be selected at all.
+        @return True if unreferenced node graphs may be converted.
+        '''
+        return not self.has_includes() or bool(self.nodegraphs)
+
+    def find_nodegraphs(self, doc):
+        '''
+        Find the node graphs of a document matching the node graph include patterns. Graphs
+        named exactly are looked up by name, and only glob patterns are matched against every graph.
+        @param doc: The MaterialX document.
+        @return The list of matching node graphs, or all node graphs if there are no include patterns.
+        '''
+        if not self.has_includes():
+            return doc.getNodeGraphs()
+        if any(char in pattern for pattern in self.nodegraphs for char in '*?['):
+            return [graph for graph in doc.getNodeGraphs() if self.match(graph.getName(), self.nodegraphs)]
+        graphs = []
+        for pattern in self.nodegraphs:
+            graph = doc.getNodeGraph(pattern)
+            if graph and graph not in graphs:
+                graphs.append(graph)
+        return graphs
+
+class glTFNameTable():
+    '''
+    @brief Class for storing the names generated for glTF items during conversion to MaterialX.
+
+    By default names are kept in a side table so that the glTF document being converted is 
+    not modified. This allows a parsed glTF document to be cached and shared between
+    conversions, including conversions running on different threads. The table holds a 
+    reference to each named item, so it must not outlive the conversion it is used for.
+    '''
+
+    def __init__(self, in_place=False):
+        '''
+        Constructor
+        @param in_place: Write names directly into the glTF items instead of the side table. Default is False.
+        '''
+        self.in_place = in_place
+        self.names = {}
+
+    def set_name(self, item, name):
+        '''
+        Set the name for a glTF item.
+        @param item: The glTF item (procedural, node, input, output or material).
+        @param name: The name to set.
+        '''
+        if self.in_place:
+            item[KHR_TEXTURE_PROCEDURALS_NAME] = name
+        else:
+            self.names[id(item)] = (item, name)
+
+    def get_name(self, item, default=None):
+        '''
+        Get the name for a glTF item. If no name has been set, the name stored on the item is returned.
+        @param item: The glTF item.
+        @param default: The value to return if the item has no name.
+        @return The name of the item.
+        '''
+        entry = self.names.get(id(item))
+        if entry is not None:
+            return entry[1]
+        return item.get(KHR_TEXTURE_PROCEDURALS_NAME, default)
+
 class glTFMaterialXConverter():
     '''
     @brief Class for converting to convert between glTF Texture Procedurals content and MaterialX
+
+    **Thread safety**
+
+    Conversion methods do not modify any converter state, and take an optional 
+    ConversionOptions argument which overrides the converter's default options for that call.
+    A single converter can therefore be shared by a thread pool, with the following calls 
+    being safe to run concurrently: materialX_to_glTF(), materialX_to_glTF_data(), 
+    materialX_to_glTF_per_material(), materialX_documents_to_glTF(), glTF_to_materialX() and
+    gltf_string_to_materialX(). Each thread must use its own MaterialX documents, though
+    glTF documents passed to glTF_to_materialX() are not modified and can be shared.
+    The cache of baked fallback textures is the only state shared by these calls, and it is locked.
+
+    **Diagnostics**
+
+    Conversion calls take an optional diagnostics.Diagnostics collector which records 
+    structured events (severity, code, element path and message). Messages are only formatted 
+    when requested, and nothing is logged unless the collector is given a logger.
+    A collector should not be shared between concurrent calls.
+
+    The following calls are not safe to run concurrently with conversions:
+    - set_options(), set_metadata(), set_add_asset_info() and set_debug(), which change the defaults.
+    - glTF_graph_create_names() and glTF_graph_to_materialX() without a name table, which modify the glTF document.
+    - glTFBundleBuilder, which accumulates state and must be used by one thread at a time.
     '''
 
-    def __init__(self):
+    def __init__(self, options=None):
         '''
         Constructor
+        @param options: The default ConversionOptions to use when none are passed to a conversion call.
 
         **Attributes**
         - logger : logging.Logger
-            - Logger instance for the class, used to log information, warnings, and errors.
+            - Logger instance for the class, used to log information, warnings, and errors. 
+            Logging configuration is left to the application.
 
-        - add_asset_info : bool
-            - Option to add asset information during the conversion to MaterialX.
+        - options : ConversionOptions
+            - The default options for conversions.
                 
         - supported_types : list of str
             - List of supported data types. This is fixed to MaterialX 1.39
@@ -196,29 +590,55 @@ class glTFMaterialXConverter():
         - array_types : list of str
             - List of supported array types. This is fixed to MaterialX 1.39.x
 
-        - metadata : list of str
-            - MaterialX and / or 3rd party meta-data to transfer to gltf. Default is MaterialX based metadata for 1.39
+        - fallback_baker : bake.FallbackBaker
+            - Baker of fallback textures, caching baked textures across conversions.
+
+        - library_folders : list of str
+            - Folders holding the standard MaterialX data libraries. Node definitions read from
+            anywhere else are custom definitions, which are exported with the procedurals using them.
         '''
         self.logger = lg.getLogger('glTFMtlx')
-        lg.basicConfig(level=lg.INFO)  
 
-        # Options for conversion to MaterialX
-        self.add_asset_info = False
+        # Default options for conversion
+        self.options = options if options else ConversionOptions()
 
         # Options for conversion from Materialx
         self.supported_types = ['boolean', 'string', 'integer', 'matrix33', 'matrix44', 'vector2', 'vector3', 'vector4', 'float', 'color3', 'color4']
         self.supported_scalar_types = ['integer', 'matrix33', 'matrix44', 'vector2', 'vector3', 'vector4', 'float', 'color3', 'color4']
         self.supported_array_types = ['matrix33', 'matrix44', 'vector2', 'vector3', 'vector4', 'color3', 'color4']
-        self.standard_ui_metadata = ['xpos', 'ypos', 'width', 'height', 'uicolor']
-        self.supported_metadata = ['colorspace', 'unit', 'unittype', 
-                                   'uiname', 'uimin', 'uimax', 'uisoftmin', 'uisoftmax', 'uistep', 'uifolder', 'uiadvanced', 'uivisible',
-                                   'defaultgeomprop', 'uniform', 
-                                   'doc'] + self.standard_ui_metadata
-        self.supported_graph_metadata = ['colorspace', 'unit', 'unittype', 'uiname', 'doc'] + self.standard_ui_metadata
+        self.standard_ui_metadata = list(MTLX_STANDARD_UI_METADATA)
+        self.fallback_baker = MxGLTFPTBake.FallbackBaker()
+        self.library_folders = [os.path.join(os.path.abspath(path), folder)
+                                for path in mx.getDefaultDataSearchPath().asString().split(mx.PATH_LIST_SEPARATOR) if path
+                                for folder in mx.getDefaultDataLibraryFolders()]
+
+    def set_options(self, options):
+        '''
+        Set the default options used when no options are passed to a conversion call.
+        @param options: The ConversionOptions to use.
+        '''
+        self.options = options
+
+    def get_options(self, options=None):
+        '''
+        Get the options to use for a conversion call.
+        @param options: The options passed to the call. Can be None.
+        @return The options passed in if specified, otherwise the default options.
+        '''
+        return options if options else self.options
+
+    def get_diagnostics(self, diagnostics=None):
+        '''
+        Get the diagnostics collector to use for a conversion call.
+        @param diagnostics: The collector passed to the call. Can be None.
+        @return The collector passed in if specified, otherwise a new collector whose events are discarded.
+        '''
+        return diagnostics if diagnostics is not None else MxGLTFPTDiag.Diagnostics(MxGLTFPTDiag.WARNING)
 
     def set_debug(self, debug):
         '''
-        Set the debug flag for the converter.
+        Set the debug flag for the converter. Note that this sets the level of the
+        logger shared by all converters.
         @param debug: The debug flag.
         '''
         if debug:
@@ -235,24 +655,26 @@ class glTFMaterialXConverter():
 
     def set_metadata(self, metadata):
         '''
-        Set the supported metadata for the converter.
+        Set the supported metadata for the converter's default options.
         @param metadata: The metadata to set.
         '''
-        self.supported_metadata = metadata
+        self.options = self.options.replace(metadata=metadata)
 
-    def get_metadata(self):
+    def get_metadata(self, options=None):
         '''
         Get the supported metadata for the converter.
+        @param options: Optional options to get the metadata from. Default is None meaning the default options.
         @return The metadata.
         '''
-        return self.supported_metadata
+        return list(self.get_options(options).metadata)
     
-    def get_graph_metadata(self):
+    def get_graph_metadata(self, options=None):
         '''
         Get the supported graph metadata for the converter.
+        @param options: Optional options to get the metadata from. Default is None meaning the default options.
         @return The metadata.
         '''
-        return self.supported_graph_metadata
+        return list(self.get_options(options).graph_metadata)
 
     def get_supported_target_type(self):
         '''
@@ -335,7 +757,7 @@ class glTFMaterialXConverter():
         if fallback_image_index == -1:
             image = {
                 KHR_IMAGE_URI: fallback,
-                KHR_TEXTURE_PROCEDURALS_NAME: 'KHR_texture_procedural_fallback'
+                KHR_TEXTURE_PROCEDURALS_NAME: KHR_TEXTURE_PROCEDURALS_FALLBACK_NAME
             }
             images_block.append(image)
             fallback_image_index = len(images_block) - 1
@@ -355,19 +777,24 @@ class glTFMaterialXConverter():
     
         return fallback_texture_index
 
-    def materialX_graph_to_glTF(self, graph, json):
+    def materialX_graph_to_glTF(self, graph, json, options=None, diagnostics=None):
         '''
-        Export a MaterialX nodegraph to a glTF procedural graph.
+        Export a MaterialX nodegraph to a glTF procedural graph. The optimization passes
+        specified in the options decide which nodes and inputs are exported. A functional graph
+        is exported to the procedural definitions as the implementation of its node definition,
+        which must already be exported. See add_procedural_definition().
         @param graph: The MaterialX nodegraph to export.
         @param json: The JSON object to export the procedural graph to.
-        meaning to export all materials.
+        @param options: Optional ConversionOptions. Default is None meaning the converter's default options.
+        @param diagnostics: Optional Diagnostics collector to record events in. Default is None.
         @return The procedural graph JSON object if successful, otherwise None.
         '''
         no_result = [None, None, None]
+        diagnostics = self.get_diagnostics(diagnostics)
 
         graph_outputs = graph.getOutputs()
         if len(graph_outputs) == 0:
-            self.logger.info(f'> No graph outputs found on graph: {graph.getNamePath()}')
+            diagnostics.info('no_graph_outputs', graph, 'No graph outputs found on graph')
             return no_result
 
         debug = False
@@ -396,40 +823,56 @@ class glTFMaterialXConverter():
         if KHR_TEXTURE_PROCEDURALS not in extensions:
             extensions[KHR_TEXTURE_PROCEDURALS] = KHR_texture_procedurals
 
-        if KHR_TEXTURE_PROCEDURALS_PROCEDURALS_BLOCK not in KHR_texture_procedurals:
-            KHR_texture_procedurals[KHR_TEXTURE_PROCEDURALS_PROCEDURALS_BLOCK] = []
+        # Functional graphs are added to the definitions and use the definition inputs as their interface
+        graph_nodedef = graph.getNodeDef() if graph.hasNodeDefString() else None
+        block = KHR_TEXTURE_PROCEDURALS_DEFINITIONS_BLOCK if graph_nodedef else KHR_TEXTURE_PROCEDURALS_PROCEDURALS_BLOCK
+        if block not in KHR_texture_procedurals:
+            KHR_texture_procedurals[block] = []
+
+        procs = KHR_texture_procedurals[block]
+
+        # Nodes and inputs to export after optimization
+        plan = MxGLTFPTOptimize.create_export_plan(graph, self.get_options(options).optimize, diagnostics)
+        elide_defaults = self.get_options(options).elide_defaults
+        excluded_node_attributes = self.get_options(options).excluded_node_attributes
+        elided = 0
 
-        procs = KHR_texture_procedurals[KHR_TEXTURE_PROCEDURALS_PROCEDURALS_BLOCK]
         nodegraph = {
             'name': graph.getNamePath() if use_paths else graph.getName(),
             'nodetype': graph.getCategory()
         }
 
         nodegraph[KHR_TEXTURE_PROCEDURALS_TYPE] = MULTI_OUTPUT_TYPE_STRING if len(graph_outputs) > 1 else graph_outputs[0].getType()
-        nodegraph[KHR_TEXTURE_PROCEDURALS_INPUTS_BLOCK] = {}
+        if graph_nodedef:
+            nodegraph[KHR_TEXTURE_PROCEDURALS_NODEDEF] = self.get_procedural_definition_index(procs, graph_nodedef.getName())
+            for input in graph_nodedef.getActiveInputs():
+                nodegraph_inputs[input.getNamePath()] = input.getName()
+        else:
+            nodegraph[KHR_TEXTURE_PROCEDURALS_INPUTS_BLOCK] = {}
         nodegraph[KHR_TEXTURE_PROCEDURALS_OUTPUTS_BLOCK] = {}
         nodegraph[KHR_TEXTURE_PROCEDURALS_NODES_BLOCK] = []
         procs.append(nodegraph)
 
-        metadata = self.get_metadata()
+        metadata = self.get_metadata(options)
 
         # Set nodegraph metadata
-        graph_metadata = self.get_graph_metadata()
+        graph_metadata = self.get_graph_metadata(options)
         for meta in graph_metadata:
             if graph.getAttribute(meta):
                 nodegraph[meta] = graph.getAttribute(meta)
 
         # Add nodes to to dictonary. Use path as this is globally unique
         #
-        for node in graph.getNodes():
+        for node in plan.nodes:
             json_node = {'name': node.getNamePath() if use_paths else node.getName()}
             nodegraph[KHR_TEXTURE_PROCEDURALS_NODES_BLOCK].append(json_node)
             nodegraph_nodes[node.getNamePath()] = len(nodegraph[KHR_TEXTURE_PROCEDURALS_NODES_BLOCK]) - 1
 
-        # Add inputs to the graph
+        # Add inputs to the graph, followed by node input values promoted to the interface by optimization
         #
-        for input in graph.getInputs():
-            input_name = input.getNamePath() if use_paths else input.getName()
+        graph_inputs = [(input.getNamePath() if use_paths else input.getName(), input) for input in plan.inputs]
+        graph_inputs.extend(plan.promoted_inputs.items())
+        for input_name, input in graph_inputs:
             json_node = {
                 'nodetype': input.getCategory()
             }
@@ -458,7 +901,7 @@ class glTFMaterialXConverter():
                 # Add input to dictionary
                 nodegraph_inputs[input.getNamePath()] = input_name
             else:
-                self.logger.error(f'> No value or invalid connection specified for input. Input skipped: {input.getNamePath()}')
+                diagnostics.error('invalid_input', input, 'No value or invalid connection specified for input. Input skipped')
 
         # Add outputs to the graph
         #
@@ -477,10 +920,11 @@ class glTFMaterialXConverter():
                 # Add connection if any. Only interfacename and nodename
                 # are supported.
                 connection = output.getAttribute(MTLX_INTERFACEINPUT_NAME_ATTRIBUTE)
-                if len(connection) == 0:
+                if len(connection) > 0:
+                    connection_node = plan.get_interface(connection)
+                else:
                     connection = output.getAttribute(MTLX_NODE_NAME_ATTRIBUTE)
-
-                connection_node = graph.getChild(connection)
+                    connection_node = plan.resolve(graph.getChild(connection))
                 if connection_node:
                     connection_path = connection_node.getNamePath()
                     if debug:
@@ -492,7 +936,7 @@ class glTFMaterialXConverter():
                     elif nodegraph_nodes.get(connection_path) is not None:
                         json_node[KHR_TEXTURE_PROCEDURALS_NODE] = nodegraph_nodes[connection_path]
                     else:
-                        self.logger.error(f'> Invalid output connection to: {connection_path}')
+                        diagnostics.error('invalid_output_connection', output, 'Invalid output connection to: %s', connection_path)
 
                     # Add output qualifier if any
                     output_string = output.getAttribute(MTLX_OUTPUT_ATTRIBUTE)
@@ -505,26 +949,37 @@ class glTFMaterialXConverter():
                 nodegraph_outputs[output.getNamePath()] = output_name
 
         # Add nodes to the graph
-        for node in graph.getNodes():
+        for node in plan.nodes:
             json_node = nodegraph[KHR_TEXTURE_PROCEDURALS_NODES_BLOCK][nodegraph_nodes[node.getNamePath()]]
             json_node[KHR_TEXTURE_PROCEDURALS_NODETYPE] = node.getCategory()
             nodedef = node.getNodeDef()
 
             # Skip unsupported nodes
             if not nodedef:
-                self.logger.error(f'> Missing nodedef for node: {node.getNamePath()}')
+                diagnostics.error('missing_nodedef', node, 'Missing nodedef for node')
                 continue
 
             if debug and nodedef and nodedef.getNodeGroup():
                 json_node[KHR_TEXTURE_PROCEDURALS_NODEGROUP] = nodedef.getNodeGroup()
 
+            # Custom nodes reference a definition exported once for all its uses
+            if self.is_custom_definition(nodedef):
+                self.add_procedural_definition(nodedef, json, options, diagnostics)
+
             for attr_name in node.getAttributeNames():
-                json_node[attr_name] = node.getAttribute(attr_name)
+                if attr_name not in excluded_node_attributes:
+                    json_node[attr_name] = node.getAttribute(attr_name)
 
             # Add node inputs
             #
             inputs = {}
             for input in node.getInputs():
+                # Leave values which equal the definition default implicit, unless promoted to the interface
+                promoted_name = plan.promoted.get(input.getNamePath())
+                if elide_defaults and promoted_name is None and MxGLTFPTOptimize.is_default_value(input, nodedef):
+                    elided += 1
+                    continue
+
                 input_name = input.getNamePath() if use_paths else input.getName()
                 input_item = {
                     'nodetype': 'input'
@@ -545,8 +1000,16 @@ class glTFMaterialXConverter():
                     is_interface = False
                     connection = input.getAttribute(MTLX_NODE_NAME_ATTRIBUTE)
 
-                if connection:
-                    connection_node = graph.getChild(connection)
+                # Value replaced by an interface input, or connection replaced by a value by optimization
+                folded_value = plan.values.get(input.getNamePath())
+                if promoted_name is not None:
+                    input_item[KHR_TEXTURE_PROCEDURALS_INPUT] = promoted_name
+
+                elif folded_value is not None:
+                    input_item[KHR_TEXTURE_PROCEDURALS_VALUE] = self.string_to_scalar(folded_value, input_type)
+
+                elif connection:
+                    connection_node = plan.get_interface(connection) if is_interface else plan.resolve(graph.getChild(connection))
                     if connection_node:
                         connection_path = connection_node.getNamePath()
                         if debug:
@@ -566,9 +1029,7 @@ class glTFMaterialXConverter():
                             #        input_item[KHR_TEXTURE_PROCEDURALS_OUTPUT] = i
                             #        break
                     else:
-                        self.logger.error(f'> Invalid input connection to: '
-                                            '{connection} from input: {input.getNamePath()} '
-                                            'node: {node.getNamePath()}')
+                        diagnostics.error('invalid_input_connection', input, 'Invalid input connection to: %s', connection)
 
                 # Node input value if any
                 elif input.getValue() is not None:
@@ -609,30 +1070,232 @@ class glTFMaterialXConverter():
                         }
                         outputs[output.getName()] = output_item
             else:
-                self.logger.warning(f'> Missing nodedef for node: {node.getNamePath()}')
+                diagnostics.warning('missing_nodedef', node, 'Missing nodedef for node')
 
             # Add to node outputs list
             if outputs:
                 json_node[KHR_TEXTURE_PROCEDURALS_OUTPUTS_BLOCK] = outputs
 
+        if elided:
+            diagnostics.info('elide_defaults', graph, 'Left %d default input values implicit', elided)
+
         return [procs, nodegraph_outputs, nodegraph_nodes]
 
-    def materialX_to_glTF(self, mtlx_doc):
+    def is_custom_definition(self, nodedef):
+        '''
+        Check if a node definition is a custom definition, rather than one from the standard
+        MaterialX data libraries. Definitions in the document or read from any other location are custom.
+        @param nodedef: The MaterialX node definition.
+        @return True if the definition is custom.
+        '''
+        uri = nodedef.getActiveSourceUri()
+        if not uri:
+            return True
+        uri = os.path.abspath(uri)
+        return not any(uri.startswith(folder + os.sep) for folder in self.library_folders)
+
+    def get_procedural_definition_index(self, definitions, name):
+        '''
+        Find a node definition in a list of glTF procedural definitions.
+        @param definitions: The glTF procedural definitions.
+        @param name: The name of the node definition.
+        @return The index of the definition, or -1 if not found.
+        '''
+        for index, definition in enumerate(definitions):
+            if definition.get(KHR_TEXTURE_PROCEDURALS_NODETYPE) == KHR_TEXTURE_PROCEDURALS_NODEDEF and \
+               definition.get(KHR_TEXTURE_PROCEDURALS_NAME) == name:
+                return index
+        return -1
+
+    def add_procedural_definition(self, nodedef, json, options=None, diagnostics=None):
+        '''
+        Export a custom node definition and its node graph implementation to the procedural definitions
+        of a glTF JSON object, unless it was already exported. Nodes using the definition reference it
+        by node type, so the implementation is written once however many nodes use it.
+        @param nodedef: The MaterialX node definition.
+        @param json: The JSON object to export the definition to.
+        @param options: Optional ConversionOptions. Default is None meaning the converter's default options.
+        @param diagnostics: Optional Diagnostics collector to record events in. Default is None.
+        @return The index of the definition in the procedural definitions, or -1 if the definition
+        is not implemented by a node graph.
+        '''
+        diagnostics = self.get_diagnostics(diagnostics)
+        KHR_texture_procedurals = json.setdefault(KHR_EXTENSIONS_BLOCK, {}).setdefault(KHR_TEXTURE_PROCEDURALS, {})
+        definitions = KHR_texture_procedurals.setdefault(KHR_TEXTURE_PROCEDURALS_DEFINITIONS_BLOCK, [])
+        index = self.get_procedural_definition_index(definitions, nodedef.getName())
+        if index >= 0:
+            return index
+
+        implementation = nodedef.getImplementation()
+        if not implementation or not implementation.isA(mx.NodeGraph):
+            diagnostics.warning('unsupported_definition', nodedef, 'Node definition is not implemented by a node graph. Definition not exported')
+            return -1
+
+        images_block = json.setdefault(KHR_IMAGES_BLOCK, [])
+        texture_array = json.setdefault(KHR_TEXTURES_BLOCK, [])
+        metadata = self.get_metadata(options)
+
+        outputs = nodedef.getActiveOutputs()
+        definition = {
+            KHR_TEXTURE_PROCEDURALS_NAME: nodedef.getName(),
+            KHR_TEXTURE_PROCEDURALS_NODETYPE: KHR_TEXTURE_PROCEDURALS_NODEDEF,
+            KHR_TEXTURE_PROCEDURALS_TYPE: MULTI_OUTPUT_TYPE_STRING if len(outputs) > 1 else outputs[0].getType(),
+            KHR_TEXTURE_PROCEDURALS_NODE: nodedef.getNodeString()
+        }
+        if nodedef.hasNodeGroup():
+            definition[KHR_TEXTURE_PROCEDURALS_NODEGROUP] = nodedef.getNodeGroup()
+        if nodedef.hasVersionString():
+            definition['version'] = nodedef.getVersionString()
+            definition['isdefaultversion'] = nodedef.getDefaultVersion()
+        for meta in self.get_graph_metadata(options):
+            if nodedef.getAttribute(meta):
+                definition[meta] = nodedef.getAttribute(meta)
+
+        # Add the definition inputs with their default values
+        inputs = {}
+        for input in nodedef.getActiveInputs():
+            input_type = input.getType()
+            input_item = {
+                'nodetype': input.getCategory(),
+                KHR_TEXTURE_PROCEDURALS_TYPE: input_type
+            }
+            for meta in metadata:
+                if input.getAttribute(meta):
+                    input_item[meta] = input.getAttribute(meta)
+            if input.getIsUniform():
+                input_item['uniform'] = True
+
+            if input.hasDefaultGeomPropString():
+                input_item['defaultgeomprop'] = input.getDefaultGeomPropString()
+            elif input_type == mx.FILENAME_TYPE_STRING and input.getValueString():
+                texture = {}
+                self.initialize_glTF_texture(texture, input.getNamePath(), input.getResolvedValueString(), images_block)
+                texture_array.append(texture)
+                input_item[KHR_TEXTURE_PROCEDURALS_TEXTURE] = len(texture_array) - 1
+            elif input.getValue() is not None:
+                input_item[KHR_TEXTURE_PROCEDURALS_VALUE] = self.string_to_scalar(input.getValueString(), input_type)
+            inputs[input.getName()] = input_item
+        definition[KHR_TEXTURE_PROCEDURALS_INPUTS_BLOCK] = inputs
+
+        definition[KHR_TEXTURE_PROCEDURALS_OUTPUTS_BLOCK] = {
+            output.getName(): {
+                'nodetype': KHR_TEXTURE_PROCEDURALS_OUTPUT,
+                KHR_TEXTURE_PROCEDURALS_TYPE: output.getType()
+            } for output in outputs
+        }
+
+        # Add the definition before its implementation so that nested uses of the definition find it
+        definitions.append(definition)
+        index = len(definitions) - 1
+        diagnostics.info('export_definition', nodedef, 'Export node definition. Implementation: %s', implementation.getName())
+        with MxGLTFPTTrace.span('materialX_graph_to_glTF', graph=implementation.getName()):
+            self.materialX_graph_to_glTF(implementation, json, options, diagnostics)
+        return index
+
+    def materialX_to_glTF(self, mtlx_doc, selection=None, options=None, diagnostics=None):
         '''
         @brief Convert a MaterialX document to glTF.
         @param mtlx_doc: The MaterialX document to convert.
+        @param selection: Optional ConversionFilter used to select what to convert. Default is None.
+        @param options: Optional ConversionOptions. Default is None meaning the converter's default options.
+        @param diagnostics: Optional Diagnostics collector to record events in. Default is None.
         @return glTF JSON string and status message.
         '''
+        json_data, status = self.materialX_to_glTF_data(mtlx_doc, selection=selection, options=options, diagnostics=diagnostics)
+        if json_data is None:
+            return None, status
+
+        # Get the JSON string back
+        json_string = self.glTF_data_to_string(json_data, options)
+        if json_string == '{}':
+            json_string = ''
+        return json_string, status
+
+    def glTF_data_to_string(self, json_data, options=None):
+        '''
+        @brief Write a glTF JSON object as a string, using the formatting of the options.
+        @param json_data: The glTF JSON object.
+        @param options: Optional ConversionOptions. Default is None meaning the converter's default options.
+        @return The JSON string. The string is empty if the object is empty.
+        '''
+        if not json_data:
+            return ''
+        options = self.get_options(options)
+        if options.float_precision is not None:
+            json_data = round_json_floats(json_data, options.float_precision)
+        if options.compact_json:
+            return json.dumps(json_data, separators=(',', ':'))
+        return json.dumps(json_data, indent=2)
+
+    def materialX_documents_to_glTF(self, mtlx_docs, share_graphs=False, selection=None, options=None, diagnostics=None):
+        '''
+        @brief Convert a list of MaterialX documents to a single glTF document.
+        @param mtlx_docs: The MaterialX documents to convert.
+        @param share_graphs: Share structurally identical procedural graphs. Default is False.
+        @param selection: Optional ConversionFilter used to select what to convert. Default is None.
+        @param options: Optional ConversionOptions. Default is None meaning the converter's default options.
+        @param diagnostics: Optional Diagnostics collector to record events in. Default is None.
+        @return glTF JSON string and list of status messages, one per document.
+        '''
+        bundle = glTFBundleBuilder(self, share_graphs, selection, options, diagnostics)
+        status = []
+        for mtlx_doc in mtlx_docs:
+            status.append(bundle.add_document(mtlx_doc))
+        return bundle.get_glTF_string(), status
+
+    def materialX_to_glTF_per_material(self, mtlx_doc, selection=None, options=None, diagnostics=None):
+        '''
+        @brief Convert a MaterialX document to one glTF document per material.
+        Each glTF document is self-contained and only includes the procedural graphs,
+        textures and images referenced by the material. Unconnected graphs are not exported.
+        @param mtlx_doc: The MaterialX document to convert.
+        @param selection: Optional ConversionFilter used to select what to convert. Default is None.
+        @param options: Optional ConversionOptions. Default is None meaning the converter's default options.
+        @param diagnostics: Optional Diagnostics collector to record events in. Default is None.
+        @return List of [material name, glTF JSON string, status message] items, one per material.
+        '''
+        results = []
+        if not mtlx_doc:
+            return results
+
+        for mx_material in mtlx_doc.getMaterialNodes():
+            if selection and not selection.accept_material(mx_material.getName()):
+                continue
+            json_data, status = self.materialX_to_glTF_data(mtlx_doc, [mx_material], False, selection, options, diagnostics)
+            json_string = self.glTF_data_to_string(json_data, options)
+            results.append([mx_material.getName(), json_string, status])
+        return results
+
+    def materialX_to_glTF_data(self, mtlx_doc, mx_materials=None, export_unconnected=True, selection=None, options=None, diagnostics=None):
+        '''
+        @brief Convert a MaterialX document to a glTF JSON object.
+        @param mtlx_doc: The MaterialX document to convert.
+        @param mx_materials: The material nodes to convert. The default is None meaning to convert all materials.
+        @param export_unconnected: Export graphs which are not connected to a material. The default is True.
+        @param selection: Optional ConversionFilter used to select what to convert. Materials, shaders 
+        and graphs which are not selected are not converted. Default is None.
+        @param options: Optional ConversionOptions. Default is None meaning the converter's default options.
+        @param diagnostics: Optional Diagnostics collector to record events in. Default is None.
+        @return glTF JSON object and status message. The JSON object is empty if
+        no procedural graphs were converted, and None if the document is invalid.
+        '''
 
         status = ''
+        diagnostics = self.get_diagnostics(diagnostics)
         if not mtlx_doc:
             status = 'Invalid document to convert'
             return None, status
 
+        if selection and selection.is_empty():
+            selection = None
+
         materials = []
-        mx_materials = mtlx_doc.getMaterialNodes()
+        if mx_materials is None:
+            mx_materials = mtlx_doc.getMaterialNodes()
+            if selection:
+                mx_materials = [m for m in mx_materials if selection.accept_material(m.getName())]
         if len(mx_materials) == 0:
-            self.logger.warning('> No materials found in document')
+            diagnostics.warning('no_materials', None, 'No materials found in document')
             #return None, status # No MaterialX materials found in the document
 
         json_data = {}
@@ -676,12 +1339,15 @@ class glTFMaterialXConverter():
                 is_pbr = (category == MTLX_GLTF_PBR_CATEGORY)
                 is_unlit = (category == MTLX_UNLIT_CATEGORY_STRING)
 
+                if selection and not selection.accept_shader(shader_node.getName(), mxMaterial.getName()):
+                    continue
+
                 if (is_pbr or is_unlit) and pbr_nodes.get(path) is None:
                     # Add fallback if not already added
                     if fallback_texture_index == -1:
                         fallback_texture_index = self.add_fallback_texture(json_data, fallback_image_data)
 
-                    self.logger.info(f'> Convert shader to glTF: {shader_node.getNamePath()}. Category: {category}')
+                    diagnostics.info('convert_shader', path, 'Convert shader to glTF. Category: %s', category)
                     pbr_nodes[path] = shader_node
 
                     material = {}
@@ -710,6 +1376,8 @@ class glTFMaterialXConverter():
                         nodegraph_name = shader_node_input.getNodeGraphString()
                         if len(nodegraph_name) == 0:
                             continue
+                        if selection and not selection.accept_nodegraph(nodegraph_name, True):
+                            continue
 
                         # Check for upstream nodegraph output connection.
                         nodegraph_output = shader_node_input.getOutputString()
@@ -757,7 +1425,8 @@ class glTFMaterialXConverter():
                             graph = mtlx_doc.getNodeGraph(nodegraph_name)
                             export_graph_names.append(nodegraph_name)
 
-                            gltf_info = self.materialX_graph_to_glTF(graph, json_data)
+                            with MxGLTFPTTrace.span('materialX_graph_to_glTF', graph=nodegraph_name):
+                                gltf_info = self.materialX_graph_to_glTF(graph, json_data, options, diagnostics)
                             procs = gltf_info[0]
                             output_nodes = gltf_info[1]
 
@@ -776,8 +1445,7 @@ class glTFMaterialXConverter():
                                     output_name = output_nodes[nodegraph_outputPath]
                                     lookup[KHR_TEXTURE_PROCEDURALS_OUTPUT] = output_name
                                 else:
-                                    self.logger.error(f'> Failed to find output: {nodegraph_output} '
-                                                      ' in: {output_nodes}')
+                                    diagnostics.error('missing_graph_output', nodegraph_outputPath, 'Failed to find output: %s in: %s', nodegraph_output, output_nodes)
                             else:
                                 # Set to first key in output_nodes
                                 lookup[KHR_TEXTURE_PROCEDURALS_OUTPUT] = next(iter(output_nodes.values()))
@@ -787,16 +1455,28 @@ class glTFMaterialXConverter():
 
         # Scan for unconnected graphs
         unconnected_graphs = []
-        for ng in mtlx_doc.getNodeGraphs():
+        if selection and not selection.accept_unconnected_nodegraphs():
+            export_unconnected = False
+        candidate_graphs = []
+        if export_unconnected:
+            candidate_graphs = selection.find_nodegraphs(mtlx_doc) if selection else mtlx_doc.getNodeGraphs()
+        for ng in candidate_graphs:
             ng_name = ng.getName()
+            if selection and not selection.accept_nodegraph(ng_name, False):
+                continue
             if ng.getAttribute(MTLX_NODEDEF_NAME_ATTRIBUTE) or ng.hasSourceUri():
                 continue
             if ng_name not in export_graph_names:
                 unconnected_graphs.append(ng_name)
-                gltf_info = self.materialX_graph_to_glTF(ng, json_data)
+                with MxGLTFPTTrace.span('materialX_graph_to_glTF', graph=ng_name):
+                    gltf_info = self.materialX_graph_to_glTF(ng, json_data, options, diagnostics)
                 procs = gltf_info[0]
                 output_nodes = gltf_info[1]
 
+        if materials and self.get_options(options).bake_fallbacks:
+            with MxGLTFPTTrace.span('bake_fallback_textures'):
+                self.bake_fallback_textures(mtlx_doc, json_data, materials, options, diagnostics)
+
         if len(materials) > 0:
             json_data[KHR_MATERIALS_BLOCK] = materials
             if len(unconnected_graphs) > 0:
@@ -820,16 +1500,119 @@ class glTFMaterialXConverter():
         if procs and len(procs) > 0:
             json_data[KHR_ASSET_BLOCK] = json_asset
             json_data[KHR_EXTENTIONSUSED_BLOCK] = extensions_used
-
-            # Get the JSON string back
-            json_string = json.dumps(json_data, indent=2) if json_data else ''
-            if json_string == '{}':
-                json_string = ''
+            definitions = json_data.get(KHR_EXTENSIONS_BLOCK, {}).get(KHR_TEXTURE_PROCEDURALS, {}).get(KHR_TEXTURE_PROCEDURALS_DEFINITIONS_BLOCK)
+            over_budget = self.check_procedural_costs(mtlx_doc, procs, options, diagnostics, definitions)
+            if over_budget:
+                json_data = {}
+                status = 'Procedurals exceed cost budget: ' + ', '.join(over_budget)
         else:
-            json_string = ''
+            json_data = {}
             status = 'No procedural graphs converted'
 
-        return json_string, status
+        return json_data, status
+
+    def bake_fallback_textures(self, mtlx_doc, json_data, materials, options=None, diagnostics=None):
+        '''
+        @brief Replace the shared fallback texture of procedural material inputs by images baked from the
+        procedural outputs they use. The outputs of a procedural are baked together, and baked images
+        are cached by a hash of the exported procedural so that procedurals repeated across documents
+        are only baked once. Inputs using outputs which cannot be evaluated keep the shared fallback texture.
+        @param mtlx_doc: The MaterialX document the procedurals were exported from.
+        @param json_data: The glTF JSON object to add the baked images and textures to.
+        @param materials: The glTF materials whose texture references are updated.
+        @param options: Optional ConversionOptions. Default is None meaning the converter's default options.
+        @param diagnostics: Optional Diagnostics collector to record events in. Default is None.
+        @return The number of texture references given a baked texture.
+        '''
+        options = self.get_options(options)
+        diagnostics = self.get_diagnostics(diagnostics)
+        if not MxGLTFPTBake.have_numpy():
+            diagnostics.warning('bake_unavailable', None, 'NumPy is required to bake fallback textures')
+            return 0
+
+        procs = json_data.get(KHR_EXTENSIONS_BLOCK, {}).get(KHR_TEXTURE_PROCEDURALS, {}).get(KHR_TEXTURE_PROCEDURALS_PROCEDURALS_BLOCK, [])
+        images_block = json_data.setdefault(KHR_IMAGES_BLOCK, [])
+        texture_array = json_data.setdefault(KHR_TEXTURES_BLOCK, [])
+
+        # Texture references per procedural and output
+        references = {}
+        for material in materials:
+            for texture_info in self.get_material_textures(material):
+                lookup = texture_info.get(KHR_EXTENSIONS_BLOCK, {}).get(KHR_TEXTURE_PROCEDURALS)
+                if lookup and lookup.get(KHR_TEXTURE_PROCEDURALS_INDEX, -1) < len(procs):
+                    outputs = references.setdefault(lookup[KHR_TEXTURE_PROCEDURALS_INDEX], {})
+                    outputs.setdefault(lookup.get(KHR_TEXTURE_PROCEDURALS_OUTPUT, ''), []).append(texture_info)
+
+        # Images referenced by procedurals are part of the cache key, as is the folder relative file names are resolved from
+        texture_uris = [self.get_glTF_texture_uri(texture, images_block) for texture in texture_array]
+        source_folder = os.path.dirname(mtlx_doc.getSourceUri())
+
+        baked = 0
+        for proc_index, outputs in references.items():
+            proc = procs[proc_index]
+            graph = mtlx_doc.getNodeGraph(proc[KHR_TEXTURE_PROCEDURALS_NAME])
+            if not graph:
+                continue
+
+            # References without an output name use the first output
+            graph_outputs = {}
+            for name, texture_infos in outputs.items():
+                output = graph.getOutput(name) if name else next(iter(graph.getOutputs()), None)
+                if output:
+                    graph_outputs.setdefault(output.getName(), (output, []))[1].extend(texture_infos)
+            if not graph_outputs:
+                continue
+
+            key = MxGLTFPTBake.get_graph_key(proc, texture_uris, source_folder)
+            uris, error = self.fallback_baker.bake([output for output, texture_infos in graph_outputs.values()], options.bake_resolution, key)
+            if uris is None:
+                diagnostics.info('bake_skipped', graph, 'Fallback texture not baked: %s', error)
+                continue
+
+            for (output, texture_infos), uri in zip(graph_outputs.values(), uris):
+                texture = {}
+                self.initialize_glTF_texture(texture, f'{KHR_TEXTURE_PROCEDURALS_FALLBACK_NAME}_{graph.getName()}_{output.getName()}', uri, images_block)
+                texture_array.append(texture)
+                for texture_info in texture_infos:
+                    texture_info[KHR_TEXTURE_PROCEDURALS_INDEX] = len(texture_array) - 1
+                    baked += 1
+            diagnostics.info('bake_fallback', graph, 'Baked %d fallback textures at %d x %d', len(uris), options.bake_resolution, options.bake_resolution)
+        return baked
+
+    def check_procedural_costs(self, mtlx_doc, procedurals, options=None, diagnostics=None, definitions=None):
+        '''
+        @brief Estimate the runtime cost of exported procedurals and check them against the budget of the options.
+        Estimates are recorded as 'procedural_cost' information events, and procedurals over budget as
+        'cost_budget' warnings, or errors if the budget action is 'fail'.
+        @param mtlx_doc: The MaterialX document used to look up node definitions.
+        @param procedurals: The glTF procedurals.
+        @param options: Optional ConversionOptions. Default is None meaning the converter's default options.
+        @param diagnostics: Optional Diagnostics collector to record events in. Default is None.
+        @param definitions: Optional glTF procedural definitions, whose implementations are used to 
+        estimate the nodes which use them. Default is None.
+        @return The names of the procedurals over budget if the budget action is 'fail', otherwise an empty list.
+        '''
+        options = self.get_options(options)
+        diagnostics = self.get_diagnostics(diagnostics)
+        has_budget = options.max_nodes or options.max_texture_fetches or options.max_cost
+        if not has_budget and not diagnostics.is_enabled(MxGLTFPTDiag.INFO):
+            return []
+
+        failed = []
+        model = MxGLTFPTCost.CostModel(mtlx_doc, options.cost_weights, definitions)
+        for procedural in procedurals:
+            estimate = model.estimate_procedural(procedural)
+            diagnostics.info('procedural_cost', estimate['name'], 'Nodes: %d, texture fetches: %d, cost: %g',
+                             estimate['nodes'], estimate['texture_fetches'], estimate['cost'])
+            exceeded = MxGLTFPTCost.check_budget(estimate, options.max_nodes, options.max_texture_fetches, options.max_cost)
+            if not exceeded:
+                continue
+            if options.budget_action == MxGLTFPTCost.BUDGET_FAIL:
+                diagnostics.error('cost_budget', estimate['name'], 'Exceeds cost budget: %s', ', '.join(exceeded))
+                failed.append(estimate['name'])
+            else:
+                diagnostics.warning('cost_budget', estimate['name'], 'Exceeds cost budget: %s', ', '.join(exceeded))
+        return failed
 
     ############################
     # glTF to MaterialX methods
@@ -837,16 +1620,18 @@ class glTFMaterialXConverter():
 
     def set_add_asset_info(self, add_asset_info):
         '''
-        Set the flag to add asset information from glTF to the generated MaterialX files.
+        Set the flag to add asset information from glTF to the generated MaterialX files
+        for the converter's default options.
         @param add_asset_info: The flag to add asset information
         '''
-        self.add_asset_info = add_asset_info
+        self.options = self.options.replace(add_asset_info=add_asset_info)
         
-    def scalar_to_string(self, value, type):
+    def scalar_to_string(self, value, type, diagnostics=None):
         '''
         Convert a scalar value to a string value that is supported by MaterialX.
         @param value: The scalar value to convert.
         @param type: The type of the value.
+        @param diagnostics: Optional Diagnostics collector to record events in. Default is None.
         @return The converted string value, or None if the type is unsupported.
         '''
         return_value = None
@@ -859,10 +1644,27 @@ class glTFMaterialXConverter():
             else:
                 return_value = '{0:g}'.format(value) if isinstance(value, float) else str(value)            
         else:
-            self.logger.warning(f'> Unsupported type:"{type}" not found in supported list: {self.supported_types}')
+            if diagnostics is not None:
+                diagnostics.warning('unsupported_type', None, 'Unsupported type:"%s" not found in supported list: %s', type, self.supported_types)
 
         return return_value
 
+    def get_material_textures(self, material):
+        '''
+        Get the texture references on a glTF material.
+        @param material: The glTF material to scan.
+        @return The list of texture reference objects.
+        '''
+        texture_infos = []
+        for key, value in material.items():
+            if key == KHR_EXTENSIONS_BLOCK or not isinstance(value, dict):
+                continue
+            if KHR_TEXTURE_PROCEDURALS_INDEX in value or KHR_EXTENSIONS_BLOCK in value:
+                texture_infos.append(value)
+            else:
+                texture_infos.extend(self.get_material_textures(value))
+        return texture_infos
+
     def get_glTF_texture_uri(self, texture, images):
         '''
         Get the URI of a glTF texture.
@@ -926,29 +1728,82 @@ class glTFMaterialXConverter():
         
         return [True, '']
 
-    def glTF_to_materialX(self, gltf_doc, stdlib):
+    def get_glTF_selection(self, gltf_doc, selection):
         '''
-        Convert a glTF document to a MaterialX document.
+        Determine the materials and procedural graphs in a glTF document selected by a filter.
+        Material names are matched against both material and shader patterns. Procedural graphs
+        are matched using their name in the glTF document.
+        @param gltf_doc: The glTF document to scan.
+        @param selection: The ConversionFilter to apply. Can be None.
+        @return The selection in the form [material indices, procedural indices], where each item 
+        is a set of indices or None if all items are selected.
+        '''
+        if not selection or selection.is_empty():
+            return [None, None]
+
+        extensions = gltf_doc.get(KHR_EXTENSIONS_BLOCK, None)
+        procedurals = []
+        if extensions:
+            procedurals = extensions.get(KHR_TEXTURE_PROCEDURALS, {}).get(KHR_TEXTURE_PROCEDURALS_PROCEDURALS_BLOCK, None) or []
+
+        material_indices = set()
+        referenced = set()
+        for i, material in enumerate(gltf_doc.get(KHR_MATERIALS_BLOCK, None) or []):
+            material_name = material.get(KHR_TEXTURE_PROCEDURALS_NAME, '')
+            if not (selection.accept_material(material_name) and selection.accept_shader(material_name, material_name)):
+                continue
+            material_indices.add(i)
+            for texture_info in self.get_material_textures(material):
+                lookup = texture_info.get(KHR_EXTENSIONS_BLOCK, {}).get(KHR_TEXTURE_PROCEDURALS, None)
+                if lookup and lookup.get(KHR_TEXTURE_PROCEDURALS_INDEX) is not None:
+                    referenced.add(lookup[KHR_TEXTURE_PROCEDURALS_INDEX])
+
+        procedural_indices = set()
+        for i, proc in enumerate(procedurals):
+            proc_name = proc.get(KHR_TEXTURE_PROCEDURALS_NAME, '')
+            if selection.accept_nodegraph(proc_name, i in referenced):
+                procedural_indices.add(i)
+
+        return [material_indices, procedural_indices]
+
+    def glTF_to_materialX(self, gltf_doc, stdlib, selection=None, options=None, diagnostics=None):
+        '''
+        Convert a glTF document to a MaterialX document. The glTF document is not modified,
+        so the same parsed document can be converted any number of times.
         @param gltFDoc: The glTF document to import.
         @param stdlib: The MateriaLX standard library to use for the conversion.
+        @param selection: Optional ConversionFilter used to select what to import. Materials and procedural
+        graphs which are not selected are skipped. Default is None.
+        @param options: Optional ConversionOptions. Default is None meaning the converter's default options.
+        @param diagnostics: Optional Diagnostics collector to record events in. Default is None.
         @return The MaterialX document if successful, otherwise None.
         '''
+        options = self.get_options(options)
+        diagnostics = self.get_diagnostics(diagnostics)
         if not gltf_doc:
-            self.logger.error('> No glTF document specified')
+            diagnostics.error('no_document', None, 'No glTF document specified')
             return None
 
         extension_check = self.have_procedural_tex_extensions(gltf_doc)
         if extension_check[0] is None:
             return None
 
-        # Prepare the glTF to add names to the graph if not already present
-        self.glTF_graph_create_names(gltf_doc)
+        material_indices, procedural_indices = self.get_glTF_selection(gltf_doc, selection)
+
+        # Generate names for the graph if not already present. Names are kept in a
+        # side table to leave the glTF document untouched.
+        names = glTFNameTable()
+        self.glTF_graph_create_names(gltf_doc, procedural_indices, names)
 
         doc = mx.createDocument()
         doc.setAttribute('colorspace', 'lin_rec709')
 
         # Import the graph
-        self.glTF_graph_to_materialX(doc, gltf_doc)
+        self.glTF_graph_to_materialX(doc, gltf_doc, procedural_indices, names, options, diagnostics)
+        if options.elide_defaults:
+            elided = MxGLTFPTOptimize.remove_default_values(doc, stdlib)
+            if elided:
+                diagnostics.info('elide_defaults', None, 'Left %d default input values implicit', elided)
 
         global_extensions = gltf_doc.get('extensions', None)
         procedurals = None
@@ -966,9 +1821,11 @@ class glTFMaterialXConverter():
             ]
             input_maps[MTLX_UNLIT_CATEGORY_STRING] = [['emission_color', 'baseColorTexture', 'pbrMetallicRoughness']]
 
-            for gltf_material in gltf_materials:
+            for material_index, gltf_material in enumerate(gltf_materials):
+                if material_indices is not None and material_index not in material_indices:
+                    continue
 
-                mtlx_shader_name = gltf_material.get(KHR_TEXTURE_PROCEDURALS_NAME, MTLX_DEFAULT_SHADER_NAME)
+                mtlx_shader_name = names.get_name(gltf_material, MTLX_DEFAULT_SHADER_NAME)
                 mtlx_material_name = ''
                 if len(mtlx_shader_name) == 0:
                     mtlx_shader_name = MTLX_DEFAULT_SHADER_NAME
@@ -1025,10 +1882,12 @@ class glTFMaterialXConverter():
                                 procedural_index = KHR_texture_procedurals.get('index', None)
                                 output = KHR_texture_procedurals.get('output', None)
                                 
+                                if procedural_indices is not None and procedural_index not in procedural_indices:
+                                    procedural_index = None
                                 if procedural_index is not None and procedural_index < len(procedurals):
                                     proc = procedurals[procedural_index]
                                     if proc:
-                                        nodegraph_name = proc.get('name')
+                                        nodegraph_name = names.get_name(proc)
                                         graph_outputs = proc.get(KHR_TEXTURE_PROCEDURALS_OUTPUTS_BLOCK, None)
                                         output_count = len(graph_outputs)
                                         if graph_outputs:
@@ -1048,17 +1907,17 @@ class glTFMaterialXConverter():
                                                     input_node.removeAttribute('value')
                                                     input_node.setNodeGraphString(nodegraph_name)
                                                     if output_count > 1:
-                                                        input_node.setAttribute('output', proc_output[KHR_TEXTURE_PROCEDURALS_NAME])
+                                                        input_node.setAttribute('output', names.get_name(proc_output))
 
 
                 material_node = doc.addNode(mx.SURFACE_MATERIAL_NODE_STRING, mtlx_material_name, mx.MATERIAL_TYPE_STRING)
                 shader_input = material_node.addInput(mx.SURFACE_SHADER_TYPE_STRING, mx.SURFACE_SHADER_TYPE_STRING)
                 shader_input.setAttribute(MTLX_NODE_NAME_ATTRIBUTE, mtlx_shader_name)
 
-                self.logger.info(f'> Import material: {material_node.getName()}. Shader: {shader_node.getName()}')
+                diagnostics.info('import_material', material_node, 'Import material. Shader: %s', mtlx_shader_name)
 
         # Import asset information as a doc string
-        if self.add_asset_info:
+        if options.add_asset_info:
             asset = gltf_doc.get('asset', None)
             mtlx_doc_string = ''
             if asset:
@@ -1111,13 +1970,21 @@ class glTFMaterialXConverter():
             for material in materials:
                 material.pop(KHR_TEXTURE_PROCEDURALS_NAME, None)
 
-    def glTF_graph_create_names(self, gltf_doc):
+    def glTF_graph_create_names(self, gltf_doc, procedural_indices=None, names=None, diagnostics=None):
         '''
         Create names for all procedural graphs and materials if they don't already exist.
         This method should always be run before converting a glTF document to MaterialX to
         ensure that all connection references to elements are also handled. 
         @param gltf_doc: The glTF document to clear the names in.
+        @param procedural_indices: Optional set of procedural graph indices to name. Default is None meaning all graphs.
+        @param names: Optional glTFNameTable to store the names in. Default is None meaning to 
+        store names in the glTF document.
+        @param diagnostics: Optional Diagnostics collector to record events in. Default is None.
         '''
+        if names is None:
+            names = glTFNameTable(True)
+        diagnostics = self.get_diagnostics(diagnostics)
+
         # Use a dummy document to handle unique name generation
         dummy_doc = mx.createDocument()
 
@@ -1128,14 +1995,17 @@ class glTFMaterialXConverter():
 
         if procedurals:
             # Scan all procedurals
-            for proc in procedurals:
+            for proc_index, proc in enumerate(procedurals):
+                if procedural_indices is not None and proc_index not in procedural_indices:
+                    continue
+
                 # Generate a procedural graph name if not already set
                 proc_name = proc.get(KHR_TEXTURE_PROCEDURALS_NAME, '')
                 if len(proc_name) == 0:
                     proc_name = MTLX_DEFAULT_GRAPH_NAME
-                proc['name'] = dummy_doc.createValidChildName(proc_name)
-                #self.logger.info('Add procedural:' + proc['name'])
-                dummy_graph = dummy_doc.addNodeGraph(proc['name'])                    
+                proc_name = dummy_doc.createValidChildName(proc_name)
+                names.set_name(proc, proc_name)
+                dummy_graph = dummy_doc.addNodeGraph(proc_name)
                 
                 inputs = proc.get(KHR_TEXTURE_PROCEDURALS_INPUTS_BLOCK, {})
                 outputs = proc.get(KHR_TEXTURE_PROCEDURALS_OUTPUTS_BLOCK, {})
@@ -1148,7 +2018,7 @@ class glTFMaterialXConverter():
                         if len(input_name) == 0:
                             input_name = MTLX_DEFAULT_INPUT_NAME
                         input_item['name'] = dummy_graph.createValidChildName(input_name)
-                        self.logger.debug('Add input:' + input_item['name'])
+                        diagnostics.debug('add_input', proc_name, 'Add input: %s', input_item['name'])
                         dummy_graph.addInput(input_item['name'])
 
                     # Generate output names if not already set
@@ -1157,7 +2027,7 @@ class glTFMaterialXConverter():
                         if len(output_name) == 0:
                             output_name = MTLX_DEFAULT_OUTPUT_NAME
                         output_item['name'] = dummy_graph.createValidChildName(output_name)
-                        self.logger.debug('Add output:' + output_item['name'])
+                        diagnostics.debug('add_output', proc_name, 'Add output: %s', output_item['name'])
                         dummy_graph.addOutput(output_item['name'])
 
                 # Generate node names if not already set
@@ -1165,10 +2035,10 @@ class glTFMaterialXConverter():
                     node_name = node.get(KHR_TEXTURE_PROCEDURALS_NAME, '')
                     if len(node_name) == 0:
                         node_name = MTLX_DEFAULT_NODE_NAME
-                    node['name'] = dummy_graph.createValidChildName(node_name)
-                    #self.logger.info('Add node:' + node['name'])
+                    node_name = dummy_graph.createValidChildName(node_name)
+                    names.set_name(node, node_name)
                     node_type = node.get('nodetype', None)
-                    dummy_graph.addChildOfCategory(node_type, node['name'])
+                    dummy_graph.addChildOfCategory(node_type, node_name)
 
         # Generate shader names.
         materials = gltf_doc.get(KHR_MATERIALS_BLOCK, None)
@@ -1177,16 +2047,26 @@ class glTFMaterialXConverter():
                 material_name = material.get(KHR_TEXTURE_PROCEDURALS_NAME, '')
                 if len(material_name) == 0:
                     material_name = MTLX_DEFAULT_SHADER_NAME
-                material['name'] = dummy_doc.createValidChildName(material_name)
-                dummy_doc.addNode(MTLX_GLTF_PBR_CATEGORY, material['name'], mx.SURFACE_SHADER_TYPE_STRING)                                
+                material_name = dummy_doc.createValidChildName(material_name)
+                names.set_name(material, material_name)
+                dummy_doc.addNode(MTLX_GLTF_PBR_CATEGORY, material_name, mx.SURFACE_SHADER_TYPE_STRING)
     
-    def glTF_graph_to_materialX(self, doc, gltf_doc):
+    def glTF_graph_to_materialX(self, doc, gltf_doc, procedural_indices=None, names=None, options=None, diagnostics=None):
         '''
         Import the procedural graphs from a glTF document into a MaterialX document.
         @param doc: The MaterialX document to import the graphs into.
         @param gltf_doc: The glTF document to import the graphs from.
+        @param procedural_indices: Optional set of procedural graph indices to import. Default is None meaning all graphs.
+        @param names: Optional glTFNameTable holding generated names. Default is None meaning 
+        names are read from and written to the glTF document.
+        @param options: Optional ConversionOptions. Default is None meaning the converter's default options.
+        @param diagnostics: Optional Diagnostics collector to record events in. Default is None.
         @return The root MaterialX nodegraph if successful, otherwise None.
         '''
+        if names is None:
+            names = glTFNameTable(True)
+        diagnostics = self.get_diagnostics(diagnostics)
+
         root_mtlx = None
 
         # Look for the extension
@@ -1196,85 +2076,264 @@ class glTFMaterialXConverter():
             procedurals = extensions.get(KHR_TEXTURE_PROCEDURALS, {}).get(KHR_TEXTURE_PROCEDURALS_PROCEDURALS_BLOCK, None)
 
         if procedurals is None:
-            self.logger.error('> No procedurals array found')
+            diagnostics.error('no_procedurals', None, 'No procedurals array found')
             return None
 
-        metadata = self.get_metadata()
+        metadata = self.get_metadata(options)
+
+        # Import custom node definitions first, as nodes of the graphs refer to them by node type
+        self.glTF_definitions_to_materialX(doc, gltf_doc, names, options, diagnostics)
 
         # Pre and postfix for automatic graph name generation
         graph_index = 0
 
-        self.logger.info(f'> Importing {len(procedurals)} procedural graphs')
-        for proc in procedurals:
-            self.logger.debug(f'> Scan procedural {graph_index} of {len(procedurals)} :')
+        diagnostics.info('import_procedurals', None, 'Importing %d procedural graphs', len(procedurals))
+        for proc_index, proc in enumerate(procedurals):
+            if procedural_indices is not None and proc_index not in procedural_indices:
+                continue
+            proc_path = 'procedurals/' + str(proc_index)
+            diagnostics.debug('scan_procedural', proc_path, 'Scan procedural %d of %d', proc_index, len(procedurals))
             if not proc.get('nodetype'):
-                self.logger.warning('>  No nodetype found in procedural. Skipping node')
+                diagnostics.warning('missing_nodetype', proc_path, 'No nodetype found in procedural. Skipping node')
                 continue
 
             if proc[KHR_TEXTURE_PROCEDURALS_NODETYPE] != 'nodegraph':
-                self.logger.warning(f'> Unsupported procedural nodetype found: {proc["nodetype"]}')
+                diagnostics.warning('unsupported_nodetype', proc_path, 'Unsupported procedural nodetype found: %s', proc['nodetype'])
                 continue
 
             # Assign a name to the graph if not already set
-            graph_name = proc.get('name', 'GRAPH_' + str(graph_index))
+            graph_name = names.get_name(proc, 'GRAPH_' + str(graph_index))
             if len(graph_name) == 0:
                 graph_name = 'GRAPH_' + str(graph_index)
             graph_name = doc.createValidChildName(graph_name)
-            proc['name']  = graph_name
-            
-            # Create new nodegraph and add metadata
-            self.logger.info(f'> Create new nodegraph: {graph_name}')
-            mtlx_graph = doc.addNodeGraph(graph_name)
-            graph_metadata= self.get_graph_metadata()
-            for meta in graph_metadata:
-                if meta in proc:
-                    proc_meta_data = proc[meta]
-                    self.logger.debug(f'> Add extra graph attribute: {meta}, {proc_meta_data}')
-                    mtlx_graph.setAttribute(meta, proc_meta_data)
-
-            root_mtlx = mtlx_graph
-
-            inputs = proc.get(KHR_TEXTURE_PROCEDURALS_INPUTS_BLOCK, {})
-            outputs = proc.get(KHR_TEXTURE_PROCEDURALS_OUTPUTS_BLOCK, {})
-            nodes = proc.get(KHR_TEXTURE_PROCEDURALS_NODES_BLOCK, [])
-
-            # - Prelabel nodes
-            # Pre-label inputs
-            for input_name, input_item in inputs.items():
-                if len(input_name) == 0:
-                    input_name = MTLX_DEFAULT_INPUT_NAME
-                input_item['name'] = mtlx_graph.createValidChildName(input_name)
-                if len(input_name) == 0:
+            names.set_name(proc, graph_name)
+            with MxGLTFPTTrace.span('glTF_graph_to_materialX', graph=graph_name):
+                # Create new nodegraph and add metadata
+                diagnostics.info('create_nodegraph', graph_name, 'Create new nodegraph')
+                mtlx_graph = doc.addNodeGraph(graph_name)
+                graph_metadata= self.get_graph_metadata(options)
+                for meta in graph_metadata:
+                    if meta in proc:
+                        proc_meta_data = proc[meta]
+                        diagnostics.debug('add_attribute', graph_name, 'Add extra graph attribute: %s, %s', meta, proc_meta_data)
+                        mtlx_graph.setAttribute(meta, proc_meta_data)
+
+                root_mtlx = mtlx_graph
+                self.glTF_procedural_to_materialX(mtlx_graph, proc, gltf_doc, names, metadata, diagnostics)
+
+        return root_mtlx
+
+    def glTF_definitions_to_materialX(self, doc, gltf_doc, names=None, options=None, diagnostics=None):
+        '''
+        Import the procedural definitions of a glTF document into a MaterialX document. Each definition
+        is added as a node definition, and each implementation as a functional node graph of its definition.
+        Definitions whose name is already used in the document are not imported.
+        @param doc: The MaterialX document to import the definitions into.
+        @param gltf_doc: The glTF document to import the definitions from.
+        @param names: Optional glTFNameTable holding generated names. Default is None meaning 
+        names are read from and written to the glTF document.
+        @param options: Optional ConversionOptions. Default is None meaning the converter's default options.
+        @param diagnostics: Optional Diagnostics collector to record events in. Default is None.
+        @return The number of node definitions imported.
+        '''
+        if names is None:
+            names = glTFNameTable(True)
+        diagnostics = self.get_diagnostics(diagnostics)
+        definitions = gltf_doc.get(KHR_EXTENSIONS_BLOCK, {}).get(KHR_TEXTURE_PROCEDURALS, {}).get(KHR_TEXTURE_PROCEDURALS_DEFINITIONS_BLOCK, [])
+        metadata = self.get_metadata(options)
+
+        nodedefs = {}
+        for index, definition in enumerate(definitions):
+            definition_path = KHR_TEXTURE_PROCEDURALS_DEFINITIONS_BLOCK + '/' + str(index)
+            name = definition.get(KHR_TEXTURE_PROCEDURALS_NAME)
+            nodetype = definition.get(KHR_TEXTURE_PROCEDURALS_NODETYPE)
+
+            if nodetype == KHR_TEXTURE_PROCEDURALS_NODEDEF:
+                node_string = definition.get(KHR_TEXTURE_PROCEDURALS_NODE)
+                if not name or not node_string:
+                    diagnostics.error('invalid_definition', definition_path, 'Node definition has no name or node. Definition skipped')
+                    continue
+                if doc.getChild(name):
+                    diagnostics.warning('existing_definition', name, 'Name of node definition already used in document. Definition skipped')
+                    continue
+
+                # The outputs are added from the outputs block
+                nodedef = doc.addNodeDef(name, '', node_string)
+                diagnostics.info('import_definition', nodedef, 'Import node definition')
+                if KHR_TEXTURE_PROCEDURALS_NODEGROUP in definition:
+                    nodedef.setNodeGroup(definition[KHR_TEXTURE_PROCEDURALS_NODEGROUP])
+                if 'version' in definition:
+                    nodedef.setVersionString(definition['version'])
+                    nodedef.setDefaultVersion(definition.get('isdefaultversion', False))
+                for meta in self.get_graph_metadata(options):
+                    if meta in definition:
+                        nodedef.setAttribute(meta, definition[meta])
+
+                for input_name, input_item in definition.get(KHR_TEXTURE_PROCEDURALS_INPUTS_BLOCK, {}).items():
+                    input_type = input_item.get(KHR_TEXTURE_PROCEDURALS_TYPE, None)
+                    if not input_type:
+                        diagnostics.error('missing_input_type', nodedef, 'Input type not found for definition input: %s', input_name)
+                        continue
+                    mtlx_input = nodedef.addChildOfCategory(input_item.get('nodetype', 'input'), input_name)
+                    mtlx_input.setType(input_type)
+                    for meta in metadata:
+                        if meta in input_item:
+                            mtlx_input.setAttribute(meta, input_item[meta])
+                    if input_item.get('uniform'):
+                        mtlx_input.setIsUniform(True)
+
+                    if 'defaultgeomprop' in input_item:
+                        mtlx_input.setDefaultGeomPropString(input_item['defaultgeomprop'])
+                    elif KHR_TEXTURE_PROCEDURALS_TEXTURE in input_item:
+                        textures = gltf_doc.get(KHR_TEXTURES_BLOCK, [])
+                        texture_index = input_item[KHR_TEXTURE_PROCEDURALS_TEXTURE]
+                        if texture_index < len(textures):
+                            mtlx_input.setValueString(self.get_glTF_texture_uri(textures[texture_index], gltf_doc.get(KHR_IMAGES_BLOCK, [])))
+                    elif KHR_TEXTURE_PROCEDURALS_VALUE in input_item:
+                        input_value = input_item[KHR_TEXTURE_PROCEDURALS_VALUE]
+                        mtlx_value = self.scalar_to_string(input_value, input_type, diagnostics)
+                        mtlx_input.setValueString(mtlx_value if mtlx_value is not None else str(input_value))
+
+                for output_name, output_item in definition.get(KHR_TEXTURE_PROCEDURALS_OUTPUTS_BLOCK, {}).items():
+                    nodedef.addOutput(output_name, output_item.get(KHR_TEXTURE_PROCEDURALS_TYPE, None))
+                nodedefs[index] = nodedef
+
+            elif nodetype == 'nodegraph':
+                nodedef_index = definition.get(KHR_TEXTURE_PROCEDURALS_NODEDEF)
+                nodedef = nodedefs.get(nodedef_index) if isinstance(nodedef_index, int) else None
+                if not nodedef:
+                    diagnostics.warning('missing_definition', definition_path, 'Node definition of implementation not imported. Implementation skipped')
+                    continue
+
+                graph_name = doc.createValidChildName(name if name else 'NG_' + nodedef.getName())
+                with MxGLTFPTTrace.span('glTF_graph_to_materialX', graph=graph_name):
+                    mtlx_graph = doc.addNodeGraph(graph_name)
+                    mtlx_graph.setNodeDef(nodedef)
+                    interface = definitions[nodedef_index].get(KHR_TEXTURE_PROCEDURALS_INPUTS_BLOCK, {})
+                    self.glTF_procedural_to_materialX(mtlx_graph, definition, gltf_doc, names, metadata, diagnostics, interface)
+
+            else:
+                diagnostics.warning('unsupported_nodetype', definition_path, 'Unsupported procedural definition nodetype found: %s', nodetype)
+
+        return len(nodedefs)
+
+    def glTF_procedural_to_materialX(self, mtlx_graph, proc, gltf_doc, names, metadata, diagnostics, interface=None):
+        '''
+        Import the inputs, nodes and outputs of a glTF procedural graph into a MaterialX node graph.
+        @param mtlx_graph: The MaterialX node graph to add to.
+        @param proc: The glTF procedural graph.
+        @param gltf_doc: The glTF document containing the graph.
+        @param names: The glTFNameTable holding generated names.
+        @param metadata: The metadata attributes to import.
+        @param diagnostics: The Diagnostics collector to record events in.
+        @param interface: Optional inputs of the node definition which the graph implements. Nodes connect 
+        to these inputs, and no interface inputs are added to the graph. Default is None.
+        '''
+        graph_name = mtlx_graph.getName()
+
+        inputs = proc.get(KHR_TEXTURE_PROCEDURALS_INPUTS_BLOCK, {}) if interface is None else interface
+        outputs = proc.get(KHR_TEXTURE_PROCEDURALS_OUTPUTS_BLOCK, {})
+        nodes = proc.get(KHR_TEXTURE_PROCEDURALS_NODES_BLOCK, [])
+
+        # - Prelabel nodes
+        # Pre-label inputs
+        for input_name, input_item in inputs.items():
+            if interface is not None:
+                names.set_name(input_item, input_name)
+                continue
+            if len(input_name) == 0:
+                input_name = MTLX_DEFAULT_INPUT_NAME
+            names.set_name(input_item, mtlx_graph.createValidChildName(input_name))
+        for output_name, output_item in outputs.items():
+            if len(output_name) == 0:
+                output_name = MTLX_DEFAULT_OUTPUT_NAME
+            names.set_name(output_item, mtlx_graph.createValidChildName(output_name))
+        for node in nodes:
+            node_name = names.get_name(node, MTLX_DEFAULT_NODE_NAME)
+            if len(node_name) == 0:
+                node_name = MTLX_DEFAULT_NODE_NAME
+            names.set_name(node, mtlx_graph.createValidChildName(node_name))
+
+        # Scan for input interfaces in the node graph
+        diagnostics.debug('scan_inputs', graph_name, 'Scan %d inputs', len(inputs))
+        for inputname, input_item in (inputs.items() if interface is None else []):
+            #inputname = input_item.get('name', None)
+
+            # A type is required
+            input_type = input_item.get(KHR_TEXTURE_PROCEDURALS_TYPE, None)
+            if not input_type:
+                diagnostics.error('missing_input_type', graph_name, 'Input type not found for graph input: %s', inputname)
+                continue
+
+            # Add new interface input
+            mtlx_input = mtlx_graph.addInput(inputname, input_type)
+            # Add extra metadata to the input
+            for meta in metadata:
+                if meta in input_item:
+                    diagnostics.debug('add_attribute', mtlx_input, 'Add extra interface attribute: %s, %s', meta, input_item[meta])
+                    mtlx_input.setAttribute(meta, input_item[meta])
+
+            # If input is a file reference, examines textures and images to retrieve the URI
+            if input_type == 'filename':
+                texture_index = input_item.get('texture', None)
+                if texture_index is not None:
+                    gltf_textures = gltf_doc.get('textures', None)
+                    gltf_images = gltf_doc.get('images', None)
+                    if gltf_textures and gltf_images:
+                        gltf_texture = gltf_textures[texture_index] if texture_index < len(gltf_textures) else None
+                        if gltf_texture:
+                            uri = self.get_glTF_texture_uri(gltf_texture, gltf_images)
+                            mtlx_input.setValueString(uri)
+
+            # If input has a value, set the value
+            input_value = input_item.get('value', None)
+            if input_value is not None:
+                mtlx_value = self.scalar_to_string(input_value, input_type, diagnostics)
+                if mtlx_value is not None:
+                    mtlx_input.setValueString(mtlx_value)
+                    mtlx_input.setType(input_type)
+                else:
+                    mtlx_input.setValueString(str(input_value))
+            elif not mtlx_input.getValueString():
+                diagnostics.error('missing_input_value', mtlx_input, 'Interface input has no value specified')
+
+        # Scan for nodes in the nodegraph
+        diagnostics.debug('scan_nodes', graph_name, 'Scan %d nodes', len(nodes))
+        for node in nodes:
+            node_name = names.get_name(node)
+            node_type = node.get('nodetype', None)
+            output_type = node.get(KHR_TEXTURE_PROCEDURALS_TYPE, None)
+            node_outputs = node.get(KHR_TEXTURE_PROCEDURALS_OUTPUTS_BLOCK, [])
+
+            # Create a new node in the graph
+            mtlx_node = mtlx_graph.addChildOfCategory(node_type, node_name)
+
+            # Check for multiple outputs on the node to use 'multioutput'
+            if len(node_outputs) > 1:
+                output_type = MULTI_OUTPUT_TYPE_STRING
+                #mtlx_node.setType(output_type)
+
+            if output_type:
+                mtlx_node.setType(output_type)
+            else:
+                diagnostics.error('missing_node_type', mtlx_node, 'No output type specified for node')
+
+            # Look for other name, value pair children under node. Such as "xpos": "0.086957",
+            # For each add an attribute to the node
+            for key, value in node.items():
+                if key not in [KHR_TEXTURE_PROCEDURALS_NAME, 'nodetype', KHR_TEXTURE_PROCEDURALS_TYPE, KHR_TEXTURE_PROCEDURALS_INPUTS_BLOCK, KHR_TEXTURE_PROCEDURALS_OUTPUTS_BLOCK]:
+                    diagnostics.debug('add_attribute', mtlx_node, 'Add extra node attribute: %s, %s', key, value)
+                    mtlx_node.setAttribute(key, value)
+
+            # Add node inputs
+            node_inputs = node.get(KHR_TEXTURE_PROCEDURALS_INPUTS_BLOCK, {})
+            for input_name, input_item in node_inputs.items():
+                if not input_name:
                     input_name = MTLX_DEFAULT_INPUT_NAME
-                input_item['name'] = mtlx_graph.createValidChildName(input_name)
-            for output_name, output_item in outputs.items():
-                if len(output_name) == 0:
-                    output_name = MTLX_DEFAULT_OUTPUT_NAME
-                output_item['name'] = mtlx_graph.createValidChildName(output_name)
-            for node in nodes:
-                node_name = node.get(KHR_TEXTURE_PROCEDURALS_NAME, MTLX_DEFAULT_NODE_NAME)
-                if len(node_name) == 0:
-                    node_name = MTLX_DEFAULT_NODE_NAME
-                node['name'] = mtlx_graph.createValidChildName(node_name)            
-
-            # Scan for input interfaces in the node graph
-            self.logger.debug(f'> Scan {len(inputs)} inputs')
-            for inputname, input_item in inputs.items():
-                #inputname = input_item.get('name', None)
-
-                # A type is required
                 input_type = input_item.get(KHR_TEXTURE_PROCEDURALS_TYPE, None)
-                if not input_type:
-                    self.logger.error(f'> Input type not found for graph input: {inputname}')
-                    continue
 
-                # Add new interface input
-                mtlx_input = mtlx_graph.addInput(inputname, input_type)
-                # Add extra metadata to the input
-                for meta in metadata:
-                    if meta in input_item:
-                        self.logger.debug(f'> Add extra interface attribute: {meta}, {input_item[meta]}')
-                        mtlx_input.setAttribute(meta, input_item[meta])
+                # Add node input
+                mtlx_input = mtlx_node.addInput(input_name, input_type)
 
                 # If input is a file reference, examines textures and images to retrieve the URI
                 if input_type == 'filename':
@@ -1283,179 +2342,366 @@ class glTFMaterialXConverter():
                         gltf_textures = gltf_doc.get('textures', None)
                         gltf_images = gltf_doc.get('images', None)
                         if gltf_textures and gltf_images:
-                            gltf_texture = gltf_textures[texture_index] if texture_index < len(gltf_textures) else None
-                            if gltf_texture:
-                                uri = self.get_glTF_texture_uri(gltf_texture, gltf_images)
-                                mtlx_input.setValueString(uri, input_type)
+                            gltftexture = gltf_textures[texture_index] if texture_index < len(gltf_textures) else None
+                            if gltftexture:
+                                uri = self.get_glTF_texture_uri(gltftexture, gltf_images)
+                                mtlx_input.setValueString(uri)
 
                 # If input has a value, set the value
                 input_value = input_item.get('value', None)
                 if input_value is not None:
-                    mtlx_value = self.scalar_to_string(input_value, input_type)
+                    mtlx_value = self.scalar_to_string(input_value, input_type, diagnostics)
                     if mtlx_value is not None:
                         mtlx_input.setValueString(mtlx_value)
                         mtlx_input.setType(input_type)
                     else:
+                        diagnostics.error('unsupported_input_type', mtlx_input, 'Unsupported input type: %s. Performing straight assignment.', input_type)
                         mtlx_input.setValueString(str(input_value))
-                else:
-                    self.logger.error(f'> Interface input has no value specified: {inputname}')
-
-            # Scan for nodes in the nodegraph
-            self.logger.debug(f'> Scan {len(nodes)} nodes')
-            for node in nodes:
-                node_name = node.get(KHR_TEXTURE_PROCEDURALS_NAME, None)
-                node_type = node.get('nodetype', None)
-                output_type = node.get(KHR_TEXTURE_PROCEDURALS_TYPE, None)
-                node_outputs = node.get(KHR_TEXTURE_PROCEDURALS_OUTPUTS_BLOCK, [])
-
-                # Create a new node in the graph
-                mtlx_node = mtlx_graph.addChildOfCategory(node_type, node_name)
-
-                # Check for multiple outputs on the node to use 'multioutput'
-                if len(node_outputs) > 1:
-                    output_type = MULTI_OUTPUT_TYPE_STRING
-                    #mtlx_node.setType(output_type)
-
-                if output_type:
-                    mtlx_node.setType(output_type)
-                else:
-                    self.logger.error(f'> No output type specified for node: {node_name}')
-
-                # Look for other name, value pair children under node. Such as "xpos": "0.086957",
-                # For each add an attribute to the node
-                for key, value in node.items():
-                    if key not in [KHR_TEXTURE_PROCEDURALS_NAME, 'nodetype', KHR_TEXTURE_PROCEDURALS_TYPE, KHR_TEXTURE_PROCEDURALS_INPUTS_BLOCK, KHR_TEXTURE_PROCEDURALS_OUTPUTS_BLOCK]:
-                        self.logger.debug(f'> Add extra node attribute: {key}, {value}')
-                        mtlx_node.setAttribute(key, value)
-
-                # Add node inputs
-                node_inputs = node.get(KHR_TEXTURE_PROCEDURALS_INPUTS_BLOCK, {})
-                for input_name, input_item in node_inputs.items():
-                    if not input_name:
-                        input_name = MTLX_DEFAULT_INPUT_NAME
-                    input_type = input_item.get(KHR_TEXTURE_PROCEDURALS_TYPE, None)
 
-                    # Add node input
-                    mtlx_input = mtlx_node.addInput(input_name, input_type)
-
-                    # If input is a file reference, examines textures and images to retrieve the URI
-                    if input_type == 'filename':
-                        texture_index = input_item.get('texture', None)
-                        if texture_index is not None:
-                            gltf_textures = gltf_doc.get('textures', None)
-                            gltf_images = gltf_doc.get('images', None)
-                            if gltf_textures and gltf_images:
-                                gltftexture = gltf_textures[texture_index] if texture_index < len(gltf_textures) else None
-                                if gltftexture:
-                                    uri = self.get_glTF_texture_uri(gltftexture, gltf_images)
-                                    mtlx_input.setValueString(uri)
-
-                    # If input has a value, set the value
-                    input_value = input_item.get('value', None)
-                    if input_value is not None:
-                        mtlx_value = self.scalar_to_string(input_value, input_type)
-                        if mtlx_value is not None:
-                            mtlx_input.setValueString(mtlx_value)
-                            mtlx_input.setType(input_type)
+                # Check for connections
+                else:
+                    connectable = None
+
+                    # Set any upstream interface input connection
+                    if 'input' in input_item:
+                        # Get 'input' value
+                        input_key = input_item['input']
+                        if input_key in inputs:
+                            connectable = inputs[input_key]
+                            mtlx_input.setAttribute(MTLX_INTERFACEINPUT_NAME_ATTRIBUTE, names.get_name(connectable))
                         else:
-                            self.logger.error(f'> Unsupported input type: {input_type}. Performing straight assignment.')
-                            mtlx_input.setValueString(str(input_value))
+                            diagnostics.error('missing_input', mtlx_input, 'Input key not found: %s', input_key)
 
-                    # Check for connections
-                    else:
-                        connectable = None
-
-                        # Set any upstream interface input connection
-                        if 'input' in input_item:
-                            # Get 'input' value
-                            input_key = input_item['input']
-                            if input_key in inputs:
-                                connectable = inputs[input_key]
-                                mtlx_input.setAttribute(MTLX_INTERFACEINPUT_NAME_ATTRIBUTE, connectable[KHR_TEXTURE_PROCEDURALS_NAME])
-                            else:
-                                self.logger.error(f'Input key not found: {input_key}')
-                        
-                        # Set any upstream node output connection
-                        elif 'output' in input_item:
-                            if 'node' not in input_item:
-                                connectable = outputs[input_item[KHR_TEXTURE_PROCEDURALS_OUTPUT]] if input_item[KHR_TEXTURE_PROCEDURALS_OUTPUT] < len(outputs) else None
-                                mtlx_input.setAttribute('output', connectable[KHR_TEXTURE_PROCEDURALS_NAME])
-
-                        # Set and node connection
-                        if 'node' in input_item:
+                    # Set any upstream node output connection
+                    elif 'output' in input_item:
+                        if 'node' not in input_item:
+                            connectable = outputs[input_item[KHR_TEXTURE_PROCEDURALS_OUTPUT]] if input_item[KHR_TEXTURE_PROCEDURALS_OUTPUT] < len(outputs) else None
+                            mtlx_input.setAttribute('output', names.get_name(connectable))
+
+                    # Set and node connection
+                    if 'node' in input_item:
+                        connectable = nodes[input_item[KHR_TEXTURE_PROCEDURALS_NODE]] if input_item[KHR_TEXTURE_PROCEDURALS_NODE] < len(nodes) else None
+                        mtlx_input.setAttribute(MTLX_NODE_NAME_ATTRIBUTE, names.get_name(connectable))
+
+                        if 'output' in input_item:
+                            # Get the node to connect to
                             connectable = nodes[input_item[KHR_TEXTURE_PROCEDURALS_NODE]] if input_item[KHR_TEXTURE_PROCEDURALS_NODE] < len(nodes) else None
-                            mtlx_input.setAttribute(MTLX_NODE_NAME_ATTRIBUTE, connectable[KHR_TEXTURE_PROCEDURALS_NAME])
-
-                            if 'output' in input_item:
-                                # Get the node to connect to
-                                connectable = nodes[input_item[KHR_TEXTURE_PROCEDURALS_NODE]] if input_item[KHR_TEXTURE_PROCEDURALS_NODE] < len(nodes) else None
-                                if connectable:
-                                    # Get the output name to connect to
-                                    #connected_outputs = connectable.get(KHR_TEXTURE_PROCEDURALS_OUTPUTS_BLOCK, {})
-                                    #if connected_outputs:
-                                    #    output_name = list(connected_outputs.keys())[list(connected_outputs.values()).index(output)]
-                                    #    print(">>> Scan connected outputs:", connected_outputs, "for output:", output_name)
-                                    #    output_string = connected_outputs.get(output_name, "")
-                                    mtlx_input.setAttribute('output', input_item['output'])
-                                    self.logger.debug(f'Set output specifier on input: {mtlx_input.getNamePath()}. Value: {input_item[KHR_TEXTURE_PROCEDURALS_OUTPUT]}')
-
-                    # Add extra metadata to the input
-                    for meta in metadata:
-                        if meta in input_item:
-                            self.logger.debug(f'> Add extra input attribute: {meta}, {input_item[meta]}')
-                            mtlx_input.setAttribute(meta, input_item[meta])
+                            if connectable:
+                                # Get the output name to connect to
+                                #connected_outputs = connectable.get(KHR_TEXTURE_PROCEDURALS_OUTPUTS_BLOCK, {})
+                                #if connected_outputs:
+                                #    output_name = list(connected_outputs.keys())[list(connected_outputs.values()).index(output)]
+                                #    print(">>> Scan connected outputs:", connected_outputs, "for output:", output_name)
+                                #    output_string = connected_outputs.get(output_name, "")
+                                mtlx_input.setAttribute('output', input_item['output'])
+                                diagnostics.debug('set_output', mtlx_input, 'Set output specifier on input. Value: %s', input_item[KHR_TEXTURE_PROCEDURALS_OUTPUT])
 
-                # Add outputs for multioutput nodes
-                if len(node_outputs) > 1:
-                    for output_name, output in node_outputs.items():
-                        output_type = output.get(KHR_TEXTURE_PROCEDURALS_TYPE, None)
-                        mtlxoutput = mtlx_node.addOutput(output_name, output_type)
-                        self.logger.debug(f'Add multioutput output {mtlxoutput.getNamePath()} of type {output_type} to node {node_name}')
+                # Add extra metadata to the input
+                for meta in metadata:
+                    if meta in input_item:
+                        diagnostics.debug('add_attribute', mtlx_input, 'Add extra input attribute: %s, %s', meta, input_item[meta])
+                        mtlx_input.setAttribute(meta, input_item[meta])
 
+            # Add outputs for multioutput nodes
+            if len(node_outputs) > 1:
+                for output_name, output in node_outputs.items():
+                    output_type = output.get(KHR_TEXTURE_PROCEDURALS_TYPE, None)
+                    mtlxoutput = mtlx_node.addOutput(output_name, output_type)
+                    diagnostics.debug('add_output', mtlxoutput, 'Add multioutput output of type %s', output_type)
 
 
-            # Scan for output interfaces in the nodegraph
-            self.logger.info(f'> Scan {len(outputs)} procedural outputs')
-            for output_name, output in outputs.items():
-                #output_name = output.get('name', None)
-                output_type = output.get(KHR_TEXTURE_PROCEDURALS_TYPE, None)
-                mtlx_graph_output = mtlx_graph.addOutput(output_name, output_type)
 
-                connectable = None
+        # Scan for output interfaces in the nodegraph
+        diagnostics.info('scan_outputs', graph_name, 'Scan %d procedural outputs', len(outputs))
+        for output_name, output in outputs.items():
+            #output_name = output.get('name', None)
+            output_type = output.get(KHR_TEXTURE_PROCEDURALS_TYPE, None)
+            mtlx_graph_output = mtlx_graph.addOutput(output_name, output_type)
 
-                # Check for connection to upstream input
-                if 'input' in output:
-                    connectable = inputs[output[KHR_TEXTURE_PROCEDURALS_INPUT]] if output[KHR_TEXTURE_PROCEDURALS_INPUT] < len(inputs) else None
-                    if connectable:
-                        mtlx_graph_output.setAttribute(MTLX_INTERFACEINPUT_NAME_ATTRIBUTE, connectable[KHR_TEXTURE_PROCEDURALS_NAME])
-                    else:
-                        self.logger.error(f'Input not found: {output["input"]}, {inputs}')
-
-                # Check for connection to upstream node output                          
-                elif 'node' in output:
-                    connectable = nodes[output[KHR_TEXTURE_PROCEDURALS_NODE]] if output[KHR_TEXTURE_PROCEDURALS_NODE] < len(nodes) else None
-                    if connectable:
-                        mtlx_graph_output.setAttribute(MTLX_NODE_NAME_ATTRIBUTE, connectable[KHR_TEXTURE_PROCEDURALS_NAME])
-                        if 'output' in output:
-                            mtlx_graph_output.setAttribute('output', output[KHR_TEXTURE_PROCEDURALS_OUTPUT])
-                    else:
-                        self.logger.error(f'> Output node not found: {output["node"]}, {nodes}')
+            connectable = None
 
-                # Add extra metadata to the output
-                for key, value in output.items():
-                    if key not in [KHR_TEXTURE_PROCEDURALS_NAME, KHR_TEXTURE_PROCEDURALS_TYPE, 'nodetype', 'node', 'output']:
-                        self.logger.debug(f'> Add extra graph output attribute: {key}. Value: {value}')
-                        mtlx_graph_output.setAttribute(key, value)
+            # Check for connection to upstream input
+            if 'input' in output:
+                connectable = inputs[output[KHR_TEXTURE_PROCEDURALS_INPUT]] if output[KHR_TEXTURE_PROCEDURALS_INPUT] < len(inputs) else None
+                if connectable:
+                    mtlx_graph_output.setAttribute(MTLX_INTERFACEINPUT_NAME_ATTRIBUTE, names.get_name(connectable))
+                else:
+                    diagnostics.error('missing_input', mtlx_graph_output, 'Input not found: %s, %s', output['input'], inputs)
+
+            # Check for connection to upstream node output                          
+            elif 'node' in output:
+                connectable = nodes[output[KHR_TEXTURE_PROCEDURALS_NODE]] if output[KHR_TEXTURE_PROCEDURALS_NODE] < len(nodes) else None
+                if connectable:
+                    mtlx_graph_output.setAttribute(MTLX_NODE_NAME_ATTRIBUTE, names.get_name(connectable))
+                    if 'output' in output:
+                        mtlx_graph_output.setAttribute('output', output[KHR_TEXTURE_PROCEDURALS_OUTPUT])
+                else:
+                    diagnostics.error('missing_node', mtlx_graph_output, 'Output node not found: %s, %s', output['node'], nodes)
 
-        return root_mtlx
+            # Add extra metadata to the output
+            for key, value in output.items():
+                if key not in [KHR_TEXTURE_PROCEDURALS_NAME, KHR_TEXTURE_PROCEDURALS_TYPE, 'nodetype', 'node', 'output']:
+                    diagnostics.debug('add_attribute', mtlx_graph_output, 'Add extra graph output attribute: %s. Value: %s', key, value)
+                    mtlx_graph_output.setAttribute(key, value)
 
-    def gltf_string_to_materialX(self, gltFDocString, stdlib):
+    def gltf_string_to_materialX(self, gltFDocString, stdlib, selection=None, options=None, diagnostics=None):
         '''
         Convert a glTF document to a MaterialX document.
         @param gltFDocString: The glTF document to import.
         @param stdlib: The MateriaLX standard library to use for the conversion.
+        @param selection: Optional ConversionFilter used to select what to import. Default is None.
+        @param options: Optional ConversionOptions. Default is None meaning the converter's default options.
+        @param diagnostics: Optional Diagnostics collector to record events in. Default is None.
         @return The MaterialX document if successful, otherwise None.
         '''
         gltf_doc = json.loads(gltFDocString)
-        return self.glTF_to_materialX(gltf_doc, stdlib)
+        return self.glTF_to_materialX(gltf_doc, stdlib, selection, options, diagnostics)
 
+class glTFBundleBuilder():
+    '''
+    @brief Class for accumulating the conversion of several MaterialX documents into a single glTF document.
+
+    All documents share a single image and texture table, and a single fallback texture.
+    Procedural graph and material names which collide with names from previously added 
+    documents are made unique. Structurally identical procedural graphs can optionally
+    be shared instead of being added once per document. Custom node definitions are shared
+    if their content and implementations match those of a definition of the same name already
+    added. A document with a definition which differs is reported by a 'definition_conflict'
+    error and is not added, as its instances could not be told apart from those of the first definition.
+    '''
+
+    def __init__(self, converter, share_graphs=False, selection=None, options=None, diagnostics=None):
+        '''
+        Constructor
+
+        **Attributes**
+        - converter : glTFMaterialXConverter
+            - Converter used to convert each MaterialX document.
+
+        - share_graphs : bool
+            - Option to share structurally identical procedural graphs.
+
+        - selection : ConversionFilter
+            - Optional filter used to select what to convert from each document.
+
+        - options : ConversionOptions
+            - Optional options used for each conversion.
+
+        - diagnostics : Diagnostics
+            - Optional collector to record events from each conversion in.
+
+        - json_data : dict
+            - The accumulated glTF JSON object.
+        '''
+        self.converter = converter
+        self.share_graphs = share_graphs
+        self.selection = selection
+        self.options = options
+        self.diagnostics = diagnostics
+        self.json_data = {}
+
+        # Dummy documents used to handle unique name generation
+        self.graph_names = mx.createDocument()
+        self.material_names = mx.createDocument()
+
+        # Lookups used to share images, textures and graphs across documents
+        self.image_indices = {}
+        self.texture_indices = {}
+        self.graph_signatures = {}
+        self.definition_indices = {}
+        self.definition_signatures = {}
+
+    def add_document(self, mtlx_doc):
+        '''
+        Convert a MaterialX document and add the result to the bundle.
+        @param mtlx_doc: The MaterialX document to convert.
+        @return Status message for the conversion.
+        '''
+        json_data, status = self.converter.materialX_to_glTF_data(mtlx_doc, selection=self.selection, options=self.options,
+                                                                  diagnostics=self.diagnostics)
+        if json_data and not self.add_glTF_data(json_data):
+            return 'Node definitions conflict with definitions already in the bundle. Document not added'
+        return status
+
+    def add_glTF_data(self, json_data):
+        '''
+        Add the glTF JSON object produced for a single document to the bundle.
+        The JSON object is modified in place and should not be reused afterwards.
+        @param json_data: The glTF JSON object to add.
+        @return False if a node definition conflicts with a definition of the same name
+        already in the bundle, in which case nothing is added. True otherwise.
+        '''
+        bundle = self.json_data
+
+        # Check that definitions match any definition of the same name before adding anything
+        definitions = json_data.get(KHR_EXTENSIONS_BLOCK, {}).get(KHR_TEXTURE_PROCEDURALS, {}).get(KHR_TEXTURE_PROCEDURALS_DEFINITIONS_BLOCK, [])
+        definition_signatures = self.get_definition_signatures(json_data)
+        for name, signature in definition_signatures.items():
+            if self.definition_signatures.get(name, signature) != signature:
+                diagnostics = self.converter.get_diagnostics(self.diagnostics)
+                diagnostics.error('definition_conflict', name, 'Node definition differs from the definition of the same name '
+                                  'already in the bundle. Document not added')
+                return False
+
+        # Merge images based on URI
+        image_remap = []
+        bundle_images = bundle.setdefault(KHR_IMAGES_BLOCK, [])
+        for image in json_data.get(KHR_IMAGES_BLOCK, []):
+            uri = image.get(KHR_IMAGE_URI)
+            index = self.image_indices.get(uri)
+            if index is None:
+                bundle_images.append(image)
+                index = len(bundle_images) - 1
+                self.image_indices[uri] = index
+            image_remap.append(index)
+
+        # Merge textures which reference the same image
+        texture_remap = []
+        bundle_textures = bundle.setdefault(KHR_TEXTURES_BLOCK, [])
+        for texture in json_data.get(KHR_TEXTURES_BLOCK, []):
+            if KHR_IMAGE_SOURCE in texture:
+                texture[KHR_IMAGE_SOURCE] = image_remap[texture[KHR_IMAGE_SOURCE]]
+            key = json.dumps({k: v for k, v in texture.items() if k != KHR_TEXTURE_PROCEDURALS_NAME}, sort_keys=True)
+            index = self.texture_indices.get(key)
+            if index is None:
+                bundle_textures.append(texture)
+                index = len(bundle_textures) - 1
+                self.texture_indices[key] = index
+            texture_remap.append(index)
+
+        # Merge procedural graphs
+        procedurals = json_data.get(KHR_EXTENSIONS_BLOCK, {}).get(KHR_TEXTURE_PROCEDURALS, {}).get(KHR_TEXTURE_PROCEDURALS_PROCEDURALS_BLOCK, [])
+        bundle_extensions = bundle.setdefault(KHR_EXTENSIONS_BLOCK, {})
+        bundle_procedurals = bundle_extensions.setdefault(KHR_TEXTURE_PROCEDURALS, {}).setdefault(KHR_TEXTURE_PROCEDURALS_PROCEDURALS_BLOCK, [])
+        graph_remap = []
+        for proc in procedurals:
+            self.remap_graph_textures(proc, texture_remap)
+
+            signature = None
+            if self.share_graphs:
+                signature = json.dumps({k: v for k, v in proc.items() if k != KHR_TEXTURE_PROCEDURALS_NAME}, sort_keys=True)
+                index = self.graph_signatures.get(signature)
+                if index is not None:
+                    graph_remap.append(index)
+                    continue
+
+            proc_name = self.graph_names.createValidChildName(proc.get(KHR_TEXTURE_PROCEDURALS_NAME, MTLX_DEFAULT_GRAPH_NAME))
+            self.graph_names.addNodeGraph(proc_name)
+            proc[KHR_TEXTURE_PROCEDURALS_NAME] = proc_name
+            bundle_procedurals.append(proc)
+            graph_remap.append(len(bundle_procedurals) - 1)
+            if signature:
+                self.graph_signatures[signature] = graph_remap[-1]
+
+        # Merge procedural definitions by name, which match in content if already added. 
+        # Implementations are keyed by the name of their definition
+        self.definition_signatures.update(definition_signatures)
+        if definitions:
+            bundle_definitions = bundle_extensions[KHR_TEXTURE_PROCEDURALS].setdefault(KHR_TEXTURE_PROCEDURALS_DEFINITIONS_BLOCK, [])
+            definition_remap = []
+            for definition in definitions:
+                name = definition.get(KHR_TEXTURE_PROCEDURALS_NAME)
+                nodedef_index = definition.get(KHR_TEXTURE_PROCEDURALS_NODEDEF)
+                if isinstance(nodedef_index, int):
+                    name = definitions[nodedef_index].get(KHR_TEXTURE_PROCEDURALS_NAME)
+                    definition[KHR_TEXTURE_PROCEDURALS_NODEDEF] = definition_remap[nodedef_index]
+                key = (definition.get(KHR_TEXTURE_PROCEDURALS_NODETYPE), name)
+                index = self.definition_indices.get(key)
+                if index is None:
+                    self.remap_graph_textures(definition, texture_remap)
+                    bundle_definitions.append(definition)
+                    index = len(bundle_definitions) - 1
+                    self.definition_indices[key] = index
+                definition_remap.append(index)
+
+        # Merge materials
+        materials = json_data.get(KHR_MATERIALS_BLOCK, [])
+        if materials:
+            bundle_materials = bundle.setdefault(KHR_MATERIALS_BLOCK, [])
+            for material in materials:
+                material_name = self.material_names.createValidChildName(material.get(KHR_TEXTURE_PROCEDURALS_NAME, MTLX_DEFAULT_SHADER_NAME))
+                self.material_names.addNode(MTLX_GLTF_PBR_CATEGORY, material_name, mx.SURFACE_SHADER_TYPE_STRING)
+                material[KHR_TEXTURE_PROCEDURALS_NAME] = material_name
+                for texture_info in self.converter.get_material_textures(material):
+                    if KHR_TEXTURE_PROCEDURALS_INDEX in texture_info:
+                        texture_info[KHR_TEXTURE_PROCEDURALS_INDEX] = texture_remap[texture_info[KHR_TEXTURE_PROCEDURALS_INDEX]]
+                    lookup = texture_info.get(KHR_EXTENSIONS_BLOCK, {}).get(KHR_TEXTURE_PROCEDURALS, None)
+                    if lookup and KHR_TEXTURE_PROCEDURALS_INDEX in lookup:
+                        lookup[KHR_TEXTURE_PROCEDURALS_INDEX] = graph_remap[lookup[KHR_TEXTURE_PROCEDURALS_INDEX]]
+                bundle_materials.append(material)
+
+        # Merge asset and extensions used blocks
+        if KHR_ASSET_BLOCK not in bundle and KHR_ASSET_BLOCK in json_data:
+            bundle[KHR_ASSET_BLOCK] = json_data[KHR_ASSET_BLOCK]
+        extensions_used = bundle.setdefault(KHR_EXTENTIONSUSED_BLOCK, [])
+        for ext in json_data.get(KHR_EXTENTIONSUSED_BLOCK, []):
+            if ext not in extensions_used:
+                extensions_used.append(ext)
+        return True
+
+    def get_definition_signatures(self, json_data):
+        '''
+        Get the content signature of each procedural definition in a glTF JSON object. 
+        The signature of a definition covers the definition and its implementations, 
+        with texture references replaced by the textures and images they reference.
+        The names of implementations are ignored.
+        @param json_data: The glTF JSON object.
+        @return Dictionary mapping definition names to signature strings.
+        '''
+        definitions = json_data.get(KHR_EXTENSIONS_BLOCK, {}).get(KHR_TEXTURE_PROCEDURALS, {}).get(KHR_TEXTURE_PROCEDURALS_DEFINITIONS_BLOCK, [])
+        if not definitions:
+            return {}
+
+        images = json_data.get(KHR_IMAGES_BLOCK, [])
+        textures = []
+        for texture in json_data.get(KHR_TEXTURES_BLOCK, []):
+            texture = {k: v for k, v in texture.items() if k != KHR_TEXTURE_PROCEDURALS_NAME}
+            if KHR_IMAGE_SOURCE in texture:
+                texture[KHR_IMAGE_SOURCE] = images[texture[KHR_IMAGE_SOURCE]]
+            textures.append(texture)
+
+        groups = {}
+        for index, definition in enumerate(definitions):
+            definition = copy.deepcopy(definition)
+            nodedef_index = definition.pop(KHR_TEXTURE_PROCEDURALS_NODEDEF, None)
+            if isinstance(nodedef_index, int):
+                definition.pop(KHR_TEXTURE_PROCEDURALS_NAME, None)
+                self.remap_graph_textures(definition, textures)
+                groups[definitions[nodedef_index].get(KHR_TEXTURE_PROCEDURALS_NAME)].append(definition)
+            else:
+                groups[definition.get(KHR_TEXTURE_PROCEDURALS_NAME)] = [definition]
+        return {name: json.dumps(group, sort_keys=True) for name, group in groups.items()}
+
+    def remap_graph_textures(self, proc, texture_remap):
+        '''
+        Remap the texture references of a procedural graph to the bundle texture table.
+        @param proc: The procedural graph to update.
+        @param texture_remap: List mapping source texture indices to bundle texture indices.
+        '''
+        items = list(proc.get(KHR_TEXTURE_PROCEDURALS_INPUTS_BLOCK, {}).values())
+        for node in proc.get(KHR_TEXTURE_PROCEDURALS_NODES_BLOCK, []):
+            items.extend(node.get(KHR_TEXTURE_PROCEDURALS_INPUTS_BLOCK, {}).values())
+        for item in items:
+            if KHR_TEXTURE_PROCEDURALS_TEXTURE in item:
+                item[KHR_TEXTURE_PROCEDURALS_TEXTURE] = texture_remap[item[KHR_TEXTURE_PROCEDURALS_TEXTURE]]
+
+    def get_glTF_data(self):
+        '''
+        Get the accumulated glTF JSON object. Empty image and texture blocks are removed.
+        @return The glTF JSON object. The object is empty if no procedural graphs were added.
+        '''
+        bundle = self.json_data
+        procedurals = bundle.get(KHR_EXTENSIONS_BLOCK, {}).get(KHR_TEXTURE_PROCEDURALS, {}).get(KHR_TEXTURE_PROCEDURALS_PROCEDURALS_BLOCK, [])
+        if not procedurals:
+            return {}
+        for block in [KHR_IMAGES_BLOCK, KHR_TEXTURES_BLOCK]:
+            if not bundle.get(block, None):
+                bundle.pop(block, None)
+        return bundle
+
+    def get_glTF_string(self):
+        '''
+        Get the accumulated glTF document as a JSON string.
+        @return The JSON string. The string is empty if no procedural graphs were added.
+        '''
+        return self.converter.glTF_data_to_string(self.get_glTF_data(), self.options)
@@ -0,0 +1,194 @@
+'''
+@file cost.py
+Static runtime cost estimates for converted procedurals. Each node is weighted by its category or
+by the node group of its definition, so that texture fetches and noise cost more than math. Nodes of
+custom definitions exported with their implementation graph are estimated by that graph. The
+estimates can be checked against a budget of nodes, texture fetches and cost per procedural.
+'''
+import json
+
+## @var DEFAULT_NODE_WEIGHT
+#  @brief Cost of a node whose category and node group are not in the weight table.
+DEFAULT_NODE_WEIGHT = 1.0
+
+## @var DEFAULT_COST_WEIGHTS
+#  @brief Default cost of a node by category or node group. Categories take precedence
+#  over node groups. Costs are relative to a simple math node.
+DEFAULT_COST_WEIGHTS = {
+    # Node groups
+    'texture2d': 8.0,
+    'texture3d': 24.0,
+    'procedural2d': 6.0,
+    'procedural3d': 10.0,
+    'convolution2d': 16.0,
+    'colortransform': 2.0,
+    'adjustment': 2.0,
+    'compositing': 1.0,
+    'conditional': 1.0,
+    'math': 1.0,
+    'channel': 0.5,
+    'geometric': 0.5,
+    'application': 0.5,
+    'procedural': 0.0,
+    'organization': 0.0,
+    # Categories
+    'fractal2d': 20.0,
+    'fractal3d': 30.0,
+    'worleynoise2d': 12.0,
+    'worleynoise3d': 18.0,
+    'unifiednoise2d': 24.0,
+    'unifiednoise3d': 32.0,
+    'hextiledimage': 24.0,
+    'hextilednormalmap': 24.0,
+    'normalmap': 2.0
+}
+
+## @var TEXTURE_NODEGROUPS
+#  @brief Node groups whose nodes fetch from a texture.
+TEXTURE_NODEGROUPS = ('texture2d', 'texture3d')
+
+## @var TEXTURE_FETCH_COUNTS
+#  @brief Number of texture fetches of nodes which fetch more than once.
+TEXTURE_FETCH_COUNTS = {
+    'triplanarprojection': 3,
+    'hextiledimage': 3,
+    'hextilednormalmap': 3
+}
+
+## @var BUDGET_WARN
+#  @brief Budget action which records a warning when a procedural exceeds the budget.
+BUDGET_WARN = 'warn'
+
+## @var BUDGET_FAIL
+#  @brief Budget action which fails the conversion when a procedural exceeds the budget.
+BUDGET_FAIL = 'fail'
+
+## @var BUDGET_ACTIONS
+#  @brief Supported budget actions.
+BUDGET_ACTIONS = (BUDGET_WARN, BUDGET_FAIL)
+
+def load_cost_weights(filename):
+    '''
+    Read a cost weight table. The table is a JSON object mapping node categories or node groups
+    to costs, and is merged over the default weights.
+    @param filename: The JSON file to read.
+    @return The weight table.
+    @throws ValueError if the file does not contain a table of numbers.
+    '''
+    with open(filename, 'r') as f:
+        table = json.load(f)
+    if not isinstance(table, dict) or not all(isinstance(value, (int, float)) for value in table.values()):
+        raise ValueError(f'Cost weights must be a JSON object of numbers: {filename}')
+    weights = dict(DEFAULT_COST_WEIGHTS)
+    weights.update(table)
+    return weights
+
+class CostModel():
+    '''
+    @brief Class estimating the runtime cost of glTF procedurals.
+    '''
+
+    def __init__(self, library, weights=None, definitions=None):
+        '''
+        Constructor
+        @param library: The document used to look up node definitions, such as a working document
+        referencing the standard library.
+        @param weights: Optional weight table. Default is None meaning DEFAULT_COST_WEIGHTS.
+        @param definitions: Optional glTF procedural definitions. Nodes of a definition implemented by 
+        a graph are estimated by their implementation. Default is None.
+        '''
+        self.library = library
+        self.weights = weights if weights is not None else DEFAULT_COST_WEIGHTS
+        self.nodegroups = {}
+
+        # Implementation graphs by node category and type, and by node category alone
+        self.implementations = {}
+        self.implementation_estimates = {}
+        definitions = definitions or []
+        for implementation in definitions:
+            index = implementation.get('nodedef')
+            if isinstance(index, int) and index < len(definitions):
+                nodedef = definitions[index]
+                self.implementations.setdefault((nodedef.get('node'), nodedef.get('type')), implementation)
+                self.implementations.setdefault(nodedef.get('node'), implementation)
+
+    def get_nodegroup(self, category):
+        '''
+        Get the node group of a node category. Lookups are cached.
+        @param category: The node category.
+        @return The node group, or an empty string if no definition is found.
+        '''
+        nodegroup = self.nodegroups.get(category)
+        if nodegroup is None:
+            nodedefs = self.library.getMatchingNodeDefs(category) if self.library else []
+            nodegroup = nodedefs[0].getNodeGroup() if nodedefs else ''
+            self.nodegroups[category] = nodegroup
+        return nodegroup
+
+    def get_node_cost(self, category):
+        '''
+        Get the cost and number of texture fetches of a node.
+        @param category: The node category.
+        @return The cost and the number of texture fetches.
+        '''
+        nodegroup = self.get_nodegroup(category)
+        cost = self.weights.get(category, self.weights.get(nodegroup, DEFAULT_NODE_WEIGHT))
+        fetches = 0
+        if nodegroup in TEXTURE_NODEGROUPS:
+            fetches = TEXTURE_FETCH_COUNTS.get(category, 1)
+        return cost, fetches
+
+    def get_implementation_estimate(self, node):
+        '''
+        Get the estimate of the implementation graph of a node whose definition is implemented by a graph.
+        Each implementation is estimated once.
+        @param node: The glTF node JSON object.
+        @return The estimate of the implementation, or None if the node has no implementation graph.
+        '''
+        category = node.get('nodetype', '')
+        implementation = self.implementations.get((category, node.get('type')), self.implementations.get(category))
+        if implementation is None:
+            return None
+        key = id(implementation)
+        if key not in self.implementation_estimates:
+            # An implementation which uses its own definition is estimated by the weights of its nodes
+            self.implementation_estimates[key] = None
+            self.implementation_estimates[key] = self.estimate_procedural(implementation)
+        return self.implementation_estimates[key]
+
+    def estimate_procedural(self, procedural):
+        '''
+        Estimate the cost of a procedural. A node whose definition is implemented by a graph counts 
+        the nodes, texture fetches and cost of its implementation instead of the weight of the node.
+        @param procedural: The glTF procedural JSON object.
+        @return Dictionary with the procedural 'name', number of 'nodes', number of 'texture_fetches'
+        and estimated 'cost'.
+        '''
+        estimate = {'name': procedural.get('name', ''), 'nodes': 0, 'texture_fetches': 0, 'cost': 0.0}
+        for node in procedural.get('nodes', []):
+            implementation = self.get_implementation_estimate(node)
+            if implementation:
+                estimate['nodes'] += implementation['nodes']
+                estimate['texture_fetches'] += implementation['texture_fetches']
+                estimate['cost'] += implementation['cost']
+                continue
+            cost, fetches = self.get_node_cost(node.get('nodetype', ''))
+            estimate['nodes'] += 1
+            estimate['texture_fetches'] += fetches
+            estimate['cost'] += cost
+        return estimate
+
+def check_budget(estimate, max_nodes=0, max_texture_fetches=0, max_cost=0.0):
+    '''
+    Check a cost estimate against a budget. A limit of 0 is not checked.
+    @param estimate: The estimate. See CostModel.estimate_procedural().
+    @param max_nodes: Maximum number of nodes. Default is 0.
+    @param max_texture_fetches: Maximum number of texture fetches. Default is 0.
+    @param max_cost: Maximum estimated cost. Default is 0.
+    @return List of descriptions of the limits exceeded. Empty if the estimate is within budget.
+    '''
+    exceeded = []
+    for key, limit in [('nodes', max_nodes), ('texture_fetches', max_texture_fetches), ('cost', max_cost)]:
+        if limit and estimate[key] > limit:
+            exceeded.append(f"{key.replace('_', ' ')} {estimate[key]:g} > {limit:g}")
+    return exceeded
@@ -0,0 +1,166 @@
+'''
+@file dependencies.py
+This module contains the dependency table used for incremental conversion of MaterialX documents.
+The table records the files each document was built from, including any XIncluded files,
+and the outputs written for it. It is stored as JSON next to the outputs.
+'''
+import os
+import json
+
+try:
+    from . import utilities as MxGLTFPTUtil
+except ImportError:
+    import utilities as MxGLTFPTUtil
+
+## @var DEPENDENCIES_FILE
+#  @brief Name of the dependency table file written to the output folder.
+DEPENDENCIES_FILE = 'mtlx_dependencies.json'
+
+## @var DEPENDENCIES_VERSION
+#  @brief Version of the dependency table format. Tables with a different version are discarded.
+DEPENDENCIES_VERSION = 1
+
+def get_file_signature(filename):
+    '''
+    Get the signature of a file used to detect changes.
+    @param filename: The file.
+    @return List of [modification time, size, content hash], or None if the file cannot be read.
+    '''
+    try:
+        stat = os.stat(filename)
+        return [stat.st_mtime_ns, stat.st_size, MxGLTFPTUtil.get_file_hash(filename)]
+    except OSError:
+        return None
+
+class DependencyTable():
+    '''
+    @brief Class recording the input files and outputs of each converted document.
+
+    A document is up to date if none of its inputs changed since it was converted and all its
+    outputs exist. An input is unchanged if its modification time and size are unchanged, or
+    failing that if its content hash is unchanged. Documents are keyed by absolute path.
+    '''
+
+    def __init__(self, settings=None):
+        '''
+        Constructor
+        @param settings: Dictionary of settings which affect the outputs. A stored table
+        with different settings is discarded when loaded. Default is None.
+
+        **Attributes**
+        - documents : dict
+            - For each document, a dictionary with the signature of each input file under 'inputs',
+            and the list of output files under 'outputs'.
+        '''
+        self.settings = settings if settings else {}
+        self.documents = {}
+
+    def load(self, filename):
+        '''
+        Load a stored table. Nothing is loaded if the file does not exist, cannot be read,
+        or was stored with different settings.
+        @param filename: The file to load.
+        @return True if the table was loaded.
+        '''
+        try:
+            with open(filename, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if data.get('version') != DEPENDENCIES_VERSION or data.get('settings') != self.settings:
+            return False
+        self.documents = data.get('documents', {})
+        return True
+
+    def save(self, filename):
+        '''
+        Store the table.
+        @param filename: The file to write.
+        '''
+        data = {
+            'version': DEPENDENCIES_VERSION,
+            'settings': self.settings,
+            'documents': self.documents
+        }
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent=2)
+
+    def set_document(self, document, includes, outputs, succeeded=True):
+        '''
+        Record the inputs and outputs of a converted document.
+        @param document: The document file.
+        @param includes: The files included by the document.
+        @param outputs: The output files written for the document.
+        @param succeeded: False if the conversion failed, in which case the document is 
+        never considered up to date. Default is True.
+        '''
+        inputs = {}
+        for filename in [document] + list(includes):
+            filename = os.path.abspath(filename)
+            inputs[filename] = get_file_signature(filename)
+        self.documents[os.path.abspath(document)] = {
+            'inputs': inputs,
+            'outputs': [os.path.abspath(output) for output in outputs],
+            'succeeded': succeeded
+        }
+
+    def remove_document(self, document):
+        '''
+        Remove a document from the table.
+        @param document: The document file.
+        @return The output files recorded for the document.
+        '''
+        entry = self.documents.pop(os.path.abspath(document), None)
+        return entry['outputs'] if entry else []
+
+    def get_includes(self, document):
+        '''
+        Get the files included by a document.
+        @param document: The document file.
+        @return List of included files.
+        '''
+        document = os.path.abspath(document)
+        entry = self.documents.get(document, {})
+        return [filename for filename in entry.get('inputs', {}) if filename != document]
+
+    def get_dependents(self, filename):
+        '''
+        Get the documents which were built from a file.
+        @param filename: The input file.
+        @return Sorted list of documents which read the file, including the file itself if it is a document.
+        '''
+        filename = os.path.abspath(filename)
+        return sorted(document for document, entry in self.documents.items() if filename in entry['inputs'])
+
+    def is_up_to_date(self, document):
+        '''
+        Check if a document needs to be converted.
+        @param document: The document file.
+        @return True if the document was converted before, none of its inputs changed and all its outputs exist.
+        '''
+        entry = self.documents.get(os.path.abspath(document))
+        if not entry or not entry.get('succeeded'):
+            return False
+
+        for output in entry['outputs']:
+            if not os.path.exists(output):
+                return False
+
+        for filename, signature in entry['inputs'].items():
+            if signature is None:
+                if os.path.exists(filename):
+                    return False
+                continue
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                return False
+            if stat.st_mtime_ns == signature[0] and stat.st_size == signature[1]:
+                continue
+            if MxGLTFPTUtil.get_file_hash(filename) != signature[2]:
+                return False
+
+            # Content is unchanged, so only the timestamps need updating
+            signature[0] = stat.st_mtime_ns
+            signature[1] = stat.st_size
+        return True
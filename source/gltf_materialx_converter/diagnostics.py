@@ -0,0 +1,196 @@
+'''
+@file diagnostics.py
+This module contains the diagnostics collector used to record events during conversion.
+'''
+import logging as lg
+
+## @var DEBUG
+#  @brief Severity of debugging events. Matches the logging module level.
+DEBUG = lg.DEBUG
+
+## @var INFO
+#  @brief Severity of informational events. Matches the logging module level.
+INFO = lg.INFO
+
+## @var WARNING
+#  @brief Severity of warning events. Matches the logging module level.
+WARNING = lg.WARNING
+
+## @var ERROR
+#  @brief Severity of error events. Matches the logging module level.
+ERROR = lg.ERROR
+
+class DiagnosticEvent():
+    '''
+    @brief A single diagnostic event. Message formatting and element path lookup
+    are deferred until requested.
+    '''
+    __slots__ = ('severity', 'code', 'path', 'message', 'args')
+
+    def __init__(self, severity, code, path, message, args):
+        '''
+        Constructor
+        @param severity: The event severity.
+        @param code: Short identifier for the kind of event. e.g. 'missing_nodedef'
+        @param path: The element path as a string, or a MaterialX element whose path is looked up on demand.
+        @param message: The message format string using '%' style formatting.
+        @param args: The message arguments.
+        '''
+        self.severity = severity
+        self.code = code
+        self.path = path
+        self.message = message
+        self.args = args
+
+    def get_path(self):
+        '''
+        Get the path of the element the event is for.
+        @return The path string. Empty if there is no path.
+        '''
+        if self.path is None:
+            return ''
+        if isinstance(self.path, str):
+            return self.path
+        return self.path.getNamePath()
+
+    def get_message(self):
+        '''
+        Get the formatted event message.
+        @return The message string.
+        '''
+        if self.args:
+            return self.message % self.args
+        return self.message
+
+    def get_severity_name(self):
+        '''
+        Get the name of the event severity.
+        @return The severity name. e.g. 'WARNING'
+        '''
+        return lg.getLevelName(self.severity)
+
+    def to_dict(self):
+        '''
+        Get the event as a dictionary suitable for JSON output.
+        @return The event dictionary.
+        '''
+        return { 'severity': self.get_severity_name(), 'code': self.code,
+                 'path': self.get_path(), 'message': self.get_message() }
+
+    def __str__(self):
+        path = self.get_path()
+        if path:
+            return f'[{self.code}] {path}: {self.get_message()}'
+        return f'[{self.code}] {self.get_message()}'
+
+class Diagnostics():
+    '''
+    @brief Collector for events recorded during a conversion.
+
+    Events below the collector's severity level are discarded without being created.
+    Events which are kept are stored unformatted. Logging is opt-in: events are only
+    forwarded to a logger if one is specified.
+
+    A collector is not thread safe and should be used for a single conversion call
+    or by a single thread.
+    '''
+
+    def __init__(self, level=INFO, logger=None):
+        '''
+        Constructor
+        @param level: The minimum severity of events to keep. Default is INFO.
+        @param logger: Optional logger to forward events to as they are recorded. Default is None.
+
+        **Attributes**
+        - events : list of DiagnosticEvent
+            - The recorded events in order.
+
+        - counts : dict
+            - Number of events recorded per code, including those below the severity level.
+            Debugging events are only counted if they are kept.
+        '''
+        self.level = level
+        self.logger = logger
+        self.events = []
+        self.counts = {}
+
+    def is_enabled(self, severity):
+        '''
+        Check if events of a given severity are kept. Can be used to skip
+        work needed only to build event arguments.
+        @param severity: The severity to check.
+        @return True if events of the given severity are kept.
+        '''
+        return severity >= self.level
+
+    def record(self, severity, code, path, message, *args):
+        '''
+        Record an event.
+        @param severity: The event severity.
+        @param code: Short identifier for the kind of event.
+        @param path: The element path string or MaterialX element. Can be None.
+        @param message: The message format string using '%' style formatting.
+        @param args: The message arguments. These are only formatted on demand.
+        '''
+        self.counts[code] = self.counts.get(code, 0) + 1
+        if severity < self.level:
+            return
+        event = DiagnosticEvent(severity, code, path, message, args)
+        self.events.append(event)
+        if self.logger and self.logger.isEnabledFor(severity):
+            self.logger.log(severity, '> %s', event)
+
+    def debug(self, code, path, message, *args):
+        '''
+        Record a debugging event. See record().
+        '''
+        if self.level <= DEBUG:
+            self.record(DEBUG, code, path, message, *args)
+
+    def info(self, code, path, message, *args):
+        '''
+        Record an informational event. See record().
+        '''
+        self.record(INFO, code, path, message, *args)
+
+    def warning(self, code, path, message, *args):
+        '''
+        Record a warning event. See record().
+        '''
+        self.record(WARNING, code, path, message, *args)
+
+    def error(self, code, path, message, *args):
+        '''
+        Record an error event. See record().
+        '''
+        self.record(ERROR, code, path, message, *args)
+
+    def get_events(self, severity=DEBUG):
+        '''
+        Get the recorded events of at least a given severity.
+        @param severity: The minimum severity. Default is DEBUG meaning all recorded events.
+        @return List of events.
+        '''
+        return [event for event in self.events if event.severity >= severity]
+
+    def has_errors(self):
+        '''
+        Check if any errors were recorded.
+        @return True if any errors were recorded.
+        '''
+        return any(event.severity >= ERROR for event in self.events)
+
+    def clear(self):
+        '''
+        Remove all recorded events and counts.
+        '''
+        self.events = []
+        self.counts = {}
+
+    def to_list(self, severity=DEBUG):
+        '''
+        Get the recorded events as a list of dictionaries suitable for JSON output.
+        @param severity: The minimum severity. Default is DEBUG meaning all recorded events.
+        @return List of event dictionaries.
+        '''
+        return [event.to_dict() for event in self.get_events(severity)]
@@ -2,27 +2,92 @@
 @file gltf_to_materialx.py
 Command line utility to convert from glTF Texture Procedurals documents to MaterialX documents".
 '''
-import os, argparse
+import os, sys, argparse
 import json
 import MaterialX as mx
 import logging as lg 
 import converter as MxGLTFPT
 import utilities as MxGLTFPTUtil
+import diagnostics as MxGLTFPTDiag
+import jobs as MxGLTFPTJobs
+import watch as MxGLTFPTWatch
+import manifest as MxGLTFPTManifest
+import report as MxGLTFPTReport
+import tracing as MxGLTFPTTrace
+import shadergen as MxGLTFPTShaderGen
+import batch as MxGLTFPTBatch
 
 def main():
     parser = argparse.ArgumentParser(description="Converter from glTF Texture Procedurals to MaterialX")
-    parser.add_argument(dest="input", help="Input file/folder.")
+    parser.add_argument(dest="input", nargs='?', help="Input file/folder.")
     parser.add_argument("-o", "--output", help="Output file/folder. Default is current folder.")
     parser.add_argument("-a", "--addAssetInfo", type=bool, default=False, help="Add glTF asset information to generated MaterialX files.")
+    parser.add_argument('--elideDefaults', action='store_true', help='Leave node input values which equal the node definition default implicit. Default is False.')
+    parser.add_argument('--material', action='append', default=None, help='Name or glob pattern of materials to import. Can be specified multiple times. The default is all materials unless other include options are given.')
+    parser.add_argument('--shader', action='append', default=None, help='Name or glob pattern of shaders to import. Can be specified multiple times. The default is all shaders unless other include options are given.')
+    parser.add_argument('--nodegraph', action='append', default=None, help='Name or glob pattern of node graphs to import. Can be specified multiple times. The default is all node graphs.')
+    parser.add_argument('--excludeMaterial', action='append', default=None, help='Name or glob pattern of materials to skip. Can be specified multiple times.')
+    parser.add_argument('--excludeShader', action='append', default=None, help='Name or glob pattern of shaders to skip. Can be specified multiple times.')
+    parser.add_argument('--excludeNodegraph', action='append', default=None, help='Name or glob pattern of node graphs to skip. Can be specified multiple times.')
+    parser.add_argument('--shaderGen', default=None, choices=tuple(MxGLTFPTShaderGen.SHADERGEN_TARGETS), help='Generate shaders for each converted material with the given generator, reporting source size, uniform count and generation time. Results are compared with those of the original MaterialX file next to the glTF file if it exists. Default is None.')
+    parser.add_argument('--sizeTolerance', type=float, default=MxGLTFPTShaderGen.DEFAULT_SIZE_TOLERANCE, help=f'Fraction by which generated shader source can grow compared to the original MaterialX file before it is reported as a regression. Default is {MxGLTFPTShaderGen.DEFAULT_SIZE_TOLERANCE}.')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only report conversion warnings and errors. Default is False.')
+    parser.add_argument('--stdio', action='store_true', help='Read newline-delimited JSON conversion requests from stdin and write one JSON result line per request to stdout. Default is False.')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of worker processes to convert files or --stdio requests with. Default is 1 meaning to convert in this process unless --maxJobs or --memoryBudget is given.')
+    parser.add_argument('--maxPending', type=int, default=0, help='Maximum number of files or --stdio requests in flight in worker processes. Default is twice the number of workers.')
+    parser.add_argument('--maxJobs', type=int, default=0, help='Number of files or --stdio requests a worker process converts before being replaced. Default is 0 meaning no limit.')
+    parser.add_argument('--memoryBudget', type=float, default=0, help='Worker process memory (RSS) in MB above which a worker is replaced. Default is 0 meaning no limit.')
+    parser.add_argument('--memoryStats', action='store_true', help='Return the memory used by each --stdio request and log a memory summary when done, and trace the Python memory allocated by each file in the run report. Default is False.')
+    parser.add_argument('--watch', action='store_true', help='Keep running and reconvert input files as they change. Outputs of deleted files are removed. Default is False.')
+    parser.add_argument('--debounce', type=float, default=0.3, help='Time in seconds without further changes before reconverting when watching. Default is 0.3.')
+    parser.add_argument('--shard', default=None, help='Only convert the files of shard index/count, for example 0/4. Files are assigned to shards by a hash of their relative path. Default is all files.')
+    parser.add_argument('--manifest', default=None, help='JSON file to write the result of converting each file to. Manifests of shards can be combined with merge-manifests. Default is None.')
+    parser.add_argument('--trace', default=None, help='Chrome trace event JSON file to write spans for library loading and each phase of converting each file to. Can be opened in Perfetto or chrome://tracing. Default is None.')
+    parser.add_argument('--report', default=None, help='JSON file to write a run report to after each batch, with per file timings, sizes and counts, throughput and latency percentiles. Default is None.')
     opts = parser.parse_args()
     
     logger = lg.getLogger('gltfCmd')
     lg.basicConfig(level=lg.INFO)  
 
+    if opts.trace:
+        MxGLTFPTTrace.start_tracing()
+
+    selection = MxGLTFPT.ConversionFilter(opts.material, opts.shader, opts.nodegraph,
+                                          opts.excludeMaterial, opts.excludeShader, opts.excludeNodegraph)
+
+    # Run requests from stdin
+    if opts.stdio:
+        with MxGLTFPTTrace.span('load_libraries', 'library'):
+            stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+        converter = MxGLTFPT.glTFMaterialXConverter(MxGLTFPT.ConversionOptions(elide_defaults=opts.elideDefaults))
+        converter.set_add_asset_info(opts.addAssetInfo)
+        runner = MxGLTFPTJobs.ConversionJobRunner(stdlib, converter, selection=selection, track_memory=opts.memoryStats)
+        summary = MxGLTFPTJobs.BatchSummary()
+        MxGLTFPTJobs.run_ndjson_stream(sys.stdin, sys.stdout, runner, opts.workers, opts.maxPending, MxGLTFPTJobs.GLTF_TO_MTLX,
+                                       opts.maxJobs, int(opts.memoryBudget * 1024 * 1024), summary)
+        if opts.memoryStats:
+            for line in summary.get_report():
+                logger.info(line)
+        if opts.trace:
+            MxGLTFPTTrace.get_recorder().save(opts.trace)
+        return
+
+    if not opts.input:
+        parser.error('No input file/folder specified.')
+
+    shard_index, shard_count = 0, 1
+    if opts.shard:
+        try:
+            shard_index, shard_count = MxGLTFPTManifest.parse_shard(opts.shard)
+        except ValueError as e:
+            parser.error(str(e))
+    if opts.watch and (opts.shard or opts.manifest):
+        parser.error('--shard and --manifest cannot be used with --watch.')
+
     fileList = []
     extension = '.gltf'
     if os.path.isdir(opts.input): 
-        fileList = MxGLTFPTUtil.getFiles(opts.input, extension)
+        fileList = MxGLTFPTUtil.get_files(opts.input, extension)
     else:
         extension = os.path.splitext(opts.input)[1]
         if extension not in ['.gltf']:
@@ -30,13 +95,33 @@ def main():
             return
         fileList.append(opts.input)
 
+    totalFiles = len(fileList)
+    if opts.shard:
+        fileList = MxGLTFPTManifest.select_shard(fileList, shard_index, shard_count)
+        logger.info(f'Shard {opts.shard}: {len(fileList)} of {totalFiles} files')
+    manifest = MxGLTFPTManifest.ConversionManifest(shard_index, shard_count, totalFiles)
+
+    if not fileList and opts.manifest:
+        manifest.save(opts.manifest)
     if not fileList:
         logger.warning(f'No glTF files found: {opts.input}')
-        return
+        if not opts.watch:
+            return
     
-    stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+    # Record the starting state of the files to watch before converting them
+    watcher = None
+    if opts.watch:
+        watcher = MxGLTFPTWatch.FileWatcher([opts.input], extension, debounce=opts.debounce)
 
-    converter = MxGLTFPT.glTFMaterialXConverter()
+    with MxGLTFPTTrace.span('load_libraries', 'library'):
+        stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+
+    converter = MxGLTFPT.glTFMaterialXConverter(MxGLTFPT.ConversionOptions(elide_defaults=opts.elideDefaults))
+    shader_checker = None
+    if opts.shaderGen:
+        with MxGLTFPTTrace.span('create_shader_generator', 'library'):
+            shader_checker = MxGLTFPTShaderGen.ShaderGenChecker(stdlib, opts.shaderGen)
+    diagnostics = MxGLTFPTDiag.Diagnostics(MxGLTFPTDiag.WARNING if opts.quiet else MxGLTFPTDiag.INFO, converter.logger)
 
     # Check for output folder option
     outputFolder = '.'
@@ -48,23 +133,37 @@ def main():
     logger.info(f'Add glTF asset information: {opts.addAssetInfo}')
     converter.set_add_asset_info(opts.addAssetInfo)
 
-    for inputFile in fileList:
-        logger.info(f'Processing: {inputFile}')
-        jsonString = MxGLTFPTUtil.load_json_file(inputFile)
-        if jsonString:
-            mtlxdoc = converter.gltf_string_to_materialX(jsonString, stdlib)
-            # Validate
-            valid, status = MxGLTFPTUtil.validate_document(mtlxdoc)
-            mtlxString = MxGLTFPTUtil.materialX_doc_to_string(mtlxdoc)
-            
-            if not valid:
-                logger.warning(f'Created invalid MaterialX document. Error: {status}')
-            outputFileMtlx = inputFile.replace('.gltf', '_fromgltf.mtlx')
-            with open(outputFileMtlx, 'w') as f:
-                logger.info(f'Writing re-converted mtlx: {outputFileMtlx}')
-                f.write(mtlxString)
-        else:
-            logger.warning(f'Unable to load glTF file: {inputFile}')
+    # Files are converted in worker processes when a worker count or limit is given
+    runner = MxGLTFPTBatch.glTFFileRunner(converter, stdlib, selection, shader_checker, opts.sizeTolerance,
+                                          diagnostics, logger, opts.memoryStats)
+    pool = MxGLTFPTBatch.get_worker_pool(runner, opts.workers, opts.maxJobs, int(opts.memoryBudget * 1024 * 1024))
+
+    def convert_changes(changed, deleted):
+        report = MxGLTFPTReport.RunReport('gltf_to_materialx')
+        for inputFile in deleted:
+            logger.info(f'Removed: {inputFile}')
+            MxGLTFPTBatch.remove_files([MxGLTFPTBatch.get_materialX_output_file(inputFile)], logger)
+        for inputFile, result in MxGLTFPTBatch.run_file_batch(changed, runner, pool, opts.maxPending):
+            manifest.add_entry(inputFile, result['outputs'], result['status'], result['time'])
+            report.add_file(inputFile, result['status'], result['outputs'], result['statistics'], result['time'])
+        if opts.report:
+            report.save(opts.report)
+            logger.info(f'Wrote run report: {opts.report}')
+        if opts.trace:
+            MxGLTFPTTrace.get_recorder().save(opts.trace)
+
+    convert_changes(fileList, [])
+
+    if opts.manifest:
+        manifest.save(opts.manifest)
+        logger.info(f'Wrote manifest: {opts.manifest}')
+
+    # Reconvert files as they change
+    if watcher:
+        logger.info('Watching for changes. Press Ctrl+C to stop.')
+        watcher.watch(convert_changes)
+    if pool:
+        pool.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
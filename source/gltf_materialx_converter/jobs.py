@@ -0,0 +1,594 @@
+'''
+@file jobs.py
+This module contains the job runner used to run individual conversion requests with a warm
+converter and standard library. It is shared by the conversion server and the batch modes of the
+command line utilities.
+'''
+import os
+import sys
+import json
+import time
+import tracemalloc
+import collections
+import multiprocessing
+import multiprocessing.connection
+import MaterialX as mx
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    from . import converter as MxGLTFPT
+    from . import utilities as MxGLTFPTUtil
+    from . import diagnostics as MxGLTFPTDiag
+    from . import tracing as MxGLTFPTTrace
+except ImportError:
+    import converter as MxGLTFPT
+    import utilities as MxGLTFPTUtil
+    import diagnostics as MxGLTFPTDiag
+    import tracing as MxGLTFPTTrace
+
+## @var MTLX_TO_GLTF
+#  @brief Request direction for conversion from MaterialX to glTF.
+MTLX_TO_GLTF = 'mtlx2gltf'
+
+## @var GLTF_TO_MTLX
+#  @brief Request direction for conversion from glTF to MaterialX.
+GLTF_TO_MTLX = 'gltf2mtlx'
+
+def get_memory_usage():
+    '''
+    Get the memory used by this process.
+    @return The current and peak resident set size (RSS) in bytes. The current size is the peak size 
+    if it cannot be determined, and both are 0 if neither can.
+    '''
+    peak_rss = 0
+    if resource:
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Reported in kilobytes except on macOS
+        if sys.platform != 'darwin':
+            peak_rss *= 1024
+
+    rss = 0
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            rss = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    return (rss if rss else peak_rss), max(rss, peak_rss)
+
+class ConversionJobRunner():
+    '''
+    @brief Class for running conversion requests using a single converter and standard library.
+
+    A request is a dictionary with the following keys:
+    - direction : Either 'mtlx2gltf' or 'gltf2mtlx'.
+    - document : The input document as a string. A glTF document may also be given as a JSON object.
+    - path : The input file path. Used if no document is given.
+    - output : Optional output file path. If not given the converted document is returned in the result.
+    - options : Optional dictionary of ConversionOptions values.
+    - selection : Optional dictionary of ConversionFilter arguments.
+    - id : Optional identifier which is returned in the result.
+
+    The result is a dictionary with the following keys:
+    - id : The request identifier if specified.
+    - status : 'ok' or 'error'.
+    - message : The conversion status message.
+    - document : The converted document if no output path was given.
+    - output : The output file path if one was given.
+    - diagnostics : List of diagnostic events recorded during the conversion.
+    - time : The time taken to run the request in seconds.
+    - memory : If memory tracking is enabled, a dictionary with the process RSS after the request
+      ('rss'), the peak process RSS ('peak_rss'), and the Python memory allocated by the request 
+      ('allocated') and at its peak ('peak_allocated'), all in bytes. Python allocations are traced
+      with tracemalloc, which does not see memory allocated by MaterialX itself.
+    '''
+
+    def __init__(self, stdlib=None, converter=None, diagnostics_level=MxGLTFPTDiag.WARNING, selection=None, track_memory=False):
+        '''
+        Constructor
+        @param stdlib: The standard library to use. Default is None meaning to load the standard libraries.
+        @param converter: The converter to use. Default is None meaning to create a new converter.
+        @param diagnostics_level: The minimum severity of diagnostic events to return. Default is WARNING.
+        @param selection: The ConversionFilter to use for requests which do not specify a selection. Default is None.
+        @param track_memory: Return the memory used by each request. Tracing Python allocations slows 
+        down conversion. Default is False.
+        '''
+        if stdlib is None:
+            stdlib, lib_files = MxGLTFPTUtil.load_standard_libraries()
+        self.stdlib = stdlib
+        self.converter = converter if converter else MxGLTFPT.glTFMaterialXConverter()
+        self.diagnostics_level = diagnostics_level
+        self.selection = selection
+        self.track_memory = track_memory
+
+    def get_options(self, request):
+        '''
+        Get the conversion options for a request.
+        @param request: The request.
+        @return The ConversionOptions to use.
+        '''
+        options = request.get('options')
+        if not options:
+            return self.converter.options
+        return self.converter.options.replace(**options)
+
+    def get_selection(self, request):
+        '''
+        Get the conversion filter for a request.
+        @param request: The request.
+        @return The ConversionFilter to use, or None if no selection is specified.
+        '''
+        selection = request.get('selection')
+        if not selection:
+            return self.selection
+        return MxGLTFPT.ConversionFilter(**selection)
+
+    def write_output(self, output_file, output_string):
+        '''
+        Write a converted document to file, creating the parent folder if needed.
+        @param output_file: The file to write.
+        @param output_string: The converted document.
+        '''
+        output_folder = os.path.dirname(output_file)
+        if output_folder and not os.path.exists(output_folder):
+            os.makedirs(output_folder, exist_ok=True)
+        with MxGLTFPTTrace.span('write', 'phase'), open(output_file, 'w') as f:
+            f.write(output_string)
+
+    def run_materialX_to_glTF(self, request, options, selection, diagnostics):
+        '''
+        Run a conversion request from MaterialX to glTF.
+        @param request: The request.
+        @param options: The ConversionOptions to use.
+        @param selection: The ConversionFilter to use. Can be None.
+        @param diagnostics: The Diagnostics collector to use.
+        @return The glTF JSON string and status message.
+        '''
+        with MxGLTFPTTrace.span('read', 'phase'):
+            mxdoc = MxGLTFPTUtil.create_reference_document(self.stdlib)
+            document = request.get('document')
+            if document is not None:
+                mx.readFromXmlString(mxdoc, document)
+            else:
+                MxGLTFPTUtil.read_materialX_document(mxdoc, request['path'])
+
+        with MxGLTFPTTrace.span('validate', 'phase'):
+            valid, errors = MxGLTFPTUtil.validate_document(mxdoc)
+        if not valid:
+            return None, 'Invalid MaterialX document. Errors: ' + errors
+
+        with MxGLTFPTTrace.span('convert', 'phase'):
+            return self.converter.materialX_to_glTF(mxdoc, selection, options, diagnostics)
+
+    def run_glTF_to_materialX(self, request, options, selection, diagnostics):
+        '''
+        Run a conversion request from glTF to MaterialX.
+        @param request: The request.
+        @param options: The ConversionOptions to use.
+        @param selection: The ConversionFilter to use. Can be None.
+        @param diagnostics: The Diagnostics collector to use.
+        @return The MaterialX XML string and status message.
+        '''
+        with MxGLTFPTTrace.span('read', 'phase'):
+            document = request.get('document')
+            if document is None:
+                with open(request['path'], 'r') as f:
+                    gltf_doc = json.load(f)
+            elif isinstance(document, str):
+                gltf_doc = json.loads(document)
+            else:
+                gltf_doc = document
+
+        with MxGLTFPTTrace.span('convert', 'phase'):
+            mtlxdoc = self.converter.glTF_to_materialX(gltf_doc, self.stdlib, selection, options, diagnostics)
+        if not mtlxdoc:
+            return None, 'Failed to convert glTF document'
+
+        status = ''
+        mtlxdoc.setDataLibrary(self.stdlib)
+        with MxGLTFPTTrace.span('validate', 'phase'):
+            valid, errors = MxGLTFPTUtil.validate_document(mtlxdoc)
+        if not valid:
+            status = 'Created invalid MaterialX document. Errors: ' + errors
+        with MxGLTFPTTrace.span('serialize', 'phase'):
+            return MxGLTFPTUtil.materialX_doc_to_string(mtlxdoc), status
+
+    def run(self, request):
+        '''
+        Run a conversion request. Errors are returned in the result rather than raised.
+        @param request: The request dictionary.
+        @return The result dictionary.
+        '''
+        start_time = time.perf_counter()
+        result = {}
+        if isinstance(request, dict) and 'id' in request:
+            result['id'] = request['id']
+
+        if self.track_memory:
+            # Started on first use so that each forked worker traces its own allocations
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            start_allocated = tracemalloc.get_traced_memory()[0]
+
+        diagnostics = MxGLTFPTDiag.Diagnostics(self.diagnostics_level)
+        request_span = MxGLTFPTTrace.begin_span('request', 'request', id=result.get('id'),
+                                                path=request.get('path') if isinstance(request, dict) else None)
+        try:
+            if not isinstance(request, dict):
+                raise ValueError('Request must be a JSON object')
+            if request.get('document') is None and not request.get('path'):
+                raise ValueError('Request must specify a document or a path')
+
+            options = self.get_options(request)
+            selection = self.get_selection(request)
+            direction = request.get('direction')
+            if direction == MTLX_TO_GLTF:
+                output_string, message = self.run_materialX_to_glTF(request, options, selection, diagnostics)
+            elif direction == GLTF_TO_MTLX:
+                output_string, message = self.run_glTF_to_materialX(request, options, selection, diagnostics)
+            else:
+                raise ValueError(f'Unknown conversion direction: {direction}')
+
+            result['status'] = 'ok' if output_string else 'error'
+            result['message'] = message
+            if output_string:
+                output_file = request.get('output')
+                if output_file:
+                    self.write_output(output_file, output_string)
+                    result['output'] = output_file
+                else:
+                    result['document'] = output_string
+
+        except Exception as e:
+            result['status'] = 'error'
+            result['message'] = f'{type(e).__name__}: {e}'
+
+        request_span.end()
+        result['diagnostics'] = diagnostics.to_list()
+        result['time'] = time.perf_counter() - start_time
+        if self.track_memory:
+            allocated, peak_allocated = tracemalloc.get_traced_memory()
+            rss, peak_rss = get_memory_usage()
+            result['memory'] = {
+                'rss': rss,
+                'peak_rss': peak_rss,
+                'allocated': allocated - start_allocated,
+                'peak_allocated': peak_allocated - start_allocated
+            }
+        return result
+
+def _run_worker_loop(connection, runner, max_jobs, memory_budget):
+    '''
+    Worker process loop. Runs the requests received on a connection, sending back each result 
+    with the process RSS, whether the worker is exiting to be recycled, and the trace events
+    recorded for the request if tracing is enabled.
+    @param connection: The connection to the parent process. A None request stops the worker.
+    @param runner: The ConversionJobRunner to use.
+    @param max_jobs: Number of requests to run before exiting. Zero means no limit.
+    @param memory_budget: RSS in bytes above which to exit. Zero means no limit.
+    '''
+    recorder = MxGLTFPTTrace.get_recorder()
+    if recorder:
+        # Drop the events inherited from the parent
+        recorder.take_events()
+        recorder.set_process_name(f'worker {os.getpid()}')
+
+    jobs = 0
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            break
+        if request is None:
+            break
+        result = runner.run(request)
+        jobs += 1
+        rss, peak_rss = get_memory_usage()
+        recycle = (max_jobs > 0 and jobs >= max_jobs) or (memory_budget > 0 and rss >= memory_budget)
+        connection.send((result, rss, recycle, recorder.take_events() if recorder else None))
+        if recycle:
+            break
+    connection.close()
+
+class ConversionWorkerPool():
+    '''
+    @brief Pool of forked worker processes which run conversion requests.
+
+    The workers share the runner's standard library copy-on-write. A worker exits after running
+    a maximum number of requests, or once its resident set size (RSS) exceeds a memory budget,
+    and is replaced by a new worker forked from the parent. This keeps the memory used by long 
+    batch runs bounded. A worker which dies while running a request, for instance because it was 
+    killed for running out of memory, is replaced and the request returns an error result.
+    Requires a platform which supports fork().
+    '''
+
+    def __init__(self, runner, workers=2, max_jobs=0, memory_budget=0):
+        '''
+        Constructor. The workers are started when the first request is submitted.
+        @param runner: The ConversionJobRunner to use, or any object with a run(request) method 
+        which returns a result dictionary.
+        @param workers: Number of worker processes. Default is 2.
+        @param max_jobs: Number of requests a worker runs before being replaced. Default is 0 meaning no limit.
+        @param memory_budget: Worker RSS in bytes above which the worker is replaced. Default is 0 meaning no limit.
+
+        **Attributes**
+        - recycled : int
+            - Number of workers replaced.
+
+        - peak_rss : dict
+            - The highest RSS seen after a request for each worker process id.
+        '''
+        self.runner = runner
+        self.worker_count = max(1, workers)
+        self.max_jobs = max_jobs
+        self.memory_budget = memory_budget
+        self.workers = []
+        self.queue = collections.deque()
+        self.results = {}
+        self.next_ticket = 0
+        self.recycled = 0
+        self.peak_rss = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def spawn_worker(self):
+        '''
+        Fork a new worker process.
+        @return Dictionary with the worker process, the connection to it, and the request it is running.
+        '''
+        context = multiprocessing.get_context('fork')
+        connection, child_connection = context.Pipe()
+        process = context.Process(target=_run_worker_loop, daemon=True,
+                                  args=(child_connection, self.runner, self.max_jobs, self.memory_budget))
+        process.start()
+        child_connection.close()
+        return {'process': process, 'connection': connection, 'ticket': None, 'request': None}
+
+    def submit(self, request):
+        '''
+        Queue a request to run.
+        @param request: The request dictionary.
+        @return A ticket to get the result with.
+        '''
+        if not self.workers:
+            self.workers = [self.spawn_worker() for i in range(self.worker_count)]
+        ticket = self.next_ticket
+        self.next_ticket += 1
+        self.queue.append((ticket, request))
+        self.dispatch()
+        return ticket
+
+    def dispatch(self):
+        '''
+        Send queued requests to idle workers.
+        '''
+        for worker in self.workers:
+            if not self.queue:
+                break
+            if worker['ticket'] is None:
+                worker['ticket'], worker['request'] = self.queue.popleft()
+                worker['connection'].send(worker['request'])
+
+    def replace_worker(self, worker):
+        '''
+        Wait for a worker to exit and fork its replacement.
+        @param worker: The worker to replace.
+        @return The new worker.
+        '''
+        worker['connection'].close()
+        worker['process'].join(timeout=10)
+        if worker['process'].is_alive():
+            worker['process'].kill()
+            worker['process'].join()
+        self.recycled += 1
+        return self.spawn_worker()
+
+    def collect(self):
+        '''
+        Wait for at least one running request to finish, and store its result.
+        '''
+        busy = {worker['connection']: index for index, worker in enumerate(self.workers) if worker['ticket'] is not None}
+        for connection in multiprocessing.connection.wait(list(busy)):
+            index = busy[connection]
+            worker = self.workers[index]
+            try:
+                result, rss, recycle, events = connection.recv()
+                pid = worker['process'].pid
+                self.peak_rss[pid] = max(self.peak_rss.get(pid, 0), rss)
+                if events and MxGLTFPTTrace.get_recorder():
+                    MxGLTFPTTrace.get_recorder().add_events(events)
+            except (EOFError, OSError):
+                result = {'status': 'error', 'message': 'Worker process exited while running the request'}
+                if isinstance(worker['request'], dict) and 'id' in worker['request']:
+                    result['id'] = worker['request']['id']
+                recycle = True
+            self.results[worker['ticket']] = result
+            worker['ticket'] = worker['request'] = None
+            if recycle:
+                self.workers[index] = self.replace_worker(worker)
+        self.dispatch()
+
+    def get_result(self, ticket):
+        '''
+        Wait for the result of a request.
+        @param ticket: The ticket returned when the request was submitted.
+        @return The result dictionary.
+        '''
+        while ticket not in self.results:
+            self.collect()
+        return self.results.pop(ticket)
+
+    def close(self):
+        '''
+        Stop all workers.
+        '''
+        for worker in self.workers:
+            try:
+                worker['connection'].send(None)
+            except OSError:
+                pass
+        for worker in self.workers:
+            worker['process'].join()
+            worker['connection'].close()
+        self.workers = []
+
+class BatchSummary():
+    '''
+    @brief Class which gathers statistics over the results of a batch of requests.
+    '''
+
+    def __init__(self):
+        '''
+        Constructor
+
+        **Attributes**
+        - requests : int
+            - Number of requests run.
+
+        - errors : int
+            - Number of requests which failed.
+
+        - recycled : int
+            - Number of workers replaced.
+
+        - peak_rss : dict
+            - The highest RSS seen for each worker process id.
+
+        - memory : list
+            - The request path or identifier and the memory dictionary for each request 
+            run with memory tracking.
+        '''
+        self.requests = 0
+        self.errors = 0
+        self.recycled = 0
+        self.peak_rss = {}
+        self.memory = []
+
+    def add_result(self, result, request=None):
+        '''
+        Add the result of a request.
+        @param result: The result dictionary.
+        @param request: The request dictionary. Default is None.
+        '''
+        self.requests += 1
+        if result.get('status') != 'ok':
+            self.errors += 1
+        memory = result.get('memory')
+        if memory:
+            label = request.get('path') if isinstance(request, dict) else None
+            if not label:
+                label = f"request {result.get('id', self.requests)}"
+            self.memory.append((label, memory))
+
+    def get_report(self, top=5):
+        '''
+        Get a report of the batch.
+        @param top: Number of requests with the largest peak allocations to list. Default is 5.
+        @return List of report lines.
+        '''
+        megabyte = 1024 * 1024
+        lines = [f'Requests: {self.requests}, errors: {self.errors}, workers recycled: {self.recycled}']
+        if self.peak_rss:
+            lines.append(f'Peak worker RSS: {max(self.peak_rss.values()) / megabyte:.1f} MB over {len(self.peak_rss)} workers')
+        if self.memory:
+            allocated = sum(memory['allocated'] for label, memory in self.memory)
+            lines.append(f'Python memory retained across requests: {allocated / megabyte:.2f} MB')
+            lines.append('Largest peak allocations:')
+            for label, memory in sorted(self.memory, key=lambda item: item[1]['peak_allocated'], reverse=True)[:top]:
+                lines.append(f"- {label}: peak {memory['peak_allocated'] / megabyte:.2f} MB, "
+                             f"retained {memory['allocated'] / megabyte:.2f} MB, RSS {memory['rss'] / megabyte:.1f} MB")
+        return lines
+
+def parse_request_line(line, direction=None):
+    '''
+    Parse a newline-delimited JSON request.
+    @param line: The request line.
+    @param direction: Direction to use if the request does not specify one. Default is None.
+    @return The request dictionary and an error result dictionary. The request is None if 
+    the line is not a valid request, otherwise the error result is None.
+    '''
+    try:
+        request = json.loads(line)
+    except ValueError as e:
+        return None, {'status': 'error', 'message': f'Invalid JSON request: {e}'}
+    if not isinstance(request, dict):
+        return None, {'status': 'error', 'message': 'Request must be a JSON object'}
+    if direction and 'direction' not in request:
+        request['direction'] = direction
+    return request, None
+
+def run_ndjson_stream(input_stream, output_stream, runner, workers=1, max_pending=0, direction=None,
+                      max_jobs=0, memory_budget=0, summary=None):
+    '''
+    Run newline-delimited JSON requests read from a stream, writing one JSON result line
+    per request in request order. 
+
+    With more than one worker, or if a worker job or memory limit is given, requests are run by 
+    a ConversionWorkerPool of forked processes which share the runner's standard library. At most max_pending requests are in flight: further
+    requests are not read until the oldest result is written, so memory stays bounded when 
+    requests arrive faster than they are converted.
+    @param input_stream: Text stream to read requests from.
+    @param output_stream: Text stream to write results to.
+    @param runner: The ConversionJobRunner to use.
+    @param workers: Number of worker processes. Default is 1 meaning to run requests in this process 
+    unless a worker limit is given.
+    @param max_pending: Maximum number of requests in flight. Default is 0 meaning twice the number of workers.
+    @param direction: Direction to use for requests which do not specify one. Default is None.
+    @param max_jobs: Number of requests a worker runs before being replaced. Default is 0 meaning no limit.
+    @param memory_budget: Worker RSS in bytes above which the worker is replaced. Default is 0 meaning no limit.
+    @param summary: Optional BatchSummary to add the results to. Default is None.
+    @return The number of requests run.
+    '''
+    def write_result(result, request):
+        output_stream.write(json.dumps(result) + '\n')
+        output_stream.flush()
+        if summary:
+            summary.add_result(result, request)
+
+    count = 0
+    if workers <= 1 and max_jobs <= 0 and memory_budget <= 0:
+        for line in input_stream:
+            if not line.strip():
+                continue
+            request, error = parse_request_line(line, direction)
+            write_result(error if error else runner.run(request), request)
+            count += 1
+        if summary:
+            summary.peak_rss[os.getpid()] = get_memory_usage()[1]
+        return count
+
+    if max_pending <= 0:
+        max_pending = 2 * workers
+
+    pending = collections.deque()
+    with ConversionWorkerPool(runner, workers, max_jobs, memory_budget) as pool:
+        def write_oldest():
+            request, item = pending.popleft()
+            write_result(item if isinstance(item, dict) else pool.get_result(item), request)
+
+        for line in input_stream:
+            if not line.strip():
+                continue
+            request, error = parse_request_line(line, direction)
+            pending.append((request, error if error else pool.submit(request)))
+            count += 1
+
+            # Wait for the oldest request before reading more
+            while len(pending) >= max_pending:
+                write_oldest()
+
+        while pending:
+            write_oldest()
+
+        if summary:
+            summary.recycled += pool.recycled
+            summary.peak_rss.update(pool.peak_rss)
+    return count
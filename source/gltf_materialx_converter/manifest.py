@@ -0,0 +1,231 @@
+'''
+@file manifest.py
+Sharding of batch conversions across processes or machines, and the result manifests written
+by each shard. A file is assigned to a shard by a hash of its path relative to the common folder
+of all discovered files, so every shard computes the same partition independently. The manifests
+of all shards can be merged into a single report which detects missing shards and duplicated or
+missing outputs.
+'''
+import os
+import sys
+import json
+import hashlib
+import argparse
+import logging as lg
+
+try:
+    from . import utilities as MxGLTFPTUtil
+except ImportError:
+    import utilities as MxGLTFPTUtil
+
+## @var MANIFEST_VERSION
+#  @brief Version of the manifest format.
+MANIFEST_VERSION = 1
+
+def parse_shard(shard):
+    '''
+    Parse a shard specification.
+    @param shard: Shard string of the form 'index/count', with index starting at 0.
+    @return The shard index and count.
+    @throws ValueError if the specification is not valid.
+    '''
+    try:
+        index, count = (int(value) for value in shard.split('/'))
+    except (ValueError, AttributeError):
+        raise ValueError(f'Invalid shard: {shard}. Shard must be of the form index/count.')
+    if count < 1 or index < 0 or index >= count:
+        raise ValueError(f'Invalid shard: {shard}. Index must be from 0 to count - 1.')
+    return index, count
+
+def get_shard(key, count):
+    '''
+    Get the shard a file is assigned to.
+    @param key: The file key, typically its relative path.
+    @param count: The number of shards.
+    @return The shard index.
+    '''
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big') % count
+
+def select_shard(file_list, index, count):
+    '''
+    Select the files assigned to a shard. Files are keyed by their path relative to the common
+    folder of all files, so the partition does not depend on where the files are located.
+    @param file_list: All the files to convert.
+    @param index: The shard index.
+    @param count: The number of shards.
+    @return The files assigned to the shard, in their original order.
+    '''
+    if count <= 1 or not file_list:
+        return list(file_list)
+    paths = [os.path.abspath(file_name) for file_name in file_list]
+    root = os.path.commonpath([os.path.dirname(path) for path in paths])
+    return [file_name for file_name, path in zip(file_list, paths)
+            if get_shard(os.path.relpath(path, root).replace(os.sep, '/'), count) == index]
+
+class ConversionManifest():
+    '''
+    @brief Class recording the result of converting each file of a batch.
+
+    Each entry is a dictionary with the following keys:
+    - input : The input file.
+    - input_hash : Hash of the input file content.
+    - outputs : The output files written.
+    - status : 'ok', 'up_to_date', 'invalid' or 'failed'.
+    - time : The time taken in seconds.
+    '''
+
+    def __init__(self, shard_index=0, shard_count=1, total_files=0):
+        '''
+        Constructor
+        @param shard_index: The index of the shard the manifest is for. Default is 0.
+        @param shard_count: The number of shards. Default is 1.
+        @param total_files: The number of files discovered over all shards. Default is 0.
+        '''
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.total_files = total_files
+        self.entries = []
+
+    def add_entry(self, input_file, outputs, status, time):
+        '''
+        Record the result of converting a file.
+        @param input_file: The input file.
+        @param outputs: The output files written.
+        @param status: The conversion status.
+        @param time: The time taken in seconds.
+        @return The entry.
+        '''
+        try:
+            input_hash = MxGLTFPTUtil.get_file_hash(input_file)
+        except OSError:
+            input_hash = None
+        entry = {
+            'input': os.path.normpath(input_file),
+            'input_hash': input_hash,
+            'outputs': [os.path.normpath(output) for output in outputs],
+            'status': status,
+            'time': time
+        }
+        self.entries.append(entry)
+        return entry
+
+    def to_dict(self):
+        '''
+        Get the manifest as a dictionary.
+        @return The manifest dictionary.
+        '''
+        return {
+            'version': MANIFEST_VERSION,
+            'shard': [self.shard_index, self.shard_count],
+            'total_files': self.total_files,
+            'entries': self.entries
+        }
+
+    def save(self, filename):
+        '''
+        Write the manifest as JSON.
+        @param filename: The file to write.
+        '''
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def load(self, filename):
+        '''
+        Read a manifest written by save().
+        @param filename: The file to read.
+        @throws ValueError if the file is not a manifest of a supported version.
+        '''
+        with open(filename, 'r') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get('version') != MANIFEST_VERSION:
+            raise ValueError(f'Unsupported manifest: {filename}')
+        self.shard_index, self.shard_count = data['shard']
+        self.total_files = data.get('total_files', 0)
+        self.entries = data.get('entries', [])
+
+def merge_manifests(manifests, check_outputs=False):
+    '''
+    Merge the manifests of the shards of a batch into a single report.
+    @param manifests: List of ConversionManifest.
+    @param check_outputs: Check that the outputs of successful conversions exist. Default is False.
+    @return The report dictionary. Its 'complete' value is False if any shard or file is
+    missing, or any input or output is duplicated.
+    '''
+    shard_counts = sorted(set(manifest.shard_count for manifest in manifests))
+    shard_count = shard_counts[-1] if shard_counts else 0
+    shard_indices = [manifest.shard_index for manifest in manifests]
+    total_files = max([manifest.total_files for manifest in manifests], default=0)
+
+    entries = []
+    inputs = {}
+    outputs = {}
+    status = {}
+    for manifest in manifests:
+        for entry in manifest.entries:
+            entries.append(entry)
+            inputs.setdefault(entry['input'], []).append(manifest.shard_index)
+            for output in entry['outputs']:
+                outputs.setdefault(output, []).append(entry['input'])
+            status[entry['status']] = status.get(entry['status'], 0) + 1
+
+    report = {
+        'shard_count': shard_count,
+        'inconsistent_shard_counts': shard_counts if len(shard_counts) > 1 else [],
+        'missing_shards': sorted(set(range(shard_count)) - set(shard_indices)),
+        'duplicated_shards': sorted(set(index for index in shard_indices if shard_indices.count(index) > 1)),
+        'total_files': total_files,
+        'files': len(inputs),
+        'status': status,
+        'time': sum(entry['time'] for entry in entries),
+        'duplicated_inputs': sorted(name for name, shards in inputs.items() if len(shards) > 1),
+        'duplicated_outputs': {name: sources for name, sources in sorted(outputs.items()) if len(sources) > 1},
+        'missing_outputs': []
+    }
+    if check_outputs:
+        report['missing_outputs'] = sorted(output for entry in entries if entry['status'] in ('ok', 'up_to_date')
+                                           for output in entry['outputs'] if not os.path.exists(output))
+    report['complete'] = not (report['inconsistent_shard_counts'] or report['missing_shards'] or
+                              report['duplicated_shards'] or report['duplicated_inputs'] or
+                              report['duplicated_outputs'] or report['missing_outputs'] or
+                              report['files'] != total_files)
+    report['entries'] = entries
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge the result manifests of sharded conversions into one report.")
+    parser.add_argument(dest="manifests", nargs='+', help="Manifest files written by each shard with --manifest.")
+    parser.add_argument('-o', '--output', default=None, help='File to write the merged report to as JSON.')
+    parser.add_argument('--checkOutputs', action='store_true', help='Check that the outputs of successful conversions exist. Default is False.')
+    opts = parser.parse_args()
+
+    logger = lg.getLogger('manifestCmd')
+    lg.basicConfig(level=lg.INFO)
+
+    manifests = []
+    for manifest_file in opts.manifests:
+        manifest = ConversionManifest()
+        try:
+            manifest.load(manifest_file)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f'Unable to read manifest: {manifest_file}. Error: {e}')
+            sys.exit(1)
+        manifests.append(manifest)
+
+    report = merge_manifests(manifests, opts.checkOutputs)
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    logger.info(f"Merged {len(manifests)} of {report['shard_count']} shards: {report['files']} of {report['total_files']} files, " +
+                ', '.join(f'{count} {status}' for status, count in sorted(report['status'].items())))
+    for key in ['inconsistent_shard_counts', 'missing_shards', 'duplicated_shards', 'duplicated_inputs', 'duplicated_outputs', 'missing_outputs']:
+        if report[key]:
+            logger.warning(f"{key.replace('_', ' ').capitalize()}: {', '.join(str(item) for item in report[key])}")
+    if report['files'] != report['total_files']:
+        logger.warning(f"Files converted: {report['files']}, files discovered: {report['total_files']}")
+    if not report['complete']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -5,49 +5,174 @@ Command line utility to convert from MaterialX documents to glTF Texture Procedu
 import os
 import argparse
 import sys
+import copy
 import logging as lg 
 
 import json
-import jsonschema
-from jsonschema import validate as json_validate
-
 import MaterialX as mx
 
 import converter as MxGLTFPT
 import utilities as MxGLTFPTUtil
+import diagnostics as MxGLTFPTDiag
+import jobs as MxGLTFPTJobs
+import watch as MxGLTFPTWatch
+import dependencies as MxGLTFPTDeps
+import manifest as MxGLTFPTManifest
+import report as MxGLTFPTReport
+import tracing as MxGLTFPTTrace
+import optimize as MxGLTFPTOptimize
+import cost as MxGLTFPTCost
+import bake as MxGLTFPTBake
+import batch as MxGLTFPTBatch
+
+def get_input_files(input_paths, extension):
+    '''
+    Get the files to convert.
+    @param input_paths: List of files and / or folders.
+    @param extension: The extension of files to convert in folders.
+    @return The list of files which exist.
+    '''
+    file_list = []
+    for input_path in input_paths:
+        if os.path.isdir(input_path): 
+            file_list.extend(MxGLTFPTUtil.get_files(input_path, extension))
+        elif os.path.isfile(input_path):
+            file_list.append(input_path)
+    return file_list
 
 def main():
     parser = argparse.ArgumentParser(description="Conveter from MaterialX to glTF Texture Procedurals.")
-    parser.add_argument(dest="input", help="Input file/folder.")
+    parser.add_argument(dest="input", nargs='*', help="Input files/folders.")
     parser.add_argument("-o", "--output", help="Output file/folder. The default is current folder.")
     parser.add_argument('-s', '--schema', default=None, help='Schema file to use for validation. The default is None.')
+    parser.add_argument('-b', '--bundle', default=None, help='Convert all input documents into a single glTF file with the given name. The default is None.')
+    parser.add_argument('--shareGraphs', action='store_true', help='Share structurally identical procedural graphs when bundling. Default is False.')
+    parser.add_argument('--splitMaterials', action='store_true', help='Write a separate glTF file per material named <input>_<material>.gltf. Default is False.')
+    parser.add_argument('--material', action='append', default=None, help='Name or glob pattern of materials to convert. Can be specified multiple times. The default is all materials unless other include options are given.')
+    parser.add_argument('--shader', action='append', default=None, help='Name or glob pattern of shaders to convert. Can be specified multiple times. The default is all shaders unless other include options are given.')
+    parser.add_argument('--nodegraph', action='append', default=None, help='Name or glob pattern of node graphs to convert. Can be specified multiple times. The default is all node graphs.')
+    parser.add_argument('--excludeMaterial', action='append', default=None, help='Name or glob pattern of materials to skip. Can be specified multiple times.')
+    parser.add_argument('--excludeShader', action='append', default=None, help='Name or glob pattern of shaders to skip. Can be specified multiple times.')
+    parser.add_argument('--excludeNodegraph', action='append', default=None, help='Name or glob pattern of node graphs to skip. Can be specified multiple times.')
+    parser.add_argument('--optimize', action='append', default=None, choices=MxGLTFPTOptimize.OPTIMIZE_PASSES + ('all',), help='Optimization pass to run on node graphs before export. Can be specified multiple times. "all" runs all passes. The default is no passes.')
+    parser.add_argument('--elideDefaults', action='store_true', help='Leave node input values which equal the node definition default implicit. Default is False.')
+    parser.add_argument('--profile', default=MxGLTFPT.EXPORT_PROFILE_AUTHORING, choices=tuple(MxGLTFPT.EXPORT_PROFILES), help='Export profile. "authoring" keeps all metadata and writes indented JSON. "delivery" drops editor metadata such as documentation, UI hints and layout, writes compact JSON and rounds floats to 6 decimal places. Default is authoring.')
+    parser.add_argument('--floatPrecision', type=int, default=None, help='Number of decimal places to round floats in the glTF JSON to. Overrides the precision of the profile. Default is the profile precision.')
+    parser.add_argument('--costWeights', default=None, help='JSON file mapping node categories or node groups to costs, used to estimate the runtime cost of each procedural. Default is the built-in weights.')
+    parser.add_argument('--maxNodes', type=int, default=0, help='Maximum number of nodes per procedural. Default is 0 meaning no limit.')
+    parser.add_argument('--maxTextureFetches', type=int, default=0, help='Maximum number of texture fetches per procedural. Default is 0 meaning no limit.')
+    parser.add_argument('--maxCost', type=float, default=0, help='Maximum estimated cost per procedural. Default is 0 meaning no limit.')
+    parser.add_argument('--budgetAction', default=MxGLTFPTCost.BUDGET_WARN, choices=MxGLTFPTCost.BUDGET_ACTIONS, help='Action when a procedural exceeds a budget limit. "warn" logs a warning and "fail" fails the conversion of the document. Default is warn.')
+    parser.add_argument('--bakeFallbacks', action='store_true', help='Bake the procedural output used by each material input into its fallback texture, for viewers without procedural texture support. Requires NumPy. Default is False.')
+    parser.add_argument('--bakeResolution', type=int, default=MxGLTFPTBake.DEFAULT_BAKE_RESOLUTION, help=f'Width and height of baked fallback textures. Default is {MxGLTFPTBake.DEFAULT_BAKE_RESOLUTION}.')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only report conversion warnings and errors. Default is False.')
+    parser.add_argument('--stdio', action='store_true', help='Read newline-delimited JSON conversion requests from stdin and write one JSON result line per request to stdout. Default is False.')
+    parser.add_argument('-w', '--workers', type=int, default=1, help='Number of worker processes to convert files or --stdio requests with. Default is 1 meaning to convert in this process unless --maxJobs or --memoryBudget is given.')
+    parser.add_argument('--maxPending', type=int, default=0, help='Maximum number of files or --stdio requests in flight in worker processes. Default is twice the number of workers.')
+    parser.add_argument('--maxJobs', type=int, default=0, help='Number of files or --stdio requests a worker process converts before being replaced. Default is 0 meaning no limit.')
+    parser.add_argument('--memoryBudget', type=float, default=0, help='Worker process memory (RSS) in MB above which a worker is replaced. Default is 0 meaning no limit.')
+    parser.add_argument('--memoryStats', action='store_true', help='Return the memory used by each --stdio request and log a memory summary when done, and trace the Python memory allocated by each file in the run report. Default is False.')
+    parser.add_argument('--incremental', action='store_true', help='Only convert documents whose content or included files changed since the last conversion into the output folder. Default is False.')
+    parser.add_argument('--watch', action='store_true', help='Keep running and reconvert input files as they change. Outputs of deleted files are removed. Default is False.')
+    parser.add_argument('--debounce', type=float, default=0.3, help='Time in seconds without further changes before reconverting when watching. Default is 0.3.')
+    parser.add_argument('--shard', default=None, help='Only convert the files of shard index/count, for example 0/4. Files are assigned to shards by a hash of their relative path. Default is all files.')
+    parser.add_argument('--manifest', default=None, help='JSON file to write the result of converting each file to. Manifests of shards can be combined with merge-manifests. Default is None.')
+    parser.add_argument('--trace', default=None, help='Chrome trace event JSON file to write spans for library loading and each phase of converting each file to. Can be opened in Perfetto or chrome://tracing. Default is None.')
+    parser.add_argument('--report', default=None, help='JSON file to write a run report to after each batch, with per file timings, sizes and counts, throughput and latency percentiles. Default is None.')
     opts = parser.parse_args()
     
     logger = lg.getLogger('gltfCmd')
     lg.basicConfig(level=lg.INFO)  
 
+    if opts.trace:
+        MxGLTFPTTrace.start_tracing()
+
     if not MxGLTFPTUtil.have_version(1, 39, 1):
         logger.error("MaterialX version 1.39.1 or higher is required.")
         sys.exit(-1)
 
-    file_list = []
+    selection = MxGLTFPT.ConversionFilter(opts.material, opts.shader, opts.nodegraph,
+                                          opts.excludeMaterial, opts.excludeShader, opts.excludeNodegraph)
+
+    optimize = []
+    for name in (opts.optimize or []):
+        for pass_name in (MxGLTFPTOptimize.OPTIMIZE_PASSES if name == 'all' else [name]):
+            if pass_name not in optimize:
+                optimize.append(pass_name)
+    options = MxGLTFPT.ConversionOptions(optimize=tuple(optimize), elide_defaults=opts.elideDefaults).with_profile(opts.profile)
+    if opts.floatPrecision is not None:
+        options = options.replace(float_precision=opts.floatPrecision)
+    cost_weights = None
+    if opts.costWeights:
+        try:
+            cost_weights = MxGLTFPTCost.load_cost_weights(opts.costWeights)
+        except (OSError, ValueError) as e:
+            parser.error(f'Unable to read cost weights: {e}')
+    if opts.bakeFallbacks and not MxGLTFPTBake.have_numpy():
+        parser.error('--bakeFallbacks requires NumPy.')
+    options = options.replace(bake_fallbacks=opts.bakeFallbacks, bake_resolution=opts.bakeResolution)
+    options = options.replace(cost_weights=cost_weights, max_nodes=opts.maxNodes, max_texture_fetches=opts.maxTextureFetches,
+                              max_cost=opts.maxCost, budget_action=opts.budgetAction)
+    converter = MxGLTFPT.glTFMaterialXConverter(options)
+
+    # Run requests from stdin
+    if opts.stdio:
+        with MxGLTFPTTrace.span('load_libraries', 'library'):
+            stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+        runner = MxGLTFPTJobs.ConversionJobRunner(stdlib, converter, selection=selection, track_memory=opts.memoryStats)
+        summary = MxGLTFPTJobs.BatchSummary()
+        MxGLTFPTJobs.run_ndjson_stream(sys.stdin, sys.stdout, runner, opts.workers, opts.maxPending, MxGLTFPTJobs.MTLX_TO_GLTF,
+                                       opts.maxJobs, int(opts.memoryBudget * 1024 * 1024), summary)
+        if opts.memoryStats:
+            for line in summary.get_report():
+                logger.info(line)
+        if opts.trace:
+            MxGLTFPTTrace.get_recorder().save(opts.trace)
+        return
+
+    if not opts.input:
+        parser.error('No input files/folders specified.')
+
+    shard_index, shard_count = 0, 1
+    if opts.shard:
+        try:
+            shard_index, shard_count = MxGLTFPTManifest.parse_shard(opts.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        if opts.bundle:
+            parser.error('--shard cannot be used with --bundle.')
+    if opts.watch and (opts.shard or opts.manifest):
+        parser.error('--shard and --manifest cannot be used with --watch.')
+
     extension = '.mtlx'
-    if os.path.isdir(opts.input): 
-        file_list = MxGLTFPTUtil.get_files(opts.input, extension)
-    else:
-        extension = os.path.splitext(opts.input)[1]
-        if extension not in ['.mtlx']:
-            logger.error(f'Invalid file extension: {extension}. Extension must be .mtlx.')
+    for input_path in opts.input:
+        if not os.path.isdir(input_path) and os.path.splitext(input_path)[1] != extension:
+            logger.error(f'Invalid file extension: {os.path.splitext(input_path)[1]}. Extension must be .mtlx.')
             return
-        file_list.append(opts.input)
 
+    file_list = get_input_files(opts.input, extension)
+    total_files = len(file_list)
+    if opts.shard:
+        file_list = MxGLTFPTManifest.select_shard(file_list, shard_index, shard_count)
+        logger.info(f'Shard {opts.shard}: {len(file_list)} of {total_files} files')
+    manifest = MxGLTFPTManifest.ConversionManifest(shard_index, shard_count, total_files)
+
+    if not file_list and opts.manifest:
+        manifest.save(opts.manifest)
     if not file_list:
         logger.warning(f'No MaterialX files found in: {opts.input}')
-        return
+        if not opts.watch:
+            return
     
-    stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+    # Record the starting state of the files to watch before converting them
+    watcher = None
+    if opts.watch:
+        watcher = MxGLTFPTWatch.FileWatcher(opts.input, extension, debounce=opts.debounce)
+
+    with MxGLTFPTTrace.span('load_libraries', 'library'):
+        stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
 
-    converter = MxGLTFPT.glTFMaterialXConverter()
+    diagnostics = MxGLTFPTDiag.Diagnostics(MxGLTFPTDiag.WARNING if opts.quiet else MxGLTFPTDiag.INFO, converter.logger)
 
     # Check for output folder option
     output_folder = '.'
@@ -64,35 +189,120 @@ def main():
             schema = json.load(f)
         logger.info(f'Loaded schema file: {schema_file}')
 
-    for input_file in file_list:
-        logger.info(f'Processing: {input_file}')
-        mxdoc = MxGLTFPTUtil.create_working_document([stdlib])    
-        MxGLTFPTUtil.read_materialX_document(mxdoc, input_file)
-        valid, errors = MxGLTFPTUtil.validate_document(mxdoc)
+    # Inputs and outputs per document. Stored in the output folder for incremental conversion.
+    # Any setting which affects the outputs invalidates a stored table.
+    settings = {
+        'materialx': mx.__version__,
+        'output': os.path.abspath(output_folder),
+        'schema': schema_file,
+        'bundle': opts.bundle,
+        'shareGraphs': opts.shareGraphs,
+        'splitMaterials': opts.splitMaterials,
+        'selection': [opts.material, opts.shader, opts.nodegraph, opts.excludeMaterial, opts.excludeShader, opts.excludeNodegraph],
+        'shard': opts.shard,
+        'optimize': optimize,
+        'elideDefaults': opts.elideDefaults,
+        'profile': opts.profile,
+        'floatPrecision': opts.floatPrecision,
+        'costWeights': cost_weights,
+        'budget': [opts.maxNodes, opts.maxTextureFetches, opts.maxCost, opts.budgetAction],
+        'bake': [opts.bakeFallbacks, opts.bakeResolution]
+    }
+    dependencies = MxGLTFPTDeps.DependencyTable(settings)
+    dependencies_file = os.path.join(output_folder, MxGLTFPTDeps.DEPENDENCIES_FILE)
+    if opts.shard:
+        # Shards may share an output folder
+        dependencies_file = dependencies_file.replace('.json', f'_{shard_index}_of_{shard_count}.json')
+    if opts.incremental:
+        dependencies.load(dependencies_file)
 
-        if not valid:
-            logger.warning(f'MaterialX document: {input_file} is invalid. Erors: {errors}')
-            continue
+    # Converted data per document for bundles
+    bundle_data = {} if opts.bundle else None
 
-        # Convert to glTF JSON
-        json_string, status = converter.materialX_to_glTF(mxdoc)
-        if json_string:
-            if schema:
-                json_data = json.loads(json_string)  # Parse json_string to a dictionary  
-                try:
-                    json_validate(instance=json_data, schema=schema)  # Validate JSON data against the schema
-                    logger.info('- JSON validation successful')
-                except jsonschema.exceptions.ValidationError as e:
-                    logger.info('- JSON validation errors, ' + e)
-
-            # Write string to file replacing .mtlx with .json extension name
-            outputFile = os.path.join(output_folder, os.path.basename(input_file).replace('.mtlx', '.gltf'))
-            with open(outputFile, 'w') as f:
-                logger.info(f'Writing glTF: {outputFile}')
-                f.write(json_string)
+    # Files are converted in worker processes when a worker count or limit is given
+    runner = MxGLTFPTBatch.MaterialXFileRunner(converter, stdlib, output_folder, selection, schema, opts.bundle, opts.splitMaterials,
+                                               diagnostics, logger, opts.memoryStats)
+    pool = MxGLTFPTBatch.get_worker_pool(runner, opts.workers, opts.maxJobs, int(opts.memoryBudget * 1024 * 1024))
 
+    def write_bundle():
+        # Convert any documents skipped by an incremental conversion
+        for input_file in get_input_files(opts.input, extension):
+            if os.path.abspath(input_file) not in bundle_data:
+                MxGLTFPTBatch.apply_document_result(input_file, runner.run({'path': input_file}), dependencies, logger, bundle_data, watcher)
+
+        bundle = MxGLTFPT.glTFBundleBuilder(converter, opts.shareGraphs, selection, None, diagnostics)
+        for json_data in bundle_data.values():
+            if json_data:
+                # Data is kept for reuse when watching as the bundle modifies it
+                bundle.add_glTF_data(copy.deepcopy(json_data) if watcher else json_data)
+        json_string = bundle.get_glTF_string()
+        if json_string:
+            outputFile = os.path.join(output_folder, opts.bundle)
+            MxGLTFPTBatch.write_glTF_file(outputFile, json_string, schema, logger)
         else:
-            logger.warning(f'Error: {status}')
+            logger.warning('Error: No procedural graphs converted for bundle')
+
+    def convert_changes(changed, deleted):
+        report = MxGLTFPTReport.RunReport('materialx_to_gltf')
+
+        # Find the documents which depend on the changed and deleted files
+        documents = {os.path.abspath(f): f for f in get_input_files(opts.input, extension)}
+        to_convert = []
+        for path in changed + deleted:
+            for document in [os.path.abspath(path)] + dependencies.get_dependents(path):
+                if document in documents and documents[document] not in to_convert:
+                    to_convert.append(documents[document])
+
+        removed = [path for path in deleted if os.path.abspath(path) not in documents]
+        for input_file in removed:
+            logger.info(f'Removed: {input_file}')
+            outputs = dependencies.remove_document(input_file)
+            if opts.bundle:
+                bundle_data.pop(os.path.abspath(input_file), None)
+            else:
+                MxGLTFPTBatch.remove_files(outputs, logger)
+
+        for input_file, result in MxGLTFPTBatch.run_file_batch(to_convert, runner, pool, opts.maxPending):
+            status, written = MxGLTFPTBatch.apply_document_result(input_file, result, dependencies, logger, bundle_data, watcher)
+            manifest.add_entry(input_file, written, status, result['time'])
+            report.add_file(input_file, status, written, result['statistics'], result['time'])
+        if opts.bundle and (to_convert or removed):
+            with MxGLTFPTTrace.span('write_bundle', 'file'):
+                write_bundle()
+        if opts.report:
+            report.save(opts.report)
+            logger.info(f'Wrote run report: {opts.report}')
+        if opts.trace:
+            MxGLTFPTTrace.get_recorder().save(opts.trace)
+        if opts.incremental:
+            dependencies.save(dependencies_file)
+
+    # Skip documents whose inputs did not change since the last conversion, and
+    # remove the outputs of documents which no longer exist.
+    removed = [document for document in dependencies.documents if not os.path.exists(document)]
+    changed = file_list
+    if opts.incremental:
+        changed = [input_file for input_file in file_list if not dependencies.is_up_to_date(input_file)]
+        logger.info(f'Skipping {len(file_list) - len(changed)} up to date documents')
+        converted = set(changed)
+        for input_file in file_list:
+            if input_file not in converted:
+                outputs = [os.path.relpath(output) for output in dependencies.documents[os.path.abspath(input_file)]['outputs']]
+                manifest.add_entry(input_file, outputs, 'up_to_date', 0.0)
+    convert_changes(changed, removed)
+
+    if opts.manifest:
+        manifest.save(opts.manifest)
+        logger.info(f'Wrote manifest: {opts.manifest}')
+
+    # Reconvert files as they change
+    if watcher:
+        for input_file in file_list:
+            watcher.add_files(dependencies.get_includes(input_file))
+        logger.info('Watching for changes. Press Ctrl+C to stop.')
+        watcher.watch(convert_changes)
+    if pool:
+        pool.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
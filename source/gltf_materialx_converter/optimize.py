@@ -0,0 +1,634 @@
+'''
+@file optimize.py
+Optimization passes run on MaterialX node graphs before they are exported to glTF.
+Passes do not modify the MaterialX document. Instead they build a GraphExportPlan which
+tells the exporter which nodes and interface inputs to write, which connections to
+replace by values, and which values to replace by interface inputs.
+'''
+import math
+import MaterialX as mx
+
+## @var OPTIMIZE_FOLD_CONSTANTS
+#  @brief Pass which evaluates math nodes whose inputs are all values, and replaces the
+#  connections to them by the result.
+OPTIMIZE_FOLD_CONSTANTS = 'fold_constants'
+
+## @var OPTIMIZE_MERGE_NODES
+#  @brief Pass which merges nodes with the same category, type, values and upstream connections.
+OPTIMIZE_MERGE_NODES = 'merge_nodes'
+
+## @var OPTIMIZE_DEAD_NODES
+#  @brief Pass which removes nodes and interface inputs not reachable from any graph output.
+OPTIMIZE_DEAD_NODES = 'dead_nodes'
+
+## @var OPTIMIZE_PROMOTE_INPUTS
+#  @brief Pass which promotes filename and uniform values shared by several nodes to a single
+#  graph interface input.
+OPTIMIZE_PROMOTE_INPUTS = 'promote_inputs'
+
+## @var OPTIMIZE_PASSES
+#  @brief All optimization passes, in the order they are run.
+OPTIMIZE_PASSES = (OPTIMIZE_FOLD_CONSTANTS, OPTIMIZE_MERGE_NODES, OPTIMIZE_DEAD_NODES, OPTIMIZE_PROMOTE_INPUTS)
+
+## @var FOLD_TYPE_SIZES
+#  @brief Number of components of the types which can be folded.
+FOLD_TYPE_SIZES = {'integer': 1, 'float': 1, 'vector2': 2, 'vector3': 3, 'vector4': 4, 'color3': 3, 'color4': 4}
+
+## @var FOLD_COLORSPACES
+#  @brief Color spaces in which color values can be folded. Colors in other spaces are
+#  transformed by the renderer so their values cannot be combined directly.
+FOLD_COLORSPACES = ('', 'lin_rec709')
+
+## @var FOLD_INTEGER_CATEGORIES
+#  @brief Node categories which can be folded for integer values.
+FOLD_INTEGER_CATEGORIES = ('constant', 'dot', 'add', 'subtract', 'multiply', 'min', 'max', 'clamp', 'absval')
+
+## @var DEFAULT_VALUE_TOLERANCE
+#  @brief Tolerance within which a float value is considered equal to its default value.
+DEFAULT_VALUE_TOLERANCE = 1e-6
+
+## @var MERGE_IGNORED_ATTRIBUTES
+#  @brief Attributes which do not affect the result of a node, and are ignored when comparing
+#  nodes for merging. Attributes starting with 'ui' are also ignored.
+MERGE_IGNORED_ATTRIBUTES = ('name', 'doc', 'xpos', 'ypos', 'width', 'height')
+
+def _componentwise(function):
+    '''
+    Create a fold operation which applies a function to each component of its inputs.
+    Single component inputs are applied to every component.
+    @param function: The function of one value per input.
+    @return The operation.
+    '''
+    def operation(*args):
+        size = max(len(arg) for arg in args)
+        args = [arg * size if len(arg) == 1 else arg for arg in args]
+        return [function(*values) for values in zip(*args)]
+    return operation
+
+def _modulo(a, b):
+    return a - b * math.floor(a / b)
+
+def _sign(a):
+    return float((a > 0) - (a < 0))
+
+def _dotproduct(in1, in2):
+    return [sum(a * b for a, b in zip(in1, in2))]
+
+## @var FOLD_OPERATIONS
+#  @brief Input names and operation of each node category which can be folded. Operations take
+#  a list of component values per input, and raise ValueError, ZeroDivisionError or OverflowError
+#  if the result is not defined.
+FOLD_OPERATIONS = {
+    'constant': (('value',), _componentwise(lambda a: a)),
+    'dot': (('in',), _componentwise(lambda a: a)),
+    'add': (('in1', 'in2'), _componentwise(lambda a, b: a + b)),
+    'subtract': (('in1', 'in2'), _componentwise(lambda a, b: a - b)),
+    'multiply': (('in1', 'in2'), _componentwise(lambda a, b: a * b)),
+    'divide': (('in1', 'in2'), _componentwise(lambda a, b: a / b)),
+    'modulo': (('in1', 'in2'), _componentwise(_modulo)),
+    'power': (('in1', 'in2'), _componentwise(math.pow)),
+    'min': (('in1', 'in2'), _componentwise(min)),
+    'max': (('in1', 'in2'), _componentwise(max)),
+    'clamp': (('in', 'low', 'high'), _componentwise(lambda a, low, high: min(max(a, low), high))),
+    'invert': (('in', 'amount'), _componentwise(lambda a, amount: amount - a)),
+    'absval': (('in',), _componentwise(abs)),
+    'sign': (('in',), _componentwise(_sign)),
+    'floor': (('in',), _componentwise(lambda a: float(math.floor(a)))),
+    'ceil': (('in',), _componentwise(lambda a: float(math.ceil(a)))),
+    'sqrt': (('in',), _componentwise(math.sqrt)),
+    'sin': (('in',), _componentwise(math.sin)),
+    'cos': (('in',), _componentwise(math.cos)),
+    'tan': (('in',), _componentwise(math.tan)),
+    'exp': (('in',), _componentwise(math.exp)),
+    'ln': (('in',), _componentwise(math.log)),
+    'mix': (('fg', 'bg', 'mix'), _componentwise(lambda fg, bg, mix: bg + (fg - bg) * mix)),
+    'dotproduct': (('in1', 'in2'), _dotproduct)
+}
+
+def parse_value(value_string, type):
+    '''
+    Parse a MaterialX value string of a type which can be folded.
+    @param value_string: The value string.
+    @param type: The value type.
+    @return List of component values, or None if the value cannot be parsed.
+    '''
+    try:
+        values = [(int if type == 'integer' else float)(value) for value in value_string.split(',')]
+    except ValueError:
+        return None
+    return values if len(values) == FOLD_TYPE_SIZES[type] else None
+
+def format_value(values, type):
+    '''
+    Format folded component values as a MaterialX value string.
+    @param values: List of component values.
+    @param type: The value type.
+    @return The value string.
+    '''
+    if type == 'integer':
+        return ', '.join(str(int(value)) for value in values)
+    return ', '.join(format(value, '.9g') for value in values)
+
+def convert_value(values, from_type, to_type):
+    '''
+    Convert folded component values as the convert node does. Only conversions which do not
+    add or remove components, or which broadcast a scalar, are supported.
+    @param values: List of component values.
+    @param from_type: The input type.
+    @param to_type: The output type.
+    @return List of component values, or None if the conversion is not supported.
+    '''
+    if to_type == 'integer':
+        return None
+    if from_type in ('float', 'integer'):
+        return [float(values[0])] * FOLD_TYPE_SIZES[to_type]
+    if FOLD_TYPE_SIZES[from_type] == FOLD_TYPE_SIZES[to_type]:
+        return list(values)
+    return None
+
+def find_nodedef(node, library):
+    '''
+    Find the node definition of a node in a library the node's document does not reference.
+    A definition matches if it has the node's type and inputs of the same names and types.
+    @param node: The node.
+    @param library: The document holding the definitions. Can be None.
+    @return The matching node definition, or None if none is found.
+    '''
+    if not library:
+        return None
+    if node.getNodeDefString():
+        return library.getNodeDef(node.getNodeDefString())
+    for nodedef in library.getMatchingNodeDefs(node.getCategory()):
+        if nodedef.getType() != node.getType():
+            continue
+        matched = True
+        for input in node.getInputs():
+            nodedef_input = nodedef.getActiveInput(input.getName())
+            if not nodedef_input or nodedef_input.getType() != input.getType():
+                matched = False
+                break
+        if matched:
+            return nodedef
+    return None
+
+def is_default_value(input, nodedef, tolerance=DEFAULT_VALUE_TOLERANCE):
+    '''
+    Check if the value of a node input is the default value of its node definition.
+    Inputs which are connected, or which specify a color space or unit, are not considered default.
+    @param input: The node input.
+    @param nodedef: The node definition. Can be None.
+    @param tolerance: Relative and absolute tolerance for float components. Default is DEFAULT_VALUE_TOLERANCE.
+    @return True if the input can be omitted without changing the result.
+    '''
+    if (not nodedef or not input.hasValueString() or input.hasInterfaceName() or input.getNodeName() or
+        input.hasNodeGraphString() or input.hasColorSpace() or input.hasUnit()):
+        return False
+    nodedef_input = nodedef.getActiveInput(input.getName())
+    if (not nodedef_input or not nodedef_input.hasValueString() or nodedef_input.hasColorSpace() or
+        nodedef_input.getType() != input.getType()):
+        return False
+
+    value = input.getValueString()
+    default_value = nodedef_input.getValueString()
+    if value == default_value:
+        return True
+    if input.getType() in (mx.STRING_TYPE_STRING, mx.FILENAME_TYPE_STRING, 'boolean'):
+        return False
+    try:
+        values = [float(component) for component in value.split(',')]
+        default_values = [float(component) for component in default_value.split(',')]
+    except ValueError:
+        return False
+    return len(values) == len(default_values) and all(
+        math.isclose(a, b, rel_tol=tolerance, abs_tol=tolerance) for a, b in zip(values, default_values))
+
+def remove_default_values(doc, library=None, tolerance=DEFAULT_VALUE_TOLERANCE):
+    '''
+    Remove the inputs of nodes in the node graphs of a document whose values are the default
+    values of their node definitions. Functional graphs and graphs from included files are skipped.
+    @param doc: The document to modify.
+    @param library: Optional document holding the node definitions, if the document does not
+    reference them. Default is None meaning to use the definitions the document references.
+    @param tolerance: Relative and absolute tolerance for float components. Default is DEFAULT_VALUE_TOLERANCE.
+    @return The number of inputs removed.
+    '''
+    removed = 0
+    for graph in doc.getNodeGraphs():
+        if graph.getNodeDefString() or graph.hasSourceUri():
+            continue
+        for node in graph.getNodes():
+            nodedef = find_nodedef(node, library) if library else node.getNodeDef()
+            for input in node.getInputs():
+                if is_default_value(input, nodedef, tolerance):
+                    node.removeInput(input.getName())
+                    removed += 1
+    return removed
+
+class GraphExportPlan():
+    '''
+    @brief Class describing how a MaterialX node graph is exported.
+
+    A plan starts out exporting the graph as is. Optimization passes then change what is
+    exported. Nodes are identified by their name path.
+    '''
+
+    def __init__(self, graph):
+        '''
+        Constructor
+        @param graph: The MaterialX node graph.
+
+        **Attributes**
+        - nodes : list
+            - The nodes to export, in graph order.
+
+        - inputs : list
+            - The interface inputs to export, in graph order.
+
+        - values : dict
+            - Value strings replacing the connection of node inputs, keyed by input name path.
+
+        - merged : dict
+            - Nodes replacing other nodes, keyed by the name path of the node replaced.
+
+        - removed : dict
+            - Number of items removed by each pass.
+
+        - promoted : dict
+            - Names of the interface inputs replacing the values of node inputs, keyed by input name path.
+
+        - promoted_inputs : dict
+            - Interface inputs added by promotion, keyed by name. Each is given by one of the
+            node inputs whose value it replaces.
+
+        - nodedef : NodeDef
+            - The node definition of a functional graph, whose inputs are the graph interface. None for other graphs.
+        '''
+        self.graph = graph
+        self.nodedef = graph.getNodeDef() if graph.hasNodeDefString() else None
+        self.nodes = graph.getNodes()
+        self.inputs = graph.getInputs()
+        self.values = {}
+        self.merged = {}
+        self.removed = {}
+        self.promoted = {}
+        self.promoted_inputs = {}
+
+    def resolve(self, element):
+        '''
+        Get the element which replaces a graph element.
+        @param element: The graph input or node. Can be None.
+        @return The node the element was merged into, otherwise the element itself.
+        '''
+        if element is None:
+            return None
+        return self.merged.get(element.getNamePath(), element)
+
+    def get_interface(self, name):
+        '''
+        Get an interface input of the graph. The interface of a functional graph is
+        the inputs of its node definition.
+        @param name: The interface name.
+        @return The graph input or node definition input, or None if not found.
+        '''
+        if self.nodedef:
+            return self.nodedef.getActiveInput(name)
+        return self.resolve(self.graph.getInput(name))
+
+    def get_connection(self, port):
+        '''
+        Get the element an input or output is connected to within the graph.
+        Only interfacename and nodename connections are supported.
+        @param port: The input or output.
+        @return The connected graph input or node, or None if not connected or the
+        connection is replaced by a value.
+        '''
+        if port.getNamePath() in self.values:
+            return None
+        interface = port.getAttribute('interfacename')
+        if interface:
+            return self.get_interface(interface)
+        connection = port.getAttribute('nodename')
+        if not connection:
+            return None
+        return self.resolve(self.graph.getChild(connection))
+
+    def get_live_elements(self):
+        '''
+        Find the nodes and interface inputs reachable from the graph outputs.
+        @return Set of name paths of the reachable elements.
+        '''
+        live = set()
+        pending = list(self.graph.getOutputs())
+        while pending:
+            element = self.get_connection(pending.pop())
+            if element is None or element.getNamePath() in live:
+                continue
+            live.add(element.getNamePath())
+            if element.isA(mx.Node):
+                pending.extend(element.getInputs())
+        return live
+
+def _get_fold_input(plan, node, nodedef, name, folded):
+    '''
+    Get the value of a node input for folding.
+    @param plan: The GraphExportPlan.
+    @param node: The node.
+    @param nodedef: The node definition.
+    @param name: The input name.
+    @param folded: Dictionary of folded node values.
+    @return The input type and list of component values, or None if the input is not a value.
+    '''
+    input = node.getInput(name)
+    if input:
+        type = input.getType()
+        upstream = plan.get_connection(input)
+        if upstream is not None:
+            if not upstream.isA(mx.Node) or input.getAttribute('output'):
+                return None
+            values = _fold_node(plan, upstream, folded)
+            return (type, values) if values is not None and upstream.getType() == type else None
+        if input.hasInterfaceName() or input.getNodeName() or input.hasUnit():
+            return None
+        value_string = input.getValueString()
+    else:
+        input = nodedef.getActiveInput(name)
+        if not input or input.hasDefaultGeomPropString():
+            return None
+        type = input.getType()
+        value_string = input.getValueString()
+
+    if type not in FOLD_TYPE_SIZES or not value_string:
+        return None
+    if type.startswith('color') and input.getActiveColorSpace() not in FOLD_COLORSPACES:
+        return None
+    values = parse_value(value_string, type)
+    return (type, values) if values is not None else None
+
+def _fold_node(plan, node, folded):
+    '''
+    Evaluate a node if all its inputs are values or connected to nodes which can be folded.
+    @param plan: The GraphExportPlan.
+    @param node: The node.
+    @param folded: Dictionary of folded node values keyed by node name path, None for nodes
+    which cannot be folded. Updated with the nodes evaluated.
+    @return List of component values of the node output, or None if the node cannot be folded.
+    '''
+    path = node.getNamePath()
+    if path in folded:
+        return folded[path]
+    # Guard against cycles
+    folded[path] = None
+
+    category = node.getCategory()
+    output_type = node.getType()
+    nodedef = node.getNodeDef()
+    if (output_type not in FOLD_TYPE_SIZES or not nodedef or not nodedef.getName().startswith('ND_') or
+        len(nodedef.getActiveOutputs()) != 1 or (category not in FOLD_OPERATIONS and category != 'convert')):
+        return None
+    if output_type == 'integer' and category not in FOLD_INTEGER_CATEGORIES:
+        return None
+
+    names = ('in',) if category == 'convert' else FOLD_OPERATIONS[category][0]
+    for input in node.getInputs():
+        if input.getName() not in names and (input.getNodeName() or input.hasInterfaceName()):
+            return None
+    args = []
+    for name in names:
+        arg = _get_fold_input(plan, node, nodedef, name, folded)
+        if arg is None:
+            return None
+        args.append(arg)
+
+    values = None
+    if category == 'convert':
+        values = convert_value(args[0][1], args[0][0], output_type)
+    else:
+        try:
+            values = FOLD_OPERATIONS[category][1](*[arg[1] for arg in args])
+        except (ValueError, ZeroDivisionError, OverflowError):
+            return None
+    if values is None or len(values) != FOLD_TYPE_SIZES[output_type]:
+        return None
+    if output_type == 'integer':
+        values = [int(value) for value in values]
+    elif not all(math.isfinite(value) for value in values):
+        return None
+    folded[path] = values
+    return values
+
+def fold_constants(plan, diagnostics=None):
+    '''
+    Evaluate the math nodes of a plan whose inputs are all values, and replace the connections
+    to them by the resulting values. Folded nodes which are no longer connected are removed.
+    Nodes which cannot be evaluated exactly, for instance colors in a color space which is
+    transformed by the renderer, are left untouched.
+    @param plan: The GraphExportPlan to update.
+    @param diagnostics: Optional Diagnostics collector to report the number of folded nodes to. Default is None.
+    '''
+    folded = {}
+    for node in plan.nodes:
+        _fold_node(plan, node, folded)
+
+    # Replace connections to folded nodes by values
+    for node in plan.nodes:
+        for input in node.getInputs():
+            upstream = plan.get_connection(input)
+            if upstream is None or input.getAttribute('output') or input.hasUnit():
+                continue
+            values = folded.get(upstream.getNamePath())
+            if values is None or upstream.getType() != input.getType():
+                continue
+            if input.getType().startswith('color') and input.getActiveColorSpace() not in FOLD_COLORSPACES:
+                continue
+            plan.values[input.getNamePath()] = format_value(values, input.getType())
+
+    # Remove folded nodes which are no longer connected
+    connected = set()
+    for port in list(plan.graph.getOutputs()) + [input for node in plan.nodes for input in node.getInputs()]:
+        element = plan.get_connection(port)
+        if element is not None:
+            connected.add(element.getNamePath())
+    nodes = [node for node in plan.nodes if folded.get(node.getNamePath()) is None or node.getNamePath() in connected]
+    removed = len(plan.nodes) - len(nodes)
+    plan.nodes = nodes
+    plan.removed[OPTIMIZE_FOLD_CONSTANTS] = removed
+    if diagnostics is not None and removed:
+        diagnostics.info(OPTIMIZE_FOLD_CONSTANTS, plan.graph, 'Folded %d constant nodes into input values', removed)
+
+def _get_attribute_key(element):
+    '''
+    Get the attributes of an element which affect its result, for comparison.
+    @param element: The element.
+    @return Tuple of attribute name and value pairs.
+    '''
+    return tuple((name, element.getAttribute(name)) for name in sorted(element.getAttributeNames())
+                 if name not in MERGE_IGNORED_ATTRIBUTES and not name.startswith('ui'))
+
+def _merge_node(plan, node, representatives, keys):
+    '''
+    Find the node a node can be merged into. Upstream nodes are merged first so that
+    nodes connected to duplicate upstream nodes are also found to be duplicates.
+    @param plan: The GraphExportPlan.
+    @param node: The node.
+    @param representatives: Dictionary of the node kept for each node key. Updated with the node.
+    @param keys: Dictionary of the node found for each node name path. Updated with the node.
+    @return The node kept in place of the node, which is the node itself if it is not a duplicate.
+    '''
+    path = node.getNamePath()
+    if path in keys:
+        return keys[path] if keys[path] is not None else node
+    # Guard against cycles
+    keys[path] = None
+
+    if not node.getNodeDef():
+        keys[path] = node
+        return node
+
+    inputs = []
+    for input in sorted(node.getInputs(), key=lambda input: input.getName()):
+        value = plan.values.get(input.getNamePath())
+        upstream = None if value is not None else plan.get_connection(input)
+        if upstream is not None and upstream.isA(mx.Node):
+            upstream = _merge_node(plan, upstream, representatives, keys)
+            source = ('node', upstream.getNamePath(), input.getAttribute('output'))
+        elif upstream is not None:
+            source = ('input', upstream.getNamePath())
+        elif value is not None:
+            source = ('value', value)
+        elif input.getType() == mx.FILENAME_TYPE_STRING:
+            source = ('value', input.getResolvedValueString())
+        else:
+            source = ('value', input.getValueString())
+        attributes = tuple(item for item in _get_attribute_key(input) if item[0] not in ('value', 'nodename', 'interfacename', 'output'))
+        inputs.append((input.getName(), source, attributes))
+    outputs = tuple(_get_attribute_key(output) for output in node.getOutputs())
+
+    key = (node.getCategory(), _get_attribute_key(node), tuple(inputs), outputs)
+    representative = representatives.setdefault(key, node)
+    if representative is not node:
+        plan.merged[path] = representative
+    keys[path] = representative
+    return representative
+
+def merge_nodes(plan, diagnostics=None):
+    '''
+    Merge the nodes of a plan which have the same category, type, attributes, input values and
+    upstream connections. Connections to merged nodes are redirected to the node they were merged into,
+    which is the first one found, and the merged nodes are removed.
+    @param plan: The GraphExportPlan to update.
+    @param diagnostics: Optional Diagnostics collector to report the number of merged nodes to. Default is None.
+    '''
+    representatives = {}
+    keys = {}
+    for node in plan.nodes:
+        _merge_node(plan, node, representatives, keys)
+
+    nodes = [node for node in plan.nodes if node.getNamePath() not in plan.merged]
+    removed = len(plan.nodes) - len(nodes)
+    plan.nodes = nodes
+    plan.removed[OPTIMIZE_MERGE_NODES] = removed
+    if diagnostics is not None and removed:
+        diagnostics.info(OPTIMIZE_MERGE_NODES, plan.graph, 'Merged %d duplicate nodes', removed)
+
+def remove_dead_nodes(plan, diagnostics=None):
+    '''
+    Remove the nodes and interface inputs of a plan which do not contribute to any graph output.
+    @param plan: The GraphExportPlan to update.
+    @param diagnostics: Optional Diagnostics collector to report the number of removed items to. Default is None.
+    '''
+    live = plan.get_live_elements()
+    nodes = [node for node in plan.nodes if node.getNamePath() in live]
+    inputs = [input for input in plan.inputs if input.getNamePath() in live]
+    removed_nodes = len(plan.nodes) - len(nodes)
+    removed_inputs = len(plan.inputs) - len(inputs)
+    plan.nodes = nodes
+    plan.inputs = inputs
+    plan.removed[OPTIMIZE_DEAD_NODES] = removed_nodes + removed_inputs
+    if diagnostics is not None and (removed_nodes or removed_inputs):
+        diagnostics.info(OPTIMIZE_DEAD_NODES, plan.graph, 'Removed %d unreachable nodes and %d unused inputs',
+                         removed_nodes, removed_inputs)
+
+def _get_promotion_key(input, nodedef):
+    '''
+    Get the key of a node input value for promotion to the graph interface.
+    @param input: The node input.
+    @param nodedef: The node definition.
+    @return Tuple of the input type, value and attributes, or None if the input cannot be promoted.
+    '''
+    if input.hasInterfaceName() or input.getNodeName() or input.getNodeGraphString():
+        return None
+    input_type = input.getType()
+    if input_type != mx.FILENAME_TYPE_STRING:
+        definition = nodedef.getActiveInput(input.getName()) if nodedef else None
+        if not definition or not definition.getIsUniform():
+            return None
+    value = input.getResolvedValueString() if input_type == mx.FILENAME_TYPE_STRING else input.getValueString()
+    if not value:
+        return None
+    attributes = tuple(item for item in _get_attribute_key(input) if item[0] != 'value')
+    return (input_type, value, attributes)
+
+def promote_inputs(plan, diagnostics=None):
+    '''
+    Promote filename and uniform values shared by several nodes of a plan to graph interface inputs.
+    Node inputs with the same type, value and attributes are replaced by a connection to a single
+    interface input, so that the value is bound once. Functional graphs, whose interface is their
+    node definition, are left untouched.
+    @param plan: The GraphExportPlan to update.
+    @param diagnostics: Optional Diagnostics collector to report the number of promoted values to. Default is None.
+    '''
+    plan.removed[OPTIMIZE_PROMOTE_INPUTS] = 0
+    if plan.nodedef:
+        return
+
+    uses = {}
+    for node in plan.nodes:
+        nodedef = node.getNodeDef()
+        for input in node.getInputs():
+            if input.getNamePath() in plan.values:
+                continue
+            key = _get_promotion_key(input, nodedef)
+            if key is not None:
+                uses.setdefault(key, []).append(input)
+
+    for inputs in uses.values():
+        if len(inputs) < 2:
+            continue
+        base_name = inputs[0].getName()
+        name = base_name
+        index = 1
+        while plan.graph.getChild(name) or name in plan.promoted_inputs:
+            index += 1
+            name = f'{base_name}{index}'
+        plan.promoted_inputs[name] = inputs[0]
+        for input in inputs:
+            plan.promoted[input.getNamePath()] = name
+
+    plan.removed[OPTIMIZE_PROMOTE_INPUTS] = len(plan.promoted) - len(plan.promoted_inputs)
+    if diagnostics is not None and plan.promoted_inputs:
+        diagnostics.info(OPTIMIZE_PROMOTE_INPUTS, plan.graph, 'Promoted %d shared values to %d interface inputs',
+                         len(plan.promoted), len(plan.promoted_inputs))
+
+def create_export_plan(graph, passes=(), diagnostics=None):
+    '''
+    Create the export plan for a node graph by running optimization passes.
+    @param graph: The MaterialX node graph.
+    @param passes: The names of the passes to run. Passes are run in the order of OPTIMIZE_PASSES. Default is none.
+    @param diagnostics: Optional Diagnostics collector to report to. Default is None.
+    @return The GraphExportPlan.
+    @throws ValueError if a pass is not known.
+    '''
+    for name in passes:
+        if name not in OPTIMIZE_PASSES:
+            raise ValueError(f'Unknown optimization pass: {name}')
+
+    plan = GraphExportPlan(graph)
+    if OPTIMIZE_FOLD_CONSTANTS in passes:
+        fold_constants(plan, diagnostics)
+    if OPTIMIZE_MERGE_NODES in passes:
+        merge_nodes(plan, diagnostics)
+    if OPTIMIZE_DEAD_NODES in passes:
+        remove_dead_nodes(plan, diagnostics)
+    if OPTIMIZE_PROMOTE_INPUTS in passes:
+        promote_inputs(plan, diagnostics)
+    return plan
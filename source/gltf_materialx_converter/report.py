@@ -0,0 +1,213 @@
+'''
+@file report.py
+Machine-readable run reports for batch conversions. Each converted file is recorded with its
+status, phase timings, sizes and content counts, and the report adds aggregate throughput,
+latency percentiles and the slowest files.
+'''
+import os
+import time
+import json
+import contextlib
+import tracemalloc
+import MaterialX as mx
+
+try:
+    from . import tracing as MxGLTFPTTrace
+    from . import jobs as MxGLTFPTJobs
+except ImportError:
+    import tracing as MxGLTFPTTrace
+    import jobs as MxGLTFPTJobs
+
+## @var REPORT_VERSION
+#  @brief Version of the run report format.
+REPORT_VERSION = 1
+
+def get_percentile(values, fraction):
+    '''
+    Get a percentile of a list of values, interpolating linearly between the nearest values.
+    @param values: The values.
+    @param fraction: The percentile as a fraction from 0 to 1.
+    @return The percentile, or 0 if there are no values.
+    '''
+    if not values:
+        return 0.0
+    values = sorted(values)
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+def get_materialX_counts(doc):
+    '''
+    Count the content of a MaterialX document. Functional graphs, such as the node graph
+    implementations of a data library imported into the document, are not counted.
+    @param doc: The MaterialX document.
+    @return Dictionary with the number of 'materials', 'nodegraphs' and 'nodes'.
+    '''
+    graphs = [graph for graph in doc.getNodeGraphs() if not graph.getNodeDef()]
+    nodes = len(doc.getNodes()) + sum(len(graph.getNodes()) for graph in graphs)
+    return {
+        'materials': len(doc.getMaterialNodes()),
+        'nodegraphs': len(graphs),
+        'nodes': nodes
+    }
+
+class FileStatistics():
+    '''
+    @brief Class recording the time spent in each phase of converting a file, and counts
+    of the converted content.
+    '''
+
+    def __init__(self):
+        '''
+        Constructor
+
+        **Attributes**
+        - timings : dict
+            - Time in seconds spent in each phase.
+
+        - counts : dict
+            - Counts of the converted content. See get_materialX_counts().
+
+        - memory : dict
+            - The process RSS after the conversion ('rss'), the peak process RSS ('peak_rss') and 
+            the Python memory allocated by the conversion ('allocated') in bytes. See measure_memory().
+        '''
+        self.timings = {}
+        self.counts = {}
+        self.memory = {}
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        '''
+        Time a phase. Time spent in a phase more than once is accumulated.
+        The phase is also recorded as a trace span if tracing is enabled.
+        @param name: The phase name.
+        '''
+        start_time = time.perf_counter()
+        try:
+            with MxGLTFPTTrace.span(name, 'phase'):
+                yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start_time
+
+    @contextlib.contextmanager
+    def measure_memory(self, trace_allocations=False):
+        '''
+        Measure the memory used by the conversion.
+        @param trace_allocations: Trace the Python memory allocated with tracemalloc, which slows down 
+        conversion. Otherwise the allocated memory is None. Default is False.
+        '''
+        if trace_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            start_allocated = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            rss, peak_rss = MxGLTFPTJobs.get_memory_usage()
+            allocated = tracemalloc.get_traced_memory()[0] - start_allocated if trace_allocations else None
+            self.memory = {'rss': rss, 'peak_rss': peak_rss, 'allocated': allocated}
+
+class RunReport():
+    '''
+    @brief Class gathering the results of a batch conversion into a JSON report.
+    '''
+
+    def __init__(self, command=''):
+        '''
+        Constructor. The run is timed from construction.
+        @param command: Name of the command which is run. Default is an empty string.
+
+        **Attributes**
+        - files : list
+            - Dictionary with the 'input', 'status', 'time', 'phases', 'input_size',
+            'outputs', 'output_size', 'counts', 'rss', 'peak_rss' and 'allocated' of each file.
+            The memory fields are None if the memory used was not measured.
+        '''
+        self.command = command
+        self.start_time = time.perf_counter()
+        self.files = []
+
+    def add_file(self, input_file, status, outputs, statistics, elapsed=None):
+        '''
+        Record the result of converting a file.
+        @param input_file: The input file.
+        @param status: The conversion status.
+        @param outputs: The output files written.
+        @param statistics: The FileStatistics of the conversion.
+        @param elapsed: The total time taken in seconds. Default is None meaning the sum of the phase timings.
+        @return The file record.
+        '''
+        def get_size(file_name):
+            try:
+                return os.path.getsize(file_name)
+            except OSError:
+                return 0
+
+        record = {
+            'input': input_file,
+            'status': status,
+            'time': elapsed if elapsed is not None else sum(statistics.timings.values()),
+            'phases': dict(statistics.timings),
+            'input_size': get_size(input_file),
+            'outputs': list(outputs),
+            'output_size': sum(get_size(output) for output in outputs),
+            'counts': dict(statistics.counts),
+            'rss': statistics.memory.get('rss'),
+            'peak_rss': statistics.memory.get('peak_rss'),
+            'allocated': statistics.memory.get('allocated')
+        }
+        self.files.append(record)
+        return record
+
+    def get_summary(self, top=10):
+        '''
+        Get the report.
+        @param top: Number of slowest files to list. Default is 10.
+        @return The report dictionary.
+        '''
+        elapsed = time.perf_counter() - self.start_time
+        times = [record['time'] for record in self.files]
+        input_size = sum(record['input_size'] for record in self.files)
+        status = {}
+        phases = {}
+        for record in self.files:
+            status[record['status']] = status.get(record['status'], 0) + 1
+            for name, value in record['phases'].items():
+                phases[name] = phases.get(name, 0.0) + value
+
+        return {
+            'version': REPORT_VERSION,
+            'command': self.command,
+            'materialx_version': mx.__version__,
+            'files': len(self.files),
+            'status': status,
+            'elapsed': elapsed,
+            'throughput': {
+                'files_per_second': len(self.files) / elapsed if elapsed > 0 else 0.0,
+                'megabytes_per_second': input_size / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+            },
+            'input_size': input_size,
+            'output_size': sum(record['output_size'] for record in self.files),
+            'latency': {
+                'mean': sum(times) / len(times) if times else 0.0,
+                'p50': get_percentile(times, 0.5),
+                'p95': get_percentile(times, 0.95),
+                'p99': get_percentile(times, 0.99),
+                'max': max(times, default=0.0)
+            },
+            'phases': phases,
+            'slowest': [{'input': record['input'], 'time': record['time']}
+                        for record in sorted(self.files, key=lambda record: record['time'], reverse=True)[:top]],
+            'entries': self.files
+        }
+
+    def save(self, filename, top=10):
+        '''
+        Write the report as JSON.
+        @param filename: The file to write.
+        @param top: Number of slowest files to list. Default is 10.
+        '''
+        with open(filename, 'w') as f:
+            json.dump(self.get_summary(top), f, indent=2)
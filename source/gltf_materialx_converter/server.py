@@ -0,0 +1,265 @@
+'''
+@file server.py
+Long-lived local conversion server. The standard library is loaded once and a pool of
+worker processes is forked which share the library copy-on-write. Requests can be sent
+as JSON over HTTP on localhost, or as newline-delimited JSON (NDJSON) over a Unix socket.
+See jobs.ConversionJobRunner for the request and result format.
+'''
+import os
+import sys
+import gc
+import json
+import signal
+import argparse
+import socketserver
+import http.server
+import logging as lg
+
+try:
+    from . import jobs as MxGLTFPTJobs
+    from . import utilities as MxGLTFPTUtil
+except ImportError:
+    import jobs as MxGLTFPTJobs
+    import utilities as MxGLTFPTUtil
+
+class ConversionServerMixin():
+    '''
+    @brief Mixin for socket servers which run conversion requests in a worker process.
+    Counts the jobs run and checks the memory used so that the worker can be recycled.
+    '''
+    runner = None
+    job_count = 0
+    max_jobs = 0
+    memory_budget = 0
+
+    def run_request(self, request):
+        '''
+        Run a conversion request.
+        @param request: The request dictionary.
+        @return The result dictionary.
+        '''
+        self.job_count += 1
+        return self.runner.run(request)
+
+    def is_exhausted(self):
+        '''
+        Check if the worker has run the maximum number of jobs or exceeded its memory budget.
+        @return True if the worker should be recycled.
+        '''
+        if self.max_jobs > 0 and self.job_count >= self.max_jobs:
+            return True
+        return self.memory_budget > 0 and self.job_count > 0 and MxGLTFPTJobs.get_memory_usage()[0] >= self.memory_budget
+
+class ConversionHTTPRequestHandler(http.server.BaseHTTPRequestHandler):
+    '''
+    @brief HTTP request handler. A POST request takes a JSON request body and returns a JSON result.
+    A GET request returns the worker status.
+    '''
+    def send_json(self, code, data):
+        '''
+        Send a JSON response.
+        @param code: The HTTP status code.
+        @param data: The data to send.
+        '''
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.send_json(200, {'status': 'ok', 'pid': os.getpid(), 'jobs': self.server.job_count})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            self.send_json(400, {'status': 'error', 'message': f'Invalid JSON request: {e}'})
+            return
+        self.send_json(200, self.server.run_request(request))
+
+    def log_message(self, format, *args):
+        lg.getLogger('glTFMtlxServer').debug(format, *args)
+
+class ConversionNDJSONRequestHandler(socketserver.StreamRequestHandler):
+    '''
+    @brief Stream request handler which reads one JSON request per line and writes one JSON
+    result per line. The connection is closed when the worker is recycled.
+    '''
+    def handle(self):
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                result = self.server.run_request(json.loads(line))
+            except ValueError as e:
+                result = {'status': 'error', 'message': f'Invalid JSON request: {e}'}
+            self.wfile.write(json.dumps(result).encode('utf-8') + b'\n')
+            self.wfile.flush()
+            if self.server.is_exhausted():
+                break
+
+class ConversionHTTPServer(ConversionServerMixin, http.server.HTTPServer):
+    '''
+    @brief HTTP conversion server.
+    '''
+    pass
+
+class ConversionUnixServer(ConversionServerMixin, socketserver.UnixStreamServer):
+    '''
+    @brief NDJSON conversion server on a Unix socket.
+    '''
+    pass
+
+class ConversionServer():
+    '''
+    @brief Pre-fork conversion server.
+
+    The parent process loads the standard library, opens the listening socket and forks
+    the workers. Each worker accepts connections on the shared socket and exits after running
+    a maximum number of jobs, at which point the parent forks a replacement. Requires a
+    platform which supports fork().
+    '''
+
+    def __init__(self, socket_path=None, host='127.0.0.1', port=8000, workers=2, max_jobs=1000, runner=None, memory_budget=0):
+        '''
+        Constructor
+        @param socket_path: Path of a Unix socket to serve NDJSON requests on. Default is None meaning to serve HTTP.
+        @param host: The host to serve HTTP requests on. Default is localhost.
+        @param port: The port to serve HTTP requests on. Default is 8000. A port of 0 picks a free port.
+        @param workers: The number of worker processes. Default is 2.
+        @param max_jobs: The number of jobs a worker runs before being recycled. Zero means no limit. Default is 1000.
+        @param runner: The ConversionJobRunner to use. Default is None meaning to create one, loading the standard libraries.
+        @param memory_budget: Worker resident set size (RSS) in bytes above which a worker is recycled. Zero means no limit. Default is 0.
+        '''
+        self.logger = lg.getLogger('glTFMtlxServer')
+        self.socket_path = socket_path
+        self.workers = max(1, workers)
+        self.max_jobs = max_jobs
+        self.runner = runner if runner else MxGLTFPTJobs.ConversionJobRunner()
+        self.children = set()
+        self.running = False
+
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self.server = ConversionUnixServer(socket_path, ConversionNDJSONRequestHandler)
+        else:
+            self.server = ConversionHTTPServer((host, port), ConversionHTTPRequestHandler)
+        self.server.runner = self.runner
+        self.server.max_jobs = max_jobs
+        self.server.memory_budget = memory_budget
+
+    def get_address(self):
+        '''
+        Get the address the server is listening on.
+        @return The socket path, or a (host, port) tuple.
+        '''
+        return self.server.server_address
+
+    def run_worker(self):
+        '''
+        Worker process loop. Handles connections until the maximum number of jobs is reached.
+        '''
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        self.server.job_count = 0
+        while not self.server.is_exhausted():
+            self.server.handle_request()
+
+    def spawn_worker(self):
+        '''
+        Fork a new worker process.
+        @return The worker process id.
+        '''
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                self.run_worker()
+            except BaseException:
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+        self.children.add(pid)
+        return pid
+
+    def handle_signal(self, signum, frame):
+        '''
+        Stop the server on termination signals.
+        '''
+        self.running = False
+        raise KeyboardInterrupt
+
+    def serve_forever(self):
+        '''
+        Fork the workers and replace them as they exit until the server is stopped.
+        '''
+        # Move everything loaded so far out of garbage collection so that collections
+        # in the workers do not touch, and hence copy, the shared pages.
+        gc.collect()
+        gc.freeze()
+
+        self.running = True
+        signal.signal(signal.SIGTERM, self.handle_signal)
+        try:
+            for i in range(self.workers):
+                self.spawn_worker()
+            self.logger.info(f'Serving on {self.get_address()} with {self.workers} workers')
+            while self.running:
+                pid, status = os.wait()
+                self.children.discard(pid)
+                if self.running:
+                    self.logger.debug(f'Recycling worker: {pid}')
+                    self.spawn_worker()
+        except (KeyboardInterrupt, ChildProcessError):
+            pass
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        '''
+        Stop all workers and close the listening socket.
+        '''
+        self.running = False
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.children.clear()
+        self.server.server_close()
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-fork server for conversion between MaterialX and glTF Texture Procedurals.")
+    parser.add_argument('--socket', default=None, help='Unix socket path to serve newline-delimited JSON requests on. The default is to serve HTTP.')
+    parser.add_argument('--host', default='127.0.0.1', help='Host to serve HTTP requests on. The default is 127.0.0.1.')
+    parser.add_argument('--port', type=int, default=8000, help='Port to serve HTTP requests on. The default is 8000.')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes. The default is the number of CPUs.')
+    parser.add_argument('--maxJobs', type=int, default=1000, help='Number of jobs a worker runs before being replaced. Zero means no limit. The default is 1000.')
+    parser.add_argument('--memoryBudget', type=float, default=0, help='Worker memory (RSS) in MB above which a worker is replaced once its current job is done. Zero means no limit. The default is 0.')
+    opts = parser.parse_args()
+
+    logger = lg.getLogger('glTFMtlxServer')
+    lg.basicConfig(level=lg.INFO)
+
+    if not hasattr(os, 'fork'):
+        logger.error('The conversion server requires a platform which supports fork().')
+        sys.exit(-1)
+
+    if not MxGLTFPTUtil.have_version(1, 39, 1):
+        logger.error("MaterialX version 1.39.1 or higher is required.")
+        sys.exit(-1)
+
+    server = ConversionServer(opts.socket, opts.host, opts.port, opts.workers, opts.maxJobs, 
+                              memory_budget=int(opts.memoryBudget * 1024 * 1024))
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+'''
+@file shadergen.py
+Shader generation checks of converted MaterialX documents. The GLSL or ESSL shader generator is run
+on the CPU for each renderable element, recording the generated source size, uniform count and code
+generation time. Results for an original document and its round trip through glTF can be compared
+to find regressions.
+'''
+import time
+import MaterialX as mx
+import MaterialX.PyMaterialXGenShader as mx_gen_shader
+import MaterialX.PyMaterialXGenGlsl as mx_gen_glsl
+
+## @var SHADERGEN_TARGETS
+#  @brief Supported shader generation targets and their generator classes.
+SHADERGEN_TARGETS = {
+    'glsl': mx_gen_glsl.GlslShaderGenerator,
+    'essl': mx_gen_glsl.EsslShaderGenerator
+}
+
+## @var DEFAULT_SIZE_TOLERANCE
+#  @brief Fraction by which the generated source of a round trip can grow before it is reported as a regression.
+DEFAULT_SIZE_TOLERANCE = 0.1
+
+def get_element_key(element):
+    '''
+    Get the key used to match a renderable element between an original document and its round trip.
+    Material names are not preserved by a round trip, so materials are keyed by the name of their
+    first shader node.
+    @param element: The renderable element.
+    @return The key string.
+    '''
+    if element.getCategory() in ('surfacematerial', 'volumematerial'):
+        shader_nodes = mx.getShaderNodes(element)
+        if shader_nodes:
+            return shader_nodes[0].getName()
+    return element.getNamePath()
+
+class ShaderGenChecker():
+    '''
+    @brief Class which generates shaders for the renderable elements of documents. The generator,
+    its context and the color management and unit systems are created once and reused for all documents.
+    '''
+
+    def __init__(self, stdlib, target='glsl', search_path=None):
+        '''
+        Constructor
+        @param stdlib: The standard library the documents reference.
+        @param target: The shader generation target. See SHADERGEN_TARGETS. Default is 'glsl'.
+        @param search_path: Search path for library source code. Default is None meaning the default data search path.
+        @throws ValueError if the target is not supported.
+        '''
+        if target not in SHADERGEN_TARGETS:
+            raise ValueError(f'Unsupported shader generation target: {target}')
+        self.stdlib = stdlib
+        self.target = target
+        self.generator = SHADERGEN_TARGETS[target].create()
+        self.context = mx_gen_shader.GenContext(self.generator)
+        self.context.registerSourceCodeSearchPath(search_path if search_path else mx.getDefaultDataSearchPath())
+
+        color_system = mx_gen_shader.DefaultColorManagementSystem.create(self.generator.getTarget())
+        color_system.loadLibrary(stdlib)
+        self.generator.setColorManagementSystem(color_system)
+        unit_system = mx_gen_shader.UnitSystem.create(self.generator.getTarget())
+        unit_system.loadLibrary(stdlib)
+        unit_system.setUnitConverterRegistry(mx.UnitConverterRegistry.create())
+        self.generator.setUnitSystem(unit_system)
+
+    def generate(self, element):
+        '''
+        Generate a shader for a renderable element.
+        @param element: The renderable element, such as a material node or a node graph output.
+        @return Dictionary with the element 'name' and 'key', the 'status' 'ok' or 'failed', the generated
+        'source_size' in characters over all stages, the number of 'uniforms', the generation 'time' in
+        seconds and an error 'message'.
+        '''
+        result = {'name': element.getNamePath(), 'key': get_element_key(element), 'status': 'ok',
+                  'source_size': 0, 'uniforms': 0, 'time': 0.0, 'message': ''}
+        start_time = time.perf_counter()
+        try:
+            shader = self.generator.generate(element.getName(), element, self.context)
+        except Exception as e:
+            # Generation errors are raised as various Python exception types
+            result['status'] = 'failed'
+            result['message'] = str(e)
+            shader = None
+        result['time'] = time.perf_counter() - start_time
+
+        if shader:
+            for index in range(shader.numStages()):
+                stage = shader.getStage(index)
+                result['source_size'] += len(stage.getSourceCode())
+                result['uniforms'] += sum(block.size() for block in stage.getUniformBlocks().values())
+        return result
+
+    def check_document(self, doc):
+        '''
+        Generate shaders for all renderable elements of a document.
+        @param doc: The document. It must reference or include the standard library.
+        @return List of results. See generate().
+        '''
+        return [self.generate(element) for element in mx_gen_shader.findRenderableElements(doc)]
+
+def find_regressions(original, roundtrip, size_tolerance=DEFAULT_SIZE_TOLERANCE):
+    '''
+    Compare the shader generation results of an original document and its round trip.
+    A regression is an element which no longer generates, is missing, has more uniforms,
+    or whose generated source grew by more than the tolerance.
+    @param original: The results for the original document. See ShaderGenChecker.check_document().
+    @param roundtrip: The results for the round-tripped document.
+    @param size_tolerance: Fraction by which the source size can grow. Default is DEFAULT_SIZE_TOLERANCE.
+    @return List of dictionaries with the element 'key' and a 'message' describing the regression.
+    '''
+    roundtrip_results = {result['key']: result for result in roundtrip}
+    regressions = []
+    for result in original:
+        if result['status'] != 'ok':
+            continue
+        key = result['key']
+        other = roundtrip_results.get(key)
+        if other is None:
+            message = 'Missing from round trip'
+        elif other['status'] != 'ok':
+            message = f"Shader generation failed: {other['message']}"
+        elif other['uniforms'] > result['uniforms']:
+            message = f"Uniform count increased from {result['uniforms']} to {other['uniforms']}"
+        elif other['source_size'] > result['source_size'] * (1.0 + size_tolerance):
+            message = f"Source size increased from {result['source_size']} to {other['source_size']}"
+        else:
+            continue
+        regressions.append({'key': key, 'message': message})
+    return regressions
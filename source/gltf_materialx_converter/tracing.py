@@ -0,0 +1,181 @@
+'''
+@file tracing.py
+Recording of timed spans as Chrome trace events. The trace file can be opened in a trace
+viewer such as Perfetto or chrome://tracing to see where each document spends time, and the
+utilization of each worker process. Tracing is disabled unless a TraceRecorder is started, in
+which case spans cost very little.
+'''
+import os
+import json
+import time
+import threading
+import contextlib
+
+class TraceRecorder():
+    '''
+    @brief Class recording trace events for one or more processes.
+
+    Timestamps use the system-wide monotonic clock, so events recorded by forked worker
+    processes line up with those of the parent when they are added to its recorder.
+    '''
+
+    def __init__(self):
+        '''
+        Constructor
+
+        **Attributes**
+        - events : list
+            - The recorded trace events.
+        '''
+        self.events = []
+
+    def add_span(self, name, category, start, end, args=None):
+        '''
+        Record a complete span.
+        @param name: The span name.
+        @param category: The span category.
+        @param start: The start time in nanoseconds from time.monotonic_ns().
+        @param end: The end time in nanoseconds from time.monotonic_ns().
+        @param args: Optional dictionary of values to show with the span. Default is None.
+        '''
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': start / 1000.0,
+            'dur': (end - start) / 1000.0,
+            'pid': os.getpid(),
+            'tid': threading.get_ident()
+        }
+        if args:
+            event['args'] = args
+        self.events.append(event)
+
+    def set_process_name(self, name):
+        '''
+        Set the name shown for the current process.
+        @param name: The process name.
+        '''
+        self.events.append({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'args': {'name': name}})
+
+    def take_events(self):
+        '''
+        Remove and return the recorded events.
+        @return The list of events.
+        '''
+        events = self.events
+        self.events = []
+        return events
+
+    def add_events(self, events):
+        '''
+        Add events recorded elsewhere, for instance by a worker process.
+        @param events: The list of events.
+        '''
+        self.events.extend(events)
+
+    def save(self, filename):
+        '''
+        Write the events as a Chrome trace event JSON file.
+        @param filename: The file to write.
+        '''
+        with open(filename, 'w') as f:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, f)
+
+class TraceSpan():
+    '''
+    @brief A span which is recorded when ended.
+    '''
+    __slots__ = ('name', 'category', 'args', 'start')
+
+    def __init__(self, name, category, args):
+        '''
+        Constructor. The span starts when constructed.
+        @param name: The span name.
+        @param category: The span category.
+        @param args: Dictionary of values to show with the span.
+        '''
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = time.monotonic_ns()
+
+    def end(self):
+        '''
+        End the span and record it if tracing is still enabled.
+        '''
+        if _recorder:
+            _recorder.add_span(self.name, self.category, self.start, time.monotonic_ns(), self.args)
+
+class _NullSpan():
+    '''
+    @brief Span returned when tracing is disabled.
+    '''
+    def end(self):
+        pass
+
+## @var _recorder
+#  @brief The active trace recorder, or None if tracing is disabled.
+_recorder = None
+
+## @var _null_span
+#  @brief Shared span used when tracing is disabled.
+_null_span = _NullSpan()
+
+def start_tracing(process_name='main'):
+    '''
+    Enable tracing with a new recorder.
+    @param process_name: The name shown for the current process. Default is 'main'.
+    @return The TraceRecorder.
+    '''
+    global _recorder
+    _recorder = TraceRecorder()
+    _recorder.set_process_name(process_name)
+    return _recorder
+
+def stop_tracing():
+    '''
+    Disable tracing.
+    @return The TraceRecorder which was active, or None.
+    '''
+    global _recorder
+    recorder = _recorder
+    _recorder = None
+    return recorder
+
+def get_recorder():
+    '''
+    Get the active trace recorder.
+    @return The TraceRecorder, or None if tracing is disabled.
+    '''
+    return _recorder
+
+def begin_span(name, category='convert', **args):
+    '''
+    Start a span which is recorded when its end() method is called.
+    @param name: The span name.
+    @param category: The span category. Default is 'convert'.
+    @param args: Values to show with the span.
+    @return The span.
+    '''
+    if not _recorder:
+        return _null_span
+    return TraceSpan(name, category, args)
+
+@contextlib.contextmanager
+def span(name, category='convert', **args):
+    '''
+    Record a span around a block of code.
+    @param name: The span name.
+    @param category: The span category. Default is 'convert'.
+    @param args: Values to show with the span.
+    '''
+    if not _recorder:
+        yield
+        return
+    start = time.monotonic_ns()
+    try:
+        yield
+    finally:
+        if _recorder:
+            _recorder.add_span(name, category, start, time.monotonic_ns(), args)
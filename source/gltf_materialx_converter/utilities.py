@@ -6,6 +6,7 @@ This module contains the utilities for MaterialX glTF Procedural Texture graph c
 '''
 import os
 import json
+import hashlib
 import MaterialX as mx
 import logging as lg 
 
@@ -39,6 +40,17 @@ def create_working_document(libraries):
 
     return doc
 
+def create_reference_document(data_library):
+    '''Create a working document which references a data library instead of 
+    importing a copy of it. This is much cheaper than create_working_document() 
+    when many documents are created using the same library.
+    @param data_library: The data library document to reference.
+    @return: The new working document
+    '''
+    doc = mx.createDocument()
+    doc.setDataLibrary(data_library)
+    return doc
+
 def import_libraries(doc, libraries):
     '''Import libraries into a document.
     @param doc: The document to import into.
@@ -51,8 +63,19 @@ def read_materialX_document(materialx_doc, input_file):
     Read a MaterialX document from a file.
     @param materialx_doc: The MaterialX document to read into.
     @param input_file: The file to read from.
+    @return: The list of files included by the document directly or indirectly, as absolute paths.
     '''
-    mx.readFromXmlFile(materialx_doc, input_file)
+    includes = []
+    def read_include(doc, filename, search_path, options):
+        include_file = os.path.abspath(search_path.find(filename).asString())
+        if include_file not in includes:
+            includes.append(include_file)
+        mx.readFromXmlFile(doc, filename, search_path, options)
+
+    read_options = mx.XmlReadOptions()
+    read_options.readXIncludeFunction = read_include
+    mx.readFromXmlFile(materialx_doc, input_file, mx.FileSearchPath(), read_options)
+    return includes
 
 def materialX_doc_to_string(materialx_doc):
     '''Convert a MaterialX document to a string.
@@ -83,6 +106,14 @@ def get_files(rootPath, extension):
                 filelist.append(os.path.join(subdir, file)) 
     return filelist
 
+def get_file_hash(filename):
+    '''Get a hash of the content of a file.
+    @param filename: The file to hash.
+    @return: The hash as a hexadecimal string.
+    '''
+    with open(filename, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
 def have_version(major, minor, patch):
     '''
     Check if the current vesion matches a given version
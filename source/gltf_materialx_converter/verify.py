@@ -0,0 +1,334 @@
+'''
+@file verify.py
+Round-trip verification of MaterialX and glTF Texture Procedurals documents. Each document is
+converted to the other format and back, and the result is compared structurally with the
+original. The comparison stops at the first difference and reports its path.
+'''
+import os
+import re
+import sys
+import json
+import time
+import fnmatch
+import argparse
+import multiprocessing
+import concurrent.futures
+import logging as lg
+import MaterialX as mx
+
+try:
+    from . import converter as MxGLTFPT
+    from . import utilities as MxGLTFPTUtil
+    from . import diagnostics as MxGLTFPTDiag
+    from . import optimize as MxGLTFPTOptimize
+except ImportError:
+    import converter as MxGLTFPT
+    import utilities as MxGLTFPTUtil
+    import diagnostics as MxGLTFPTDiag
+    import optimize as MxGLTFPTOptimize
+
+## @var VERIFY_EXCLUDED_ATTRIBUTES
+#  @brief MaterialX attributes which are not expected to round-trip and are ignored when comparing.
+VERIFY_EXCLUDED_ATTRIBUTES = ('doc', 'nodedef', 'xpos', 'ypos')
+
+def compare_json(value1, value2, path=''):
+    '''
+    Compare two JSON values structurally. Dictionaries are compared independent of key order,
+    and lists in order. The comparison stops at the first difference.
+    @param value1: The first value.
+    @param value2: The second value.
+    @param path: The path of the values. Default is the root.
+    @return The path of the first difference, or None if the values are equal.
+    '''
+    if isinstance(value1, dict):
+        if not isinstance(value2, dict):
+            return path
+        for key in sorted(value1.keys() | value2.keys()):
+            if key not in value1 or key not in value2:
+                return f'{path}/{key}'
+            difference = compare_json(value1[key], value2[key], f'{path}/{key}')
+            if difference is not None:
+                return difference
+        return None
+
+    if isinstance(value1, list):
+        if not isinstance(value2, list):
+            return path
+        for index, (item1, item2) in enumerate(zip(value1, value2)):
+            difference = compare_json(item1, item2, f'{path}/{index}')
+            if difference is not None:
+                return difference
+        if len(value1) != len(value2):
+            return f'{path}/{min(len(value1), len(value2))}'
+        return None
+
+    # Booleans are not interchangeable with numbers
+    if isinstance(value1, bool) != isinstance(value2, bool) or value1 != value2:
+        return path
+    return None
+
+def compare_materialX(doc1, doc2, excluded_attributes=VERIFY_EXCLUDED_ATTRIBUTES):
+    '''
+    Compare two MaterialX documents structurally. Only the content of the documents is
+    compared, not any data library they reference.
+    @param doc1: The first document.
+    @param doc2: The second document.
+    @param excluded_attributes: Attributes to ignore. Default is VERIFY_EXCLUDED_ATTRIBUTES.
+    @return The path of the first differing element and a message describing the difference.
+    The path is None if the documents are equivalent.
+    '''
+    options = mx.ElementEquivalenceOptions()
+    options.attributeExclusionList = set(excluded_attributes)
+    equivalent, message = doc1.isEquivalent(doc2, options)
+    if equivalent:
+        return None, ''
+    message = message.strip()
+    # The message quotes the name path of the differing element, which is empty for the document
+    match = re.search(r"'([^']*)'", message)
+    return (match.group(1) if match and match.group(1) else '/'), message
+
+class RoundTripVerifier():
+    '''
+    @brief Class which verifies that documents survive a round trip through the other format.
+
+    A single converter and standard library are used for all documents. The result for each
+    document is a dictionary with the following keys:
+    - path : The input file.
+    - status : 'passed', 'failed', 'skipped' if there is nothing to compare, or 'error'.
+    - message : Description of the difference or error.
+    - difference : The path of the first difference, if any.
+    - time : The time taken in seconds.
+    '''
+
+    def __init__(self, stdlib=None, converter=None, skip=None, options=None):
+        '''
+        Constructor
+        @param stdlib: The standard library to use. Default is None meaning to load the standard libraries.
+        @param converter: The converter to use. Default is None meaning to create a new converter.
+        @param skip: List of file name patterns to skip. Default is None.
+        @param options: Optional ConversionOptions to convert with. Default is None meaning the converter's default options.
+        '''
+        if stdlib is None:
+            stdlib, lib_files = MxGLTFPTUtil.load_standard_libraries()
+        self.stdlib = stdlib
+        self.converter = converter if converter else MxGLTFPT.glTFMaterialXConverter()
+        self.skip = list(skip) if skip else []
+        self.options = self.converter.get_options(options)
+
+    def is_skipped(self, input_file):
+        '''
+        Check if a file matches one of the skip patterns.
+        @param input_file: The file.
+        @return True if the file should not be verified.
+        '''
+        file_name = os.path.basename(input_file)
+        return any(fnmatch.fnmatchcase(file_name, pattern) for pattern in self.skip)
+
+    def strip_materialX_document(self, doc):
+        '''
+        Remove the content of a MaterialX document which is generated by conversion
+        from glTF: document and shader metadata and material nodes.
+        @param doc: The document to modify.
+        '''
+        metadata = self.converter.get_metadata()
+        for name in metadata:
+            doc.removeAttribute(name)
+        for material_node in doc.getMaterialNodes():
+            for shader_node in mx.getShaderNodes(material_node):
+                for name in metadata:
+                    shader_node.removeAttribute(name)
+            doc.removeNode(material_node.getName())
+
+    def verify_materialX(self, input_file):
+        '''
+        Verify a MaterialX to glTF to MaterialX round trip. If default values are elided,
+        inputs with default values are removed from both documents before comparing them.
+        @param input_file: The MaterialX file.
+        @return The status, message and difference path.
+        '''
+        diagnostics = MxGLTFPTDiag.Diagnostics(MxGLTFPTDiag.ERROR)
+        orig_doc = MxGLTFPTUtil.create_reference_document(self.stdlib)
+        MxGLTFPTUtil.read_materialX_document(orig_doc, input_file)
+        valid, errors = MxGLTFPTUtil.validate_document(orig_doc)
+        if not valid:
+            return 'error', 'Invalid MaterialX document. Errors: ' + errors, None
+
+        json_string, status = self.converter.materialX_to_glTF(orig_doc, options=self.options, diagnostics=diagnostics)
+        if not json_string:
+            return 'skipped', status, None
+
+        compare_doc = self.converter.gltf_string_to_materialX(json_string, self.stdlib, options=self.options, diagnostics=diagnostics)
+        if not compare_doc:
+            return 'failed', 'Failed to convert glTF back to MaterialX', '/'
+
+        self.strip_materialX_document(orig_doc)
+        self.strip_materialX_document(compare_doc)
+        if self.options.elide_defaults:
+            MxGLTFPTOptimize.remove_default_values(orig_doc)
+        mx.flattenFilenames(orig_doc)
+        difference, message = compare_materialX(orig_doc, compare_doc)
+        if difference is not None:
+            return 'failed', message, difference
+        return 'passed', '', None
+
+    def verify_glTF(self, input_file):
+        '''
+        Verify a glTF to MaterialX to glTF round trip. Graph and material names are
+        not compared as they are generated when missing. If default values are elided, the
+        original glTF document may list values which the round trip leaves implicit, so the
+        MaterialX documents imported from the original and the round-tripped glTF are compared instead.
+        @param input_file: The glTF file.
+        @return The status, message and difference path.
+        '''
+        diagnostics = MxGLTFPTDiag.Diagnostics(MxGLTFPTDiag.ERROR)
+        with open(input_file, 'r') as f:
+            json_string = f.read()
+
+        mxdoc = self.converter.gltf_string_to_materialX(json_string, self.stdlib, options=self.options, diagnostics=diagnostics)
+        if not mxdoc:
+            return 'skipped', 'No procedural graphs converted', None
+        mxdoc.setDataLibrary(self.stdlib)
+        valid, errors = MxGLTFPTUtil.validate_document(mxdoc)
+        if not valid:
+            return 'failed', 'Created invalid MaterialX document. Errors: ' + errors, '/'
+
+        json_string2, status = self.converter.materialX_to_glTF(mxdoc, options=self.options, diagnostics=diagnostics)
+        if not json_string2:
+            return 'failed', f'Failed to convert MaterialX back to glTF: {status}', '/'
+
+        if self.options.elide_defaults:
+            compare_doc = self.converter.gltf_string_to_materialX(json_string2, self.stdlib, options=self.options, diagnostics=diagnostics)
+            if not compare_doc:
+                return 'failed', 'Failed to convert glTF back to MaterialX', '/'
+            difference, message = compare_materialX(mxdoc, compare_doc)
+            if difference is not None:
+                return 'failed', message, difference
+            return 'passed', '', None
+
+        json1 = json.loads(json_string)
+        json2 = json.loads(json_string2)
+        self.converter.glTF_graph_clear_names(json1)
+        self.converter.glTF_graph_clear_names(json2)
+        difference = compare_json(json1, json2)
+        if difference is not None:
+            return 'failed', f'glTF documents differ at: {difference}', difference
+        return 'passed', '', None
+
+    def verify_file(self, input_file):
+        '''
+        Verify the round trip of a file. The direction is chosen by the file extension.
+        Errors are returned in the result rather than raised.
+        @param input_file: The MaterialX or glTF file.
+        @return The result dictionary.
+        '''
+        start_time = time.perf_counter()
+        result = {'path': input_file, 'status': 'skipped', 'message': '', 'difference': None}
+        try:
+            extension = os.path.splitext(input_file)[1]
+            if self.is_skipped(input_file):
+                result['message'] = 'Skipped by pattern'
+            elif extension == '.mtlx':
+                result['status'], result['message'], result['difference'] = self.verify_materialX(input_file)
+            elif extension == '.gltf':
+                result['status'], result['message'], result['difference'] = self.verify_glTF(input_file)
+            else:
+                result['status'] = 'error'
+                result['message'] = f'Unsupported file extension: {extension}'
+        except Exception as e:
+            result['status'] = 'error'
+            result['message'] = f'{type(e).__name__}: {e}'
+        result['time'] = time.perf_counter() - start_time
+        return result
+
+## @var _worker_verifier
+#  @brief The verifier used by worker processes. Set before forking so that workers inherit it.
+_worker_verifier = None
+
+def _verify_worker_file(input_file):
+    '''
+    Verify a file in a worker process using the inherited verifier.
+    @param input_file: The file to verify.
+    @return The result dictionary.
+    '''
+    return _worker_verifier.verify_file(input_file)
+
+def verify_files(file_list, verifier, workers=1):
+    '''
+    Verify a list of files, yielding the results in file order. With more than one worker,
+    files are verified by a pool of forked processes which share the verifier's standard library.
+    @param file_list: The files to verify.
+    @param verifier: The RoundTripVerifier to use.
+    @param workers: Number of worker processes. Default is 1 meaning to verify files in this process.
+    @return Generator of result dictionaries.
+    '''
+    global _worker_verifier
+
+    if workers <= 1:
+        for input_file in file_list:
+            yield verifier.verify_file(input_file)
+        return
+
+    _worker_verifier = verifier
+    try:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork')) as executor:
+            chunk_size = max(1, len(file_list) // (workers * 8))
+            for result in executor.map(_verify_worker_file, file_list, chunksize=chunk_size):
+                yield result
+    finally:
+        _worker_verifier = None
+
+def main():
+    parser = argparse.ArgumentParser(description="Round-trip verification of MaterialX and glTF Texture Procedurals documents.")
+    parser.add_argument(dest="input", nargs='+', help="Input files and / or folders. Folders are searched for .mtlx and .gltf files.")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes. The default is the number of CPUs.')
+    parser.add_argument('--skip', action='append', default=None, help='File name glob pattern of files to skip. Can be specified multiple times.')
+    parser.add_argument('--skipGenerated', action='store_true', help='Skip MaterialX files generated from glTF, ending with _fromgltf.mtlx. Default is False.')
+    parser.add_argument('--elideDefaults', action='store_true', help='Leave input values which equal the node definition default implicit when converting. Default is False.')
+    parser.add_argument('--json', dest='json_output', default=None, help='File to write the results to as JSON.')
+    parser.add_argument('-q', '--quiet', action='store_true', help='Only report failures and errors. Default is False.')
+    opts = parser.parse_args()
+
+    logger = lg.getLogger('verifyCmd')
+    lg.basicConfig(level=lg.INFO)
+
+    if not MxGLTFPTUtil.have_version(1, 39, 2):
+        logger.error("MaterialX version 1.39.2 or higher is required.")
+        sys.exit(-1)
+
+    file_list = []
+    for input_path in opts.input:
+        if os.path.isdir(input_path):
+            file_list.extend(MxGLTFPTUtil.get_files(input_path, '.mtlx'))
+            file_list.extend(MxGLTFPTUtil.get_files(input_path, '.gltf'))
+        elif os.path.isfile(input_path):
+            file_list.append(input_path)
+        else:
+            logger.warning(f'Input not found: {input_path}')
+
+    skip = opts.skip if opts.skip else []
+    if opts.skipGenerated:
+        skip.append('*_fromgltf.mtlx')
+
+    start_time = time.perf_counter()
+    verifier = RoundTripVerifier(skip=skip, options=MxGLTFPT.ConversionOptions(elide_defaults=opts.elideDefaults))
+    counts = {'passed': 0, 'failed': 0, 'skipped': 0, 'error': 0}
+    results = []
+    for result in verify_files(file_list, verifier, opts.workers):
+        results.append(result)
+        counts[result['status']] += 1
+        if result['status'] in ('failed', 'error'):
+            logger.warning(f"{result['status'].upper()}: {result['path']}: {result['message']}")
+        elif not opts.quiet:
+            logger.info(f"{result['status'].upper()}: {result['path']}")
+
+    if opts.json_output:
+        with open(opts.json_output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    logger.info(f"Verified {len(results)} files in {time.perf_counter() - start_time:.2f}s: " +
+                ', '.join(f'{count} {status}' for status, count in counts.items()))
+    if counts['failed'] or counts['error']:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
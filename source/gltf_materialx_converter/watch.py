@@ -0,0 +1,154 @@
+'''
+@file watch.py
+This module contains the file watcher used by the watch mode of the command line utilities.
+Files are polled, so no platform specific notification support is required.
+'''
+import os
+import time
+
+try:
+    from . import utilities as MxGLTFPTUtil
+except ImportError:
+    import utilities as MxGLTFPTUtil
+
+class FileWatcher():
+    '''
+    @brief Class which polls a set of files and folders for changes.
+
+    A file is considered changed when its modification time or size changes and its
+    content hash differs from the last one seen, so saving a file without changing it
+    does not trigger a conversion. Changes are reported once no further changes have been
+    seen for the debounce interval, so that a burst of saves is handled as a single batch.
+    '''
+
+    def __init__(self, paths, extension, interval=0.2, debounce=0.3):
+        '''
+        Constructor. The current state of the files is recorded as the starting point.
+        @param paths: List of files and / or folders to watch.
+        @param extension: The file extension of files to watch in folders.
+        @param interval: Time between polls in seconds. Default is 0.2.
+        @param debounce: Time in seconds without changes before changes are reported. Default is 0.3.
+
+        **Attributes**
+        - files : dict
+            - The [modification time, size, hash] last seen for each file.
+
+        - pending : dict
+            - The time of the last change seen for each changed file which is not yet reported.
+
+        - extra_files : set
+            - Additional files to watch, such as files included by the watched files.
+        '''
+        self.paths = paths
+        self.extension = extension
+        self.interval = interval
+        self.debounce = debounce
+        self.files = {}
+        self.pending = {}
+        self.extra_files = set()
+        self.poll()
+        self.pending = {}
+
+    def add_files(self, file_list):
+        '''
+        Add files to watch in addition to the watched paths. The current state of
+        files which are not already watched is recorded as the starting point.
+        @param file_list: The files to add.
+        '''
+        for path in file_list:
+            if path in self.extra_files:
+                continue
+            self.extra_files.add(path)
+            if path not in self.files:
+                try:
+                    stat = os.stat(path)
+                    self.files[path] = [stat.st_mtime_ns, stat.st_size, MxGLTFPTUtil.get_file_hash(path)]
+                except OSError:
+                    pass
+
+    def list_files(self):
+        '''
+        List the files currently being watched.
+        @return List of file paths.
+        '''
+        file_list = []
+        for path in self.paths:
+            if os.path.isdir(path):
+                file_list.extend(MxGLTFPTUtil.get_files(path, self.extension))
+            elif os.path.isfile(path):
+                file_list.append(path)
+        listed = set(file_list)
+        for path in sorted(self.extra_files):
+            if path not in listed and os.path.isfile(path):
+                file_list.append(path)
+        return file_list
+
+    def poll(self):
+        '''
+        Check all files once, recording any which were added, changed or deleted as pending.
+        @return True if any changes were found.
+        '''
+        now = time.monotonic()
+        found = False
+        current = set()
+        for path in self.list_files():
+            try:
+                stat = os.stat(path)
+                entry = self.files.get(path)
+                if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+                    current.add(path)
+                    continue
+                digest = MxGLTFPTUtil.get_file_hash(path)
+            except OSError:
+                continue
+
+            current.add(path)
+            self.files[path] = [stat.st_mtime_ns, stat.st_size, digest]
+            if entry and entry[2] == digest:
+                continue
+            self.pending[path] = now
+            found = True
+
+        for path in list(self.files):
+            if path not in current:
+                del self.files[path]
+                self.pending[path] = now
+                found = True
+        return found
+
+    def get_changes(self):
+        '''
+        Get the pending changes if no changes have been seen for the debounce interval.
+        The changes are no longer pending once returned.
+        @return Sorted lists of changed and deleted files. Both are empty if there are no changes ready.
+        '''
+        if not self.pending or time.monotonic() - max(self.pending.values()) < self.debounce:
+            return [], []
+        changed = sorted(path for path in self.pending if path in self.files)
+        deleted = sorted(path for path in self.pending if path not in self.files)
+        self.pending = {}
+        return changed, deleted
+
+    def wait_for_changes(self):
+        '''
+        Poll until changes are ready.
+        @return Sorted lists of changed and deleted files.
+        '''
+        while True:
+            self.poll()
+            changed, deleted = self.get_changes()
+            if changed or deleted:
+                return changed, deleted
+            time.sleep(self.interval)
+
+    def watch(self, callback):
+        '''
+        Call a function for each batch of changes until interrupted.
+        @param callback: Function taking the lists of changed and deleted files.
+        '''
+        try:
+            while True:
+                changed, deleted = self.wait_for_changes()
+                callback(changed, deleted)
+        except KeyboardInterrupt:
+            pass
@@ -8,12 +8,35 @@ import logging as lg
 import MaterialX as mx
 
 import json
+import base64
+import struct
+import concurrent.futures
+import tempfile
+import io
+import socket
+import signal
+import subprocess
+import sys
 import jsonschema
 from jsonschema import validate as json_validate
 
 # Add the src directory to the sys.path
 from gltf_materialx_converter import converter as MxGLTFPT
 from gltf_materialx_converter import utilities as MxGLTFPTUtil
+from gltf_materialx_converter import diagnostics as MxGLTFPTDiag
+from gltf_materialx_converter import jobs as MxGLTFPTJobs
+from gltf_materialx_converter import server as MxGLTFPTServer
+from gltf_materialx_converter import watch as MxGLTFPTWatch
+from gltf_materialx_converter import dependencies as MxGLTFPTDeps
+from gltf_materialx_converter import verify as MxGLTFPTVerify
+from gltf_materialx_converter import manifest as MxGLTFPTManifest
+from gltf_materialx_converter import report as MxGLTFPTReport
+from gltf_materialx_converter import tracing as MxGLTFPTTrace
+from gltf_materialx_converter import optimize as MxGLTFPTOptimize
+from gltf_materialx_converter import cost as MxGLTFPTCost
+from gltf_materialx_converter import shadergen as MxGLTFPTShaderGen
+from gltf_materialx_converter import bake as MxGLTFPTBake
+from gltf_materialx_converter import batch as MxGLTFPTBatch
 
 import importlib.util
 
@@ -282,5 +305,1198 @@ class TestConvertToMtlx(unittest.TestCase):
                         f.write(jsonString2)
                 self.assertTrue(jsonString == jsonString2)
 
+class TestConvertToMtlxShared(unittest.TestCase):
+    '''
+    Test that conversion from GLTF Procedural Texture to MaterialX does not modify the glTF document
+    '''
+    def test_convert_to_mtlx_shared(self):
+
+        current_folder = os.path.dirname(__file__)
+        stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+        converter = MxGLTFPT.glTFMaterialXConverter()
+
+        for file_name in ['noname_checkerboard_graph.gltf', 'shader_procedural_3.gltf']:
+            json_string = getGLTFDocument(self, os.path.join(current_folder, 'data', file_name))
+            gltf_doc = json.loads(json_string)
+
+            # Convert the same parsed document twice
+            mxdoc = converter.glTF_to_materialX(gltf_doc, stdlib)
+            self.assertEqual(gltf_doc, json.loads(json_string))
+            mxdoc2 = converter.glTF_to_materialX(gltf_doc, stdlib)
+            self.assertEqual(gltf_doc, json.loads(json_string))
+            self.assertEqual(MxGLTFPTUtil.materialX_doc_to_string(mxdoc), MxGLTFPTUtil.materialX_doc_to_string(mxdoc2))
+
+class TestBundleFromMtlx(unittest.TestCase):
+    '''
+    Test conversion of multiple MaterialX documents into a single glTF document
+    '''
+    def test_bundle_from_mtlx(self):
+
+        current_folder = os.path.dirname(__file__)
+        input_file = os.path.join(current_folder, 'data', 'minimal_graph.mtlx')
+        mxdoc = get_materialX_document(self, input_file)
+
+        converter = MxGLTFPT.glTFMaterialXConverter()
+
+        # Name collisions must be resolved
+        json_string, status = converter.materialX_documents_to_glTF([mxdoc, mxdoc])
+        json_data = json.loads(json_string)
+        procs = json_data['extensions'][MxGLTFPT.KHR_TEXTURE_PROCEDURALS]['procedurals']
+        self.assertEqual(len(procs), 2)
+        self.assertNotEqual(procs[0]['name'], procs[1]['name'])
+        self.assertEqual(len(json_data['materials']), 2)
+        self.assertNotEqual(json_data['materials'][0]['name'], json_data['materials'][1]['name'])
+        self.assertEqual(len(json_data['textures']), 1)
+
+        # Identical graphs are shared if requested
+        json_string, status = converter.materialX_documents_to_glTF([mxdoc, mxdoc], share_graphs=True)
+        json_data = json.loads(json_string)
+        procs = json_data['extensions'][MxGLTFPT.KHR_TEXTURE_PROCEDURALS]['procedurals']
+        self.assertEqual(len(procs), 1)
+        for material in json_data['materials']:
+            lookup = material['pbrMetallicRoughness']['baseColorTexture']['extensions'][MxGLTFPT.KHR_TEXTURE_PROCEDURALS]
+            self.assertEqual(lookup['index'], 0)
+
+class TestSplitFromMtlx(unittest.TestCase):
+    '''
+    Test conversion of a MaterialX document into one glTF document per material
+    '''
+    def test_split_from_mtlx(self):
+
+        current_folder = os.path.dirname(__file__)
+        input_file = os.path.join(current_folder, 'data', 'shader_procedural_3.mtlx')
+        mxdoc = get_materialX_document(self, input_file)
+
+        converter = MxGLTFPT.glTFMaterialXConverter()
+        results = converter.materialX_to_glTF_per_material(mxdoc)
+        self.assertEqual(len(results), len(mxdoc.getMaterialNodes()))
+        for material_name, json_string, status in results:
+            self.assertTrue(len(json_string) > 0)
+            json_data = json.loads(json_string)
+            self.assertEqual(len(json_data['materials']), 1)
+
+            # Only graphs referenced by the material are included
+            procs = json_data['extensions'][MxGLTFPT.KHR_TEXTURE_PROCEDURALS]['procedurals']
+            material = json_data['materials'][0]
+            referenced = set()
+            for texture_info in converter.get_material_textures(material):
+                referenced.add(texture_info['extensions'][MxGLTFPT.KHR_TEXTURE_PROCEDURALS]['index'])
+            self.assertEqual(referenced, set(range(len(procs))))
+
+class TestSelection(unittest.TestCase):
+    '''
+    Test selective conversion by material and node graph name
+    '''
+    def test_selection(self):
+
+        current_folder = os.path.dirname(__file__)
+        input_file = os.path.join(current_folder, 'data', 'shader_procedural_3.mtlx')
+        mxdoc = get_materialX_document(self, input_file)
+
+        converter = MxGLTFPT.glTFMaterialXConverter()
+
+        # Export a single material
+        selection = MxGLTFPT.ConversionFilter(materials=['material_1'])
+        json_string, status = converter.materialX_to_glTF(mxdoc, selection)
+        json_data = json.loads(json_string)
+        procs = json_data['extensions'][MxGLTFPT.KHR_TEXTURE_PROCEDURALS]['procedurals']
+        self.assertEqual([proc['name'] for proc in procs], ['shared_procedural'])
+        self.assertEqual([material['name'] for material in json_data['materials']], ['gltf_shader_1'])
+
+        # Export everything except a graph
+        selection = MxGLTFPT.ConversionFilter(exclude_nodegraphs=['shared_procedural_*'])
+        json_string, status = converter.materialX_to_glTF(mxdoc, selection)
+        json_data = json.loads(json_string)
+        procs = json_data['extensions'][MxGLTFPT.KHR_TEXTURE_PROCEDURALS]['procedurals']
+        self.assertEqual([proc['name'] for proc in procs], ['shared_procedural'])
+        self.assertEqual(len(json_data['materials']), 2)
+
+        # Import a single material
+        stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+        json_string, status = converter.materialX_to_glTF(mxdoc)
+        selection = MxGLTFPT.ConversionFilter(materials=['gltf_shader_2'])
+        compare_doc = converter.gltf_string_to_materialX(json_string, stdlib, selection)
+        self.assertEqual([ng.getName() for ng in compare_doc.getNodeGraphs()], ['shared_procedural_2'])
+        self.assertEqual([m.getName() for m in compare_doc.getMaterialNodes()], ['MATERIAL_gltf_shader_2'])
+
+        # Selecting only a node graph converts no materials or shaders, on export and import
+        selection = MxGLTFPT.ConversionFilter(nodegraphs=['shared_procedural_2'])
+        self.assertFalse(selection.accept_material('material_1'))
+        self.assertFalse(selection.accept_shader('gltf_shader_1', 'material_1'))
+        self.assertEqual([ng.getName() for ng in selection.find_nodegraphs(mxdoc)], ['shared_procedural_2'])
+        graph_json_string, status = converter.materialX_to_glTF(mxdoc, selection)
+        json_data = json.loads(graph_json_string)
+        procs = json_data['extensions'][MxGLTFPT.KHR_TEXTURE_PROCEDURALS]['procedurals']
+        self.assertEqual([proc['name'] for proc in procs], ['shared_procedural_2'])
+        self.assertNotIn('materials', json_data)
+        compare_doc = converter.gltf_string_to_materialX(json_string, stdlib, selection)
+        self.assertEqual([ng.getName() for ng in compare_doc.getNodeGraphs()], ['shared_procedural_2'])
+        self.assertEqual(compare_doc.getMaterialNodes(), [])
+
+        # Shaders without include patterns are selected through a selected material
+        selection = MxGLTFPT.ConversionFilter(materials=['material_1'], nodegraphs=['shared_procedural_2'])
+        self.assertTrue(selection.accept_shader('gltf_shader_1', 'material_1'))
+        self.assertFalse(selection.accept_shader('gltf_shader_2', 'material_2'))
+
+class TestConcurrentOptions(unittest.TestCase):
+    '''
+    Test concurrent conversions sharing a converter with per-call options
+    '''
+    def test_concurrent_options(self):
+
+        current_folder = os.path.dirname(__file__)
+        input_file = os.path.join(current_folder, 'data', 'checkerboard_graph.mtlx')
+        converter = MxGLTFPT.glTFMaterialXConverter()
+        default_string, status = converter.materialX_to_glTF(get_materialX_document(self, input_file))
+
+        # Strip all metadata on alternate calls
+        no_metadata = converter.options.replace(metadata=[], graph_metadata=[])
+        documents = [get_materialX_document(self, input_file) for i in range(8)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            futures = [executor.submit(converter.materialX_to_glTF, doc, None, no_metadata if i % 2 else None)
+                       for i, doc in enumerate(documents)]
+            results = [future.result()[0] for future in futures]
+
+        for i, json_string in enumerate(results):
+            if i % 2:
+                self.assertNotEqual(json_string, default_string)
+                self.assertNotIn('"xpos"', json_string)
+            else:
+                self.assertEqual(json_string, default_string)
+
+        # Default options are not modified by per-call options
+        self.assertEqual(converter.get_metadata(), list(MxGLTFPT.MTLX_SUPPORTED_METADATA))
+
+class TestDiagnostics(unittest.TestCase):
+    '''
+    Test recording of conversion diagnostics
+    '''
+    def test_diagnostics(self):
+
+        current_folder = os.path.dirname(__file__)
+        stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+        converter = MxGLTFPT.glTFMaterialXConverter()
+        json_string = getGLTFDocument(self, os.path.join(current_folder, 'data', 'shader_procedural_3.gltf'))
+
+        # Nothing is logged unless requested
+        with self.assertNoLogs('glTFMtlx', level=lg.DEBUG):
+            converter.gltf_string_to_materialX(json_string, stdlib)
+
+        diagnostics = MxGLTFPTDiag.Diagnostics(MxGLTFPTDiag.DEBUG)
+        mxdoc = converter.gltf_string_to_materialX(json_string, stdlib, diagnostics=diagnostics)
+        self.assertFalse(diagnostics.has_errors())
+        graph_events = [event for event in diagnostics.get_events() if event.code == 'create_nodegraph']
+        self.assertEqual([event.get_path() for event in graph_events], [ng.getName() for ng in mxdoc.getNodeGraphs()])
+        material_events = diagnostics.to_list(MxGLTFPTDiag.INFO)
+        self.assertIn({'severity': 'INFO', 'code': 'import_material', 'path': 'MATERIAL_gltf_shader_1', 
+                       'message': 'Import material. Shader: gltf_shader_1'}, material_events)
+        self.assertEqual(diagnostics.counts['import_material'], len(mxdoc.getMaterialNodes()))
+
+        # Events below the collector level are counted but not kept
+        diagnostics = MxGLTFPTDiag.Diagnostics(MxGLTFPTDiag.WARNING)
+        converter.gltf_string_to_materialX(json_string, stdlib, diagnostics=diagnostics)
+        self.assertEqual(diagnostics.get_events(), [])
+        self.assertEqual(diagnostics.counts['import_material'], len(mxdoc.getMaterialNodes()))
+        self.assertNotIn('scan_nodes', diagnostics.counts)
+
+        # Errors are reported with the element path
+        mxdoc = get_materialX_document(self, os.path.join(current_folder, 'data', 'checkerboard_graph.mtlx'))
+        graph = [ng for ng in mxdoc.getNodeGraphs() if not ng.hasSourceUri()][0]
+        graph.addNode('no_such_node', 'bad_node', 'float')
+        diagnostics = MxGLTFPTDiag.Diagnostics()
+        converter.materialX_to_glTF(mxdoc, diagnostics=diagnostics)
+        errors = diagnostics.get_events(MxGLTFPTDiag.ERROR)
+        self.assertEqual([(event.code, event.get_path()) for event in errors], [('missing_nodedef', graph.getName() + '/bad_node')])
+
+class TestJobRunner(unittest.TestCase):
+    '''
+    Test running conversion requests with a warm converter
+    '''
+    def test_job_runner(self):
+
+        current_folder = os.path.dirname(__file__)
+        input_file = os.path.join(current_folder, 'data', 'shader_procedural_3.mtlx')
+        runner = MxGLTFPTJobs.ConversionJobRunner()
+
+        # Path and inline requests match direct conversion
+        expected, status = MxGLTFPT.glTFMaterialXConverter().materialX_to_glTF(get_materialX_document(self, input_file))
+        result = runner.run({'id': 1, 'direction': 'mtlx2gltf', 'path': input_file})
+        self.assertEqual(result['id'], 1)
+        self.assertEqual(result['status'], 'ok')
+        self.assertEqual(result['document'], expected)
+        with open(input_file, 'r') as f:
+            result = runner.run({'direction': 'mtlx2gltf', 'document': f.read()})
+        self.assertEqual(result['document'], expected)
+
+        # Options and selection are applied per request
+        result = runner.run({'direction': 'gltf2mtlx', 'document': json.loads(expected),
+                             'options': {'metadata': []}, 'selection': {'materials': ['gltf_shader_1']}})
+        self.assertEqual(result['status'], 'ok')
+        mxdoc = mx.createDocument()
+        mx.readFromXmlString(mxdoc, result['document'])
+        self.assertEqual([m.getName() for m in mxdoc.getMaterialNodes()], ['MATERIAL_gltf_shader_1'])
+        self.assertEqual(runner.converter.get_metadata(), list(MxGLTFPT.MTLX_SUPPORTED_METADATA))
+
+        # Errors are returned rather than raised
+        result = runner.run({'direction': 'unknown', 'path': input_file})
+        self.assertEqual(result['status'], 'error')
+        result = runner.run({'direction': 'mtlx2gltf', 'path': 'no_such_file.mtlx'})
+        self.assertEqual(result['status'], 'error')
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'Requires fork()')
+class TestServer(unittest.TestCase):
+    '''
+    Test the pre-fork conversion server
+    '''
+    def test_server(self):
+
+        current_folder = os.path.dirname(__file__)
+        input_file = os.path.join(current_folder, 'data', 'minimal_graph.mtlx')
+        request = json.dumps({'direction': 'mtlx2gltf', 'path': input_file}).encode('utf-8') + b'\n'
+
+        with tempfile.TemporaryDirectory() as temp_folder:
+            socket_path = os.path.join(temp_folder, 'server.sock')
+            server = MxGLTFPTServer.ConversionServer(socket_path, workers=1, max_jobs=2)
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    server.serve_forever()
+                finally:
+                    os._exit(0)
+            try:
+                # The worker is recycled after two jobs, which closes the connection
+                for expected_results in [2, 1]:
+                    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                        client.connect(socket_path)
+                        stream = client.makefile('rwb')
+                        results = []
+                        for i in range(expected_results):
+                            stream.write(request)
+                            stream.flush()
+                            results.append(json.loads(stream.readline()))
+                        self.assertTrue(all(result['status'] == 'ok' for result in results))
+                        if expected_results == 2:
+                            self.assertEqual(stream.readline(), b'')
+            finally:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+                server.server.server_close()
+            self.assertFalse(os.path.exists(socket_path))
+
+class TestStreamRequests(unittest.TestCase):
+    '''
+    Test running newline-delimited JSON requests from a stream
+    '''
+    def test_stream_requests(self):
+
+        current_folder = os.path.dirname(__file__)
+        file_names = ['checkerboard_graph.mtlx', 'minimal_graph.mtlx', 'shader_procedural_3.mtlx']
+        lines = [json.dumps({'id': i, 'path': os.path.join(current_folder, 'data', file_names[i % 3])}) for i in range(6)]
+        lines.insert(3, 'not a request')
+        runner = MxGLTFPTJobs.ConversionJobRunner()
+
+        expected = None
+        for workers in ([1, 2] if hasattr(os, 'fork') else [1]):
+            output_stream = io.StringIO()
+            count = MxGLTFPTJobs.run_ndjson_stream(io.StringIO('\n'.join(lines)), output_stream, runner, workers, 
+                                                   direction=MxGLTFPTJobs.MTLX_TO_GLTF)
+            self.assertEqual(count, len(lines))
+
+            # Results are written in request order
+            results = [json.loads(line) for line in output_stream.getvalue().splitlines()]
+            self.assertEqual([result.get('id') for result in results], [0, 1, 2, None, 3, 4, 5])
+            self.assertEqual([result['status'] for result in results], ['ok'] * 3 + ['error'] + ['ok'] * 3)
+            documents = [result.get('document') for result in results]
+            if expected:
+                self.assertEqual(documents, expected)
+            expected = documents
+
+class TestFileWatcher(unittest.TestCase):
+    '''
+    Test polling files for changes
+    '''
+    def test_file_watcher(self):
+
+        with tempfile.TemporaryDirectory() as temp_folder:
+            def write_file(file_name, text):
+                with open(os.path.join(temp_folder, file_name), 'w') as f:
+                    f.write(text)
+                return os.path.join(temp_folder, file_name)
+
+            first_file = write_file('first.mtlx', 'first')
+            second_file = write_file('second.mtlx', 'second')
+            write_file('ignored.txt', 'ignored')
+            watcher = MxGLTFPTWatch.FileWatcher([temp_folder], '.mtlx', debounce=0)
+            self.assertFalse(watcher.poll())
+            self.assertEqual(watcher.get_changes(), ([], []))
+
+            # Rewriting a file with the same content is not a change
+            write_file('first.mtlx', 'first')
+            os.utime(first_file, ns=(0, 0))
+            self.assertFalse(watcher.poll())
+
+            # Changes are reported together
+            write_file('first.mtlx', 'first edited')
+            third_file = write_file('third.mtlx', 'third')
+            os.remove(second_file)
+            self.assertTrue(watcher.poll())
+            self.assertEqual(watcher.get_changes(), ([first_file, third_file], [second_file]))
+            self.assertEqual(watcher.get_changes(), ([], []))
+
+            # Changes are held back until there are none for the debounce time
+            watcher.debounce = 60
+            write_file('third.mtlx', 'third edited')
+            self.assertTrue(watcher.poll())
+            self.assertEqual(watcher.get_changes(), ([], []))
+            watcher.debounce = 0
+            self.assertEqual(watcher.get_changes(), ([third_file], []))
+
+class TestDependencies(unittest.TestCase):
+    '''
+    Test tracking included files for incremental conversion
+    '''
+    def test_dependencies(self):
+
+        with tempfile.TemporaryDirectory() as temp_folder:
+            def write_file(file_name, text):
+                file_path = os.path.join(temp_folder, file_name)
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                with open(file_path, 'w') as f:
+                    f.write('<?xml version="1.0"?>\n<materialx version="1.39">\n' + text + '\n</materialx>\n')
+                return file_path
+
+            # Nested includes are resolved relative to the including file
+            leaf_file = write_file('lib/sub/leaf.mtlx', '<constant name="leaf" type="float" />')
+            shared_file = write_file('lib/shared.mtlx', '<xi:include href="sub/leaf.mtlx" />')
+            document_file = write_file('document.mtlx', '<xi:include href="lib/shared.mtlx" />')
+            output_file = write_file('document_out.mtlx', '')
+
+            mxdoc = mx.createDocument()
+            includes = MxGLTFPTUtil.read_materialX_document(mxdoc, document_file)
+            self.assertEqual(includes, [shared_file, leaf_file])
+            self.assertTrue(mxdoc.getNode('leaf'))
+
+            dependencies = MxGLTFPTDeps.DependencyTable({'bundle': None})
+            dependencies.set_document(document_file, includes, [output_file])
+            self.assertTrue(dependencies.is_up_to_date(document_file))
+            self.assertEqual(dependencies.get_dependents(leaf_file), [document_file])
+
+            # Touching a file without changing it does not require conversion
+            os.utime(leaf_file, ns=(0, 0))
+            self.assertTrue(dependencies.is_up_to_date(document_file))
+
+            # The table is only loaded with matching settings
+            table_file = os.path.join(temp_folder, MxGLTFPTDeps.DEPENDENCIES_FILE)
+            dependencies.save(table_file)
+            self.assertFalse(MxGLTFPTDeps.DependencyTable({'bundle': 'bundle.gltf'}).load(table_file))
+            dependencies = MxGLTFPTDeps.DependencyTable({'bundle': None})
+            self.assertTrue(dependencies.load(table_file))
+            self.assertTrue(dependencies.is_up_to_date(document_file))
+
+            # Changing an included file or removing an output requires conversion
+            write_file('lib/sub/leaf.mtlx', '<constant name="leaf" type="color3" />')
+            self.assertFalse(dependencies.is_up_to_date(document_file))
+            dependencies.set_document(document_file, includes, [output_file])
+            os.remove(output_file)
+            self.assertFalse(dependencies.is_up_to_date(document_file))
+            self.assertEqual(dependencies.remove_document(document_file), [output_file])
+            self.assertEqual(dependencies.get_dependents(leaf_file), [])
+
+class TestVerify(unittest.TestCase):
+    '''
+    Test round-trip verification
+    '''
+    def test_verify(self):
+
+        if not MxGLTFPTUtil.have_version(1, 39, 2):
+            print("MaterialX version 1.39.2 or higher is required for this test.")
+            return
+
+        # The first difference is reported
+        self.assertIsNone(MxGLTFPTVerify.compare_json({'a': [1, {'b': 2}]}, {'a': [1, {'b': 2}]}))
+        self.assertEqual(MxGLTFPTVerify.compare_json({'a': [1, {'b': 2}], 'c': 0}, {'a': [1, {'b': 3}], 'c': 1}), '/a/1/b')
+        self.assertEqual(MxGLTFPTVerify.compare_json({'a': [1]}, {'a': [1, 2]}), '/a/1')
+        self.assertEqual(MxGLTFPTVerify.compare_json({'a': 1}, {'a': True}), '/a')
+
+        current_folder = os.path.dirname(__file__)
+        data_folder = os.path.join(current_folder, 'data')
+        file_list = MxGLTFPTUtil.get_files(data_folder, '.mtlx') + MxGLTFPTUtil.get_files(data_folder, '.gltf')
+
+        # These intentionally do not round trip as their shaders are not converted
+        skip = ['unsupported_stdsurf*', 'no_material.*']
+        verifier = MxGLTFPTVerify.RoundTripVerifier(skip=skip)
+        results = list(MxGLTFPTVerify.verify_files(file_list, verifier))
+        self.assertEqual([result['path'] for result in results], file_list)
+        for result in results:
+            self.assertIn(result['status'], ['passed', 'skipped'], f"{result['path']}: {result['message']}")
+
+        # Unskipped, a difference is found
+        verifier.skip = []
+        result = verifier.verify_file(os.path.join(data_folder, 'unsupported_stdsurf.mtlx'))
+        self.assertEqual(result['status'], 'failed')
+        self.assertIsNotNone(result['difference'])
+
+        if hasattr(os, 'fork'):
+            verifier.skip = skip
+            parallel_results = list(MxGLTFPTVerify.verify_files(file_list, verifier, workers=2))
+            self.assertEqual([result['status'] for result in parallel_results], [result['status'] for result in results])
+
+class TestWorkerPool(unittest.TestCase):
+    '''
+    Test recycling worker processes by job count and memory budget
+    '''
+    @unittest.skipUnless(hasattr(os, 'fork'), 'Requires fork()')
+    def test_worker_pool(self):
+
+        current_folder = os.path.dirname(__file__)
+        file_names = ['checkerboard_graph.mtlx', 'minimal_graph.mtlx', 'shader_procedural_3.mtlx']
+        requests = [{'id': i, 'direction': MxGLTFPTJobs.MTLX_TO_GLTF, 'path': os.path.join(current_folder, 'data', file_names[i % 3])} for i in range(6)]
+        runner = MxGLTFPTJobs.ConversionJobRunner(track_memory=True)
+
+        # Workers are replaced after each job, or after any job when the budget is tiny
+        for max_jobs, memory_budget in [(1, 0), (0, 1)]:
+            with MxGLTFPTJobs.ConversionWorkerPool(runner, 2, max_jobs, memory_budget) as pool:
+                tickets = [pool.submit(request) for request in requests]
+                results = [pool.get_result(ticket) for ticket in tickets]
+                self.assertEqual(pool.recycled, len(requests))
+                self.assertEqual(len(pool.peak_rss), len(requests))
+            self.assertEqual([result['id'] for result in results], list(range(6)))
+            self.assertEqual([result['status'] for result in results], ['ok'] * 6)
+
+        # Memory is reported per request and summarized
+        summary = MxGLTFPTJobs.BatchSummary()
+        for request, result in zip(requests, results):
+            self.assertGreater(result['memory']['rss'], 0)
+            self.assertGreater(result['memory']['peak_allocated'], 0)
+            summary.add_result(result, request)
+        report = summary.get_report(top=2)
+        self.assertEqual(len(summary.memory), len(requests))
+        self.assertEqual(len([line for line in report if line.startswith('- ')]), 2)
+
+        # A single worker is still recycled when a limit is given
+        summary = MxGLTFPTJobs.BatchSummary()
+        lines = '\n'.join(json.dumps(request) for request in requests)
+        MxGLTFPTJobs.run_ndjson_stream(io.StringIO(lines), io.StringIO(), runner, 1, max_jobs=2, summary=summary)
+        self.assertEqual(summary.errors, 0)
+        self.assertEqual(summary.recycled, len(requests) // 2)
+
+        # Files are converted by worker processes, with the memory used by each in the run report
+        script = os.path.join(os.path.dirname(MxGLTFPTJobs.__file__), 'materialx_to_gltf.py')
+        input_files = [os.path.join(current_folder, 'data', name) for name in file_names]
+        with tempfile.TemporaryDirectory() as temp_folder:
+            report_file = os.path.join(temp_folder, 'report.json')
+            command = [sys.executable, script] + input_files + ['-o', temp_folder, '-q', '--workers', '2', '--maxJobs', '1', '--report', report_file]
+            self.assertEqual(subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode, 0)
+            with open(report_file, 'r') as f:
+                entries = json.load(f)['entries']
+            self.assertEqual([entry['input'] for entry in entries], input_files)
+            self.assertEqual([entry['status'] for entry in entries], ['ok'] * len(input_files))
+            for entry in entries:
+                self.assertGreater(entry['rss'], 0)
+                self.assertGreater(entry['peak_rss'], 0)
+                self.assertIsNone(entry['allocated'])
+                self.assertTrue(os.path.exists(entry['outputs'][0]))
+
+class TestFileBatch(unittest.TestCase):
+    '''
+    Test converting batches of files in this process and in worker processes
+    '''
+    def test_file_batch(self):
+
+        current_folder = os.path.dirname(__file__)
+        input_files = [os.path.join(current_folder, 'data', name) for name in ['checkerboard_graph.mtlx', 'minimal_graph.mtlx', 'shader_procedural_3.mtlx']]
+        stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+        converter = MxGLTFPT.glTFMaterialXConverter()
+        diagnostics = MxGLTFPTDiag.Diagnostics()
+        logger = lg.getLogger('test')
+        self.assertIsNone(MxGLTFPTBatch.get_worker_pool(None))
+
+        with tempfile.TemporaryDirectory() as temp_folder:
+            outputs = []
+            for workers, max_jobs in ([(1, 0), (2, 1)] if hasattr(os, 'fork') else [(1, 0)]):
+                output_folder = os.path.join(temp_folder, f'gltf_{workers}')
+                os.makedirs(output_folder)
+                runner = MxGLTFPTBatch.MaterialXFileRunner(converter, stdlib, output_folder, diagnostics=diagnostics, logger=logger)
+                pool = MxGLTFPTBatch.get_worker_pool(runner, workers, max_jobs)
+                self.assertEqual(pool is None, workers == 1)
+                dependencies = MxGLTFPTDeps.DependencyTable()
+                results = list(MxGLTFPTBatch.run_file_batch(input_files, runner, pool))
+                if pool:
+                    self.assertEqual(pool.recycled, len(input_files))
+                    pool.close()
+
+                # Results are in input order, with statistics and the memory used
+                self.assertEqual([input_file for input_file, result in results], input_files)
+                for input_file, result in results:
+                    self.assertEqual(result['status'], 'ok')
+                    self.assertGreater(result['statistics'].memory['rss'], 0)
+                    self.assertIn('convert', result['statistics'].timings)
+                    self.assertEqual(MxGLTFPTBatch.apply_document_result(input_file, result, dependencies, logger), ('ok', result['outputs']))
+                    self.assertTrue(dependencies.is_up_to_date(input_file))
+                outputs.append([open(result['outputs'][0]).read() for input_file, result in results])
+            self.assertEqual(outputs[0], outputs[-1])
+
+            # Converted glTF files are converted back next to them
+            gltf_files = [result['outputs'][0] for input_file, result in results]
+            runner = MxGLTFPTBatch.glTFFileRunner(converter, stdlib, diagnostics=diagnostics, logger=logger, trace_allocations=True)
+            for input_file, result in MxGLTFPTBatch.run_file_batch(gltf_files, runner):
+                self.assertEqual(result['status'], 'ok')
+                self.assertEqual(result['outputs'], [MxGLTFPTBatch.get_materialX_output_file(input_file)])
+                self.assertTrue(os.path.exists(result['outputs'][0]))
+                self.assertGreater(result['statistics'].memory['allocated'], 0)
+
+            # Errors are returned as results
+            input_file, result = next(MxGLTFPTBatch.run_file_batch([os.path.join(temp_folder, 'missing.gltf')], runner))
+            self.assertEqual(result['status'], 'error')
+            self.assertIn('message', result)
+            self.assertEqual(result['outputs'], [])
+
+class TestShards(unittest.TestCase):
+    '''
+    Test sharded conversion and merging of shard manifests
+    '''
+    def test_shards(self):
+
+        self.assertEqual(MxGLTFPTManifest.parse_shard('1/3'), (1, 3))
+        with self.assertRaises(ValueError):
+            MxGLTFPTManifest.parse_shard('3/3')
+
+        # Shards partition the files independent of where they are located
+        file_names = [f'graph_{i}.mtlx' for i in range(20)] + [f'sub/graph_{i}.mtlx' for i in range(20)]
+        shards = [MxGLTFPTManifest.select_shard([os.path.join('a', name) for name in file_names], i, 3) for i in range(3)]
+        moved = [MxGLTFPTManifest.select_shard([os.path.join('b', 'c', name) for name in file_names], i, 3) for i in range(3)]
+        self.assertEqual(sorted(name for shard in shards for name in shard), sorted(os.path.join('a', name) for name in file_names))
+        self.assertEqual([[name[2:] for name in shard] for shard in shards], [[name[4:] for name in shard] for shard in moved])
+
+        # Run each shard as a separate process
+        current_folder = os.path.dirname(__file__)
+        script = os.path.join(os.path.dirname(MxGLTFPTManifest.__file__), 'materialx_to_gltf.py')
+        input_files = [os.path.join(current_folder, 'data', name) for name in ['checkerboard_graph.mtlx', 'minimal_graph.mtlx', 'add_graph.mtlx', 'shader_procedural_3.mtlx']]
+        with tempfile.TemporaryDirectory() as temp_folder:
+            output_folder = os.path.join(temp_folder, 'output')
+            processes = []
+            for i in range(2):
+                command = [sys.executable, script] + input_files + ['-o', output_folder, '-q', '--shard', f'{i}/2', '--manifest', os.path.join(temp_folder, f'manifest_{i}.json')]
+                processes.append(subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            for process in processes:
+                self.assertEqual(process.wait(), 0)
+
+            manifests = []
+            for i in range(2):
+                manifest = MxGLTFPTManifest.ConversionManifest()
+                manifest.load(os.path.join(temp_folder, f'manifest_{i}.json'))
+                self.assertEqual(manifest.shard_index, i)
+                manifests.append(manifest)
+            report = MxGLTFPTManifest.merge_manifests(manifests, check_outputs=True)
+            self.assertTrue(report['complete'])
+            self.assertEqual(report['files'], len(input_files))
+            self.assertEqual(report['status'], {'ok': len(input_files)})
+
+            # A missing shard, a duplicated shard and a missing output are detected
+            report = MxGLTFPTManifest.merge_manifests([manifests[0], manifests[0]])
+            self.assertFalse(report['complete'])
+            self.assertEqual(report['missing_shards'], [1])
+            self.assertEqual(report['duplicated_shards'], [0])
+            os.remove(manifests[1].entries[0]['outputs'][0])
+            report = MxGLTFPTManifest.merge_manifests(manifests, check_outputs=True)
+            self.assertEqual(report['missing_outputs'], manifests[1].entries[0]['outputs'])
+            self.assertFalse(report['complete'])
+
+class TestRunReport(unittest.TestCase):
+    '''
+    Test run reports
+    '''
+    def test_run_report(self):
+
+        self.assertEqual(MxGLTFPTReport.get_percentile([], 0.5), 0.0)
+        self.assertEqual(MxGLTFPTReport.get_percentile([3, 1, 2], 0.5), 2)
+        self.assertAlmostEqual(MxGLTFPTReport.get_percentile(list(range(101)), 0.95), 95)
+        self.assertAlmostEqual(MxGLTFPTReport.get_percentile([0, 10], 0.99), 9.9)
+
+        # Library graphs imported into a document are not counted
+        current_folder = os.path.dirname(__file__)
+        input_file = os.path.join(current_folder, 'data', 'checkerboard_graph.mtlx')
+        mxdoc = get_materialX_document(self, input_file)
+        counts = MxGLTFPTReport.get_materialX_counts(mxdoc)
+        self.assertEqual(counts['materials'], 1)
+        self.assertEqual(counts['nodegraphs'], 1)
+
+        report = MxGLTFPTReport.RunReport('test')
+        for i in range(4):
+            statistics = MxGLTFPTReport.FileStatistics()
+            statistics.timings = {'read': 0.1 * i, 'convert': 0.1}
+            statistics.counts = counts
+            report.add_file(input_file, 'ok' if i else 'failed', [input_file], statistics)
+        summary = report.get_summary(top=2)
+        self.assertEqual(summary['files'], 4)
+        self.assertEqual(summary['status'], {'ok': 3, 'failed': 1})
+        self.assertAlmostEqual(summary['phases']['convert'], 0.4)
+        self.assertAlmostEqual(summary['latency']['max'], 0.4)
+        self.assertEqual([item['time'] for item in summary['slowest']], [summary['latency']['max'], report.files[2]['time']])
+        self.assertEqual(summary['input_size'], 4 * os.path.getsize(input_file))
+        self.assertGreater(summary['throughput']['files_per_second'], 0)
+        self.assertIsNone(summary['entries'][0]['rss'])
+
+        # Memory is measured per file
+        statistics = MxGLTFPTReport.FileStatistics()
+        with statistics.measure_memory(trace_allocations=True):
+            data = [0] * 100000
+        record = report.add_file(input_file, 'ok', [], statistics)
+        self.assertGreater(record['rss'], 0)
+        self.assertGreaterEqual(record['peak_rss'], record['rss'])
+        self.assertGreater(record['allocated'], 0)
+
+class TestTracing(unittest.TestCase):
+    '''
+    Test Chrome trace event export
+    '''
+    @unittest.skipUnless(hasattr(os, 'fork'), 'Requires fork()')
+    def test_tracing(self):
+
+        # Spans cost nothing when tracing is disabled
+        self.assertIsNone(MxGLTFPTTrace.get_recorder())
+        with MxGLTFPTTrace.span('unused'):
+            pass
+
+        current_folder = os.path.dirname(__file__)
+        requests = [{'id': i, 'direction': MxGLTFPTJobs.MTLX_TO_GLTF, 'path': os.path.join(current_folder, 'data', 'checkerboard_graph.mtlx')} for i in range(2)]
+        runner = MxGLTFPTJobs.ConversionJobRunner()
+        recorder = MxGLTFPTTrace.start_tracing()
+        try:
+            result = runner.run(requests[0])
+            self.assertEqual(result['status'], 'ok')
+            with MxGLTFPTJobs.ConversionWorkerPool(runner, 1) as pool:
+                pool.get_result(pool.submit(requests[1]))
+        finally:
+            MxGLTFPTTrace.stop_tracing()
+
+        # Spans of worker processes are added to the parent recorder
+        spans = [event for event in recorder.events if event['ph'] == 'X']
+        names = set(event['name'] for event in spans)
+        for name in ['request', 'read', 'validate', 'convert', 'materialX_graph_to_glTF']:
+            self.assertIn(name, names)
+        pids = set(event['pid'] for event in spans)
+        self.assertEqual(len(pids), 2)
+        self.assertTrue(all(event['dur'] >= 0 for event in spans))
+
+        with tempfile.TemporaryDirectory() as temp_folder:
+            trace_file = os.path.join(temp_folder, 'trace.json')
+            recorder.save(trace_file)
+            with open(trace_file, 'r') as f:
+                trace = json.load(f)
+        self.assertEqual(len(trace['traceEvents']), len(recorder.events))
+
+class TestOptimize(unittest.TestCase):
+    '''
+    Test optimization passes run before export to glTF
+    '''
+    def get_procedural(self, json_string):
+        procedural = json.loads(json_string)['extensions']['KHR_texture_procedurals']['procedurals'][0]
+        node_count = len(procedural['nodes'])
+        for port in list(procedural['outputs'].values()) + [input for node in procedural['nodes'] for input in node.get('inputs', {}).values()]:
+            if 'node' in port:
+                self.assertLess(port['node'], node_count)
+            if 'input' in port:
+                self.assertIn(port['input'], procedural['inputs'])
+        return procedural
+
+    def test_dead_nodes(self):
+
+        current_folder = os.path.dirname(__file__)
+        mxdoc = get_materialX_document(self, os.path.join(current_folder, 'data', 'checkerboard_graph.mtlx'))
+        graph = mxdoc.getNodeGraph('NG_main')
+        unused_node = graph.addNode('multiply', 'unused_multiply', 'color3')
+        unused_node.setConnectedNode('in1', graph.getNode('N_mtlxmix'))
+        graph.setChildIndex(unused_node.getName(), 0)
+        graph.addInput('unused_input', 'float').setValue(0.5)
+
+        converter = MxGLTFPT.glTFMaterialXConverter()
+        json_string, status = converter.materialX_to_glTF(mxdoc)
+        procedural = self.get_procedural(json_string)
+        self.assertEqual(procedural['nodes'][0]['name'], 'unused_multiply')
+
+        # Node indices are remapped to the nodes which are kept
+        diagnostics = MxGLTFPTDiag.Diagnostics()
+        options = converter.options.replace(optimize=[MxGLTFPTOptimize.OPTIMIZE_DEAD_NODES])
+        json_string, status = converter.materialX_to_glTF(mxdoc, options=options, diagnostics=diagnostics)
+        optimized = self.get_procedural(json_string)
+        self.assertEqual(len(optimized['nodes']), len(procedural['nodes']) - 1)
+        self.assertNotIn('unused_input', optimized['inputs'])
+        output = next(iter(optimized['outputs'].values()))
+        self.assertEqual(optimized['nodes'][output['node']]['name'], 'N_mtlxmix')
+        self.assertEqual(diagnostics.counts[MxGLTFPTOptimize.OPTIMIZE_DEAD_NODES], 1)
+
+        # The document is not modified
+        self.assertIsNotNone(graph.getNode('unused_multiply'))
+        with self.assertRaises(ValueError):
+            MxGLTFPTOptimize.create_export_plan(graph, ['unknown'])
+
+    def test_fold_constants(self):
+
+        stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+        mxdoc = MxGLTFPTUtil.create_working_document([stdlib])
+        graph = mxdoc.addNodeGraph('NG_fold')
+        texcoord = graph.addNode('texcoord', 'texcoord', 'vector2')
+        separate = graph.addNode('separate2', 'separate', 'multioutput')
+        separate.setConnectedNode('in', texcoord)
+        constant = graph.addNode('constant', 'constant', 'color3')
+        constant.setInputValue('value', mx.Color3(0.25, 0.5, 1.0))
+        multiply = graph.addNode('multiply', 'multiply', 'color3')
+        multiply.setConnectedNode('in1', constant)
+        multiply.setInputValue('in2', 2.0)
+        divide = graph.addNode('divide', 'divide', 'float')
+        divide.setInputValue('in1', 1.0)
+        divide.setInputValue('in2', 4.0)
+        convert = graph.addNode('convert', 'convert', 'color3')
+        convert.setConnectedNode('in', divide)
+        mix = graph.addNode('mix', 'mix', 'color3')
+        mix.setConnectedNode('fg', multiply)
+        mix.setConnectedNode('bg', convert)
+        mix.addInput('mix', 'float').setConnectedNode(separate)
+        mix.getInput('mix').setOutputString('outx')
+        zero_divide = graph.addNode('divide', 'zero_divide', 'float')
+        zero_divide.setInputValue('in2', 0.0)
+        graph.addOutput('out', 'color3').setConnectedNode(mix)
+        graph.addOutput('out_zero', 'float').setConnectedNode(zero_divide)
+        self.assertTrue(mxdoc.validate()[0])
+
+        converter = MxGLTFPT.glTFMaterialXConverter()
+        options = converter.options.replace(optimize=[MxGLTFPTOptimize.OPTIMIZE_FOLD_CONSTANTS])
+        json_string, status = converter.materialX_to_glTF(mxdoc, options=options)
+        procedural = self.get_procedural(json_string)
+        nodes = {node['name']: node for node in procedural['nodes']}
+        self.assertEqual(sorted(nodes), ['mix', 'separate', 'texcoord', 'zero_divide'])
+        self.assertEqual(nodes['mix']['inputs']['fg']['value'], [0.5, 1.0, 2.0])
+        self.assertEqual(nodes['mix']['inputs']['bg']['value'], [0.25, 0.25, 0.25])
+        self.assertIn('node', nodes['mix']['inputs']['mix'])
+
+        # Colors which are transformed by the renderer are not folded
+        mxdoc.setColorSpace('srgb_texture')
+        json_string, status = converter.materialX_to_glTF(mxdoc, options=options)
+        nodes = {node['name']: node for node in self.get_procedural(json_string)['nodes']}
+        self.assertIn('multiply', nodes)
+        self.assertIn('node', nodes['mix']['inputs']['bg'])
+        self.assertEqual(nodes['convert']['inputs']['in']['value'], [0.25])
+
+    def test_merge_nodes(self):
+
+        stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+        mxdoc = MxGLTFPTUtil.create_working_document([stdlib])
+        graph = mxdoc.addNodeGraph('NG_merge')
+        multiplies = []
+        for i in range(2):
+            texcoord = graph.addNode('texcoord', f'texcoord{i}', 'vector2')
+            texcoord.setAttribute('xpos', str(i))
+            multiply = graph.addNode('multiply', f'multiply{i}', 'vector2')
+            multiply.setConnectedNode('in1', texcoord)
+            multiply.setInputValue('in2', 2.0)
+            multiplies.append(multiply)
+        scale = graph.addNode('multiply', 'scale', 'vector2')
+        scale.setConnectedNode('in1', graph.getNode('texcoord1'))
+        scale.setInputValue('in2', 3.0)
+        add = graph.addNode('add', 'add', 'vector2')
+        add.setConnectedNode('in1', multiplies[0])
+        add.setConnectedNode('in2', multiplies[1])
+        add_scale = graph.addNode('add', 'add_scale', 'vector2')
+        add_scale.setConnectedNode('in1', add)
+        add_scale.setConnectedNode('in2', scale)
+        graph.addOutput('out', 'vector2').setConnectedNode(add_scale)
+        graph.addOutput('out_multiply', 'vector2').setConnectedNode(multiplies[1])
+        self.assertTrue(mxdoc.validate()[0])
+
+        # Duplicate nodes and nodes with duplicate upstream nodes are merged
+        converter = MxGLTFPT.glTFMaterialXConverter()
+        diagnostics = MxGLTFPTDiag.Diagnostics()
+        options = converter.options.replace(optimize=[MxGLTFPTOptimize.OPTIMIZE_MERGE_NODES])
+        json_string, status = converter.materialX_to_glTF(mxdoc, options=options, diagnostics=diagnostics)
+        procedural = self.get_procedural(json_string)
+        names = [node['name'] for node in procedural['nodes']]
+        self.assertEqual(names, ['texcoord0', 'multiply0', 'scale', 'add', 'add_scale'])
+        add_inputs = procedural['nodes'][names.index('add')]['inputs']
+        self.assertEqual(add_inputs['in1']['node'], names.index('multiply0'))
+        self.assertEqual(add_inputs['in2']['node'], names.index('multiply0'))
+        self.assertEqual(procedural['nodes'][names.index('scale')]['inputs']['in1']['node'], names.index('texcoord0'))
+        self.assertEqual(procedural['outputs']['out_multiply']['node'], names.index('multiply0'))
+        self.assertEqual(diagnostics.counts[MxGLTFPTOptimize.OPTIMIZE_MERGE_NODES], 1)
+
+    def test_elide_defaults(self):
+
+        stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+        mxdoc = MxGLTFPTUtil.create_working_document([stdlib])
+        graph = mxdoc.addNodeGraph('NG_defaults')
+        multiply = graph.addNode('multiply', 'multiply', 'color3')
+        multiply.setInputValue('in1', mx.Color3(0.5, 0.5, 0.5))
+        multiply.setInputValue('in2', mx.Color3(1.0, 1.0, 1.0000001))
+        clamp = graph.addNode('clamp', 'clamp', 'color3')
+        clamp.setConnectedNode('in', multiply)
+        clamp.setInputValue('low', mx.Color3(0.0, 0.0, 0.0))
+        clamp.setInputValue('high', mx.Color3(0.5, 1.0, 1.0))
+        graph.addOutput('out', 'color3').setConnectedNode(clamp)
+        self.assertTrue(mxdoc.validate()[0])
+
+        self.assertTrue(MxGLTFPTOptimize.is_default_value(multiply.getInput('in2'), multiply.getNodeDef()))
+        self.assertFalse(MxGLTFPTOptimize.is_default_value(multiply.getInput('in1'), multiply.getNodeDef()))
+        self.assertFalse(MxGLTFPTOptimize.is_default_value(clamp.getInput('in'), clamp.getNodeDef()))
+
+        converter = MxGLTFPT.glTFMaterialXConverter()
+        options = converter.options.replace(elide_defaults=True)
+        json_string, status = converter.materialX_to_glTF(mxdoc, options=options)
+        nodes = {node['name']: node for node in self.get_procedural(json_string)['nodes']}
+        self.assertEqual(sorted(nodes['multiply']['inputs']), ['in1'])
+        self.assertEqual(sorted(nodes['clamp']['inputs']), ['high', 'in'])
+
+        # Default values listed in glTF are left implicit on import
+        json_string, status = converter.materialX_to_glTF(mxdoc)
+        imported_doc = converter.gltf_string_to_materialX(json_string, stdlib, options=options)
+        imported_node = imported_doc.getNodeGraph('NG_defaults').getNode('multiply')
+        self.assertEqual([input.getName() for input in imported_node.getInputs()], ['in1'])
+
+        # Round trips are still equivalent
+        current_folder = os.path.dirname(__file__)
+        verifier = MxGLTFPTVerify.RoundTripVerifier(stdlib, converter, options=options)
+        for file_name in ['checkerboard_graph.mtlx', 'checkerboard_graph.gltf']:
+            result = verifier.verify_file(os.path.join(current_folder, 'data', file_name))
+            self.assertEqual(result['status'], 'passed', result['message'])
+
+    def test_promote_inputs(self):
+
+        stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+        mxdoc = MxGLTFPTUtil.create_working_document([stdlib])
+        graph = mxdoc.addNodeGraph('NG_shared_file')
+        graph.addInput('file', 'filename').setValueString('unused.png')
+        images = []
+        for index in range(3):
+            texcoord = graph.addNode('texcoord', f'texcoord{index}', 'vector2')
+            texcoord.setInputValue('index', index)
+            image = graph.addNode('image', f'image{index}', 'color3')
+            image.setConnectedNode('texcoord', texcoord)
+            image.setInputValue('file', 'shared.png' if index < 2 else 'single.png', 'filename')
+            image.setInputValue('uaddressmode', 'clamp')
+            images.append(image)
+        add = graph.addNode('add', 'add', 'color3')
+        add.setConnectedNode('in1', images[0])
+        add.setConnectedNode('in2', images[1])
+        multiply = graph.addNode('multiply', 'multiply', 'color3')
+        multiply.setConnectedNode('in1', add)
+        multiply.setConnectedNode('in2', images[2])
+        graph.addOutput('out', 'color3').setConnectedNode(multiply)
+        self.assertTrue(mxdoc.validate()[0])
+
+        # Shared values are bound once on the interface, with names not used by the graph
+        converter = MxGLTFPT.glTFMaterialXConverter()
+        diagnostics = MxGLTFPTDiag.Diagnostics(MxGLTFPTDiag.INFO)
+        options = converter.options.replace(optimize=[MxGLTFPTOptimize.OPTIMIZE_PROMOTE_INPUTS])
+        json_string, status = converter.materialX_to_glTF(mxdoc, options=options, diagnostics=diagnostics)
+        json_data = json.loads(json_string)
+        procedural = self.get_procedural(json_string)
+        self.assertEqual(sorted(procedural['inputs']), ['file', 'file2', 'uaddressmode'])
+        self.assertEqual(procedural['inputs']['uaddressmode']['value'], 'clamp')
+        nodes = {node['name']: node for node in procedural['nodes']}
+        for name in ['image0', 'image1']:
+            self.assertEqual(nodes[name]['inputs']['file']['input'], 'file2')
+        self.assertIn('texture', nodes['image2']['inputs']['file'])
+        self.assertEqual(nodes['image2']['inputs']['uaddressmode']['input'], 'uaddressmode')
+        self.assertEqual(len(json_data['textures']), 3)
+        self.assertEqual(diagnostics.counts[MxGLTFPTOptimize.OPTIMIZE_PROMOTE_INPUTS], 1)
+
+        # Promoted values are imported as interface connections
+        imported_doc = converter.gltf_string_to_materialX(json_string, stdlib)
+        imported_doc.setDataLibrary(stdlib)
+        self.assertTrue(imported_doc.validate()[0])
+        imported_image = imported_doc.getNodeGraph('NG_shared_file').getNode('image0')
+        self.assertEqual(imported_image.getInput('file').getInterfaceName(), 'file2')
+        self.assertEqual(imported_image.getInput('file').getInterfaceInput().getValueString(), 'shared.png')
+
+class TestExportProfile(unittest.TestCase):
+    '''
+    Test authoring and delivery export profiles
+    '''
+
+    def test_delivery_profile(self):
+
+        stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+        mxdoc = MxGLTFPTUtil.create_working_document([stdlib])
+        current_folder = os.path.dirname(__file__)
+        mx.readFromXmlFile(mxdoc, os.path.join(current_folder, 'data', 'checkerboard_graph.mtlx'))
+
+        converter = MxGLTFPT.glTFMaterialXConverter()
+        authoring_string, status = converter.materialX_to_glTF(mxdoc)
+        options = converter.options.with_profile(MxGLTFPT.EXPORT_PROFILE_DELIVERY)
+        delivery_string, status = converter.materialX_to_glTF(mxdoc, options=options)
+        self.assertIn('"xpos"', authoring_string)
+        self.assertNotIn('"xpos"', delivery_string)
+        self.assertNotIn('\n', delivery_string)
+        self.assertLess(len(delivery_string), len(authoring_string))
+
+        # The authoring profile matches the default options
+        options = converter.options.with_profile(MxGLTFPT.EXPORT_PROFILE_AUTHORING)
+        self.assertEqual(converter.materialX_to_glTF(mxdoc, options=options)[0], authoring_string)
+        with self.assertRaises(ValueError):
+            converter.options.with_profile('unknown')
+
+        # Floats are rounded and negative zero is written as zero
+        json_data = {'values': [1.23456789, -0.0000001, [2.5, 'text', 3]]}
+        options = converter.options.replace(float_precision=3, compact_json=True)
+        self.assertEqual(converter.glTF_data_to_string(json_data, options), '{"values":[1.235,0.0,[2.5,"text",3]]}')
+
+class TestCost(unittest.TestCase):
+    '''
+    Test procedural cost estimates and budgets
+    '''
+
+    def test_cost_budget(self):
+
+        stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+        mxdoc = MxGLTFPTUtil.create_working_document([stdlib])
+        graph = mxdoc.addNodeGraph('NG_cost')
+        texcoord = graph.addNode('texcoord', 'texcoord', 'vector2')
+        image = graph.addNode('image', 'image', 'color3')
+        image.setConnectedNode('texcoord', texcoord)
+        noise = graph.addNode('noise2d', 'noise', 'color3')
+        noise.setConnectedNode('texcoord', texcoord)
+        multiply = graph.addNode('multiply', 'multiply', 'color3')
+        multiply.setConnectedNode('in1', image)
+        multiply.setConnectedNode('in2', noise)
+        graph.addOutput('out', 'color3').setConnectedNode(multiply)
+        self.assertTrue(mxdoc.validate()[0])
+
+        model = MxGLTFPTCost.CostModel(mxdoc)
+        procedural = {'name': 'NG_cost', 'nodes': [{'nodetype': node.getCategory()} for node in graph.getNodes()]}
+        estimate = model.estimate_procedural(procedural)
+        self.assertEqual(estimate['nodes'], 4)
+        self.assertEqual(estimate['texture_fetches'], 1)
+        weights = MxGLTFPTCost.DEFAULT_COST_WEIGHTS
+        self.assertEqual(estimate['cost'], weights['geometric'] + weights['texture2d'] + weights['procedural2d'] + weights['math'])
+        self.assertEqual(MxGLTFPTCost.check_budget(estimate, max_nodes=4), [])
+        self.assertEqual(len(MxGLTFPTCost.check_budget(estimate, max_nodes=3, max_texture_fetches=1, max_cost=1)), 2)
+
+        # Weights can be replaced by category or node group
+        model = MxGLTFPTCost.CostModel(mxdoc, {'image': 100.0, 'procedural2d': 10.0})
+        self.assertEqual(model.estimate_procedural(procedural)['cost'], 100.0 + 10.0 + 2 * MxGLTFPTCost.DEFAULT_NODE_WEIGHT)
+
+        # Estimates are recorded when exporting, and procedurals over budget warn or fail
+        converter = MxGLTFPT.glTFMaterialXConverter()
+        diagnostics = MxGLTFPTDiag.Diagnostics()
+        json_string, status = converter.materialX_to_glTF(mxdoc, diagnostics=diagnostics)
+        self.assertEqual(diagnostics.counts.get('procedural_cost'), 1)
+        self.assertNotIn('cost_budget', diagnostics.counts)
+
+        options = converter.options.replace(max_nodes=3)
+        diagnostics = MxGLTFPTDiag.Diagnostics(MxGLTFPTDiag.WARNING)
+        json_string, status = converter.materialX_to_glTF(mxdoc, options=options, diagnostics=diagnostics)
+        self.assertTrue(json_string)
+        self.assertEqual(diagnostics.events[-1].severity, MxGLTFPTDiag.WARNING)
+        self.assertEqual(diagnostics.events[-1].code, 'cost_budget')
+
+        options = options.replace(budget_action=MxGLTFPTCost.BUDGET_FAIL)
+        json_string, status = converter.materialX_to_glTF(mxdoc, options=options, diagnostics=diagnostics)
+        self.assertFalse(json_string)
+        self.assertIn('NG_cost', status)
+        self.assertEqual(diagnostics.events[-1].severity, MxGLTFPTDiag.ERROR)
+
+        # Nodes of custom definitions are estimated by their implementation graph
+        mxdoc = MxGLTFPTUtil.create_working_document([stdlib])
+        nodedef = mxdoc.addNodeDef('ND_texturedtint_color3', 'color3', 'texturedtint')
+        nodedef.setNodeGroup('adjustment')
+        nodedef.setInputValue('in', mx.Color3(1, 1, 1))
+        nodedef.addInput('file', 'filename').setValueString('tint.png')
+        implementation = mxdoc.addNodeGraph('NG_texturedtint_color3')
+        implementation.setNodeDef(nodedef)
+        image = implementation.addNode('image', 'image', 'color3')
+        image.addInput('file', 'filename').setInterfaceName('file')
+        multiply = implementation.addNode('multiply', 'multiply', 'color3')
+        multiply.addInput('in1', 'color3').setInterfaceName('in')
+        multiply.setConnectedNode('in2', image)
+        implementation.addOutput('out', 'color3').setConnectedNode(multiply)
+        graph = mxdoc.addNodeGraph('NG_tinted')
+        upstream = graph.addNode('constant', 'constant', 'color3')
+        for index in range(2):
+            tint = graph.addNode('texturedtint', f'tint{index}', 'color3')
+            tint.setConnectedNode('in', upstream)
+            upstream = tint
+        graph.addOutput('out', 'color3').setConnectedNode(upstream)
+        self.assertTrue(mxdoc.validate()[0])
+
+        json_data, status = converter.materialX_to_glTF_data(mxdoc)
+        extension = json_data['extensions'][MxGLTFPT.KHR_TEXTURE_PROCEDURALS]
+        model = MxGLTFPTCost.CostModel(mxdoc, definitions=extension[MxGLTFPT.KHR_TEXTURE_PROCEDURALS_DEFINITIONS_BLOCK])
+        estimate = model.estimate_procedural(extension[MxGLTFPT.KHR_TEXTURE_PROCEDURALS_PROCEDURALS_BLOCK][0])
+        self.assertEqual(estimate['nodes'], 5)
+        self.assertEqual(estimate['texture_fetches'], 2)
+        self.assertEqual(estimate['cost'], weights['procedural'] + 2 * (weights['texture2d'] + weights['math']))
+
+        options = converter.options.replace(max_texture_fetches=1)
+        diagnostics = MxGLTFPTDiag.Diagnostics(MxGLTFPTDiag.WARNING)
+        json_string, status = converter.materialX_to_glTF(mxdoc, options=options, diagnostics=diagnostics)
+        self.assertEqual(diagnostics.counts.get('cost_budget'), 1)
+
+class TestShaderGen(unittest.TestCase):
+    '''
+    Test shader generation checks of converted documents
+    '''
+
+    def test_shadergen_regressions(self):
+
+        stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+        checker = MxGLTFPTShaderGen.ShaderGenChecker(stdlib, 'essl')
+        current_folder = os.path.dirname(__file__)
+        results = []
+        for file_name in ['checkerboard_graph.mtlx', 'checkerboard_graph_fromgltf.mtlx']:
+            mxdoc = MxGLTFPTUtil.create_reference_document(stdlib)
+            MxGLTFPTUtil.read_materialX_document(mxdoc, os.path.join(current_folder, 'data', file_name))
+            results.append(checker.check_document(mxdoc))
+        original, roundtrip = results
+
+        # Materials are matched by shader name as material names are not preserved
+        self.assertEqual(len(original), 1)
+        self.assertEqual(original[0]['status'], 'ok', original[0]['message'])
+        self.assertEqual(original[0]['key'], roundtrip[0]['key'])
+        self.assertGreater(original[0]['source_size'], 0)
+        self.assertGreater(original[0]['uniforms'], 0)
+        self.assertEqual(MxGLTFPTShaderGen.find_regressions(original, roundtrip), [])
+
+        grown = [dict(roundtrip[0], uniforms=roundtrip[0]['uniforms'] + 1)]
+        self.assertEqual(len(MxGLTFPTShaderGen.find_regressions(original, grown)), 1)
+        failed = [dict(roundtrip[0], status='failed')]
+        self.assertEqual(len(MxGLTFPTShaderGen.find_regressions(original, failed)), 1)
+        self.assertEqual(len(MxGLTFPTShaderGen.find_regressions(original, [])), 1)
+
+        # Elements which cannot be generated are reported rather than raised
+        mxdoc = MxGLTFPTUtil.create_reference_document(stdlib)
+        output = mxdoc.addOutput('out', 'color3')
+        output.setConnectedNode(mxdoc.addNode('unknown_category', 'unknown', 'color3'))
+        self.assertEqual(checker.generate(output)['status'], 'failed')
+        with self.assertRaises(ValueError):
+            MxGLTFPTShaderGen.ShaderGenChecker(stdlib, 'unknown')
+
+@unittest.skipUnless(MxGLTFPTBake.have_numpy(), 'NumPy is required for baking')
+class TestBake(unittest.TestCase):
+    '''
+    Test baking procedural outputs into fallback textures
+    '''
+
+    def test_bake_fallbacks(self):
+
+        stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+        current_folder = os.path.dirname(__file__)
+        mxdoc = MxGLTFPTUtil.create_reference_document(stdlib)
+        MxGLTFPTUtil.read_materialX_document(mxdoc, os.path.join(current_folder, 'data', 'checkerboard_graph.mtlx'))
+
+        # The checkerboard is evaluated through its node graph implementation
+        graph = mxdoc.getNodeGraph('NG_main')
+        evaluator = MxGLTFPTBake.GraphEvaluator(16)
+        value = evaluator.evaluate(graph.getOutputs())[0]
+        self.assertEqual(value.shape, (16, 16, 3))
+        self.assertEqual(len(set(tuple(texel) for texel in value.reshape(-1, 3).round(6))), 2)
+
+        converter = MxGLTFPT.glTFMaterialXConverter()
+        options = converter.options.replace(bake_fallbacks=True, bake_resolution=16)
+        diagnostics = MxGLTFPTDiag.Diagnostics()
+        json_string, status = converter.materialX_to_glTF(mxdoc, options=options, diagnostics=diagnostics)
+        json_data = json.loads(json_string)
+        texture_info = json_data['materials'][0]['pbrMetallicRoughness']['baseColorTexture']
+        image = json_data['images'][json_data['textures'][texture_info['index']]['source']]
+        self.assertTrue(image['name'].startswith(MxGLTFPT.KHR_TEXTURE_PROCEDURALS_FALLBACK_NAME + '_NG_main'))
+        png = base64.b64decode(image['uri'].split(',', 1)[1])
+        self.assertEqual(png[:8], b'\x89PNG\r\n\x1a\n')
+        self.assertEqual(struct.unpack('>II', png[16:24]), (16, 16))
+        self.assertEqual(diagnostics.counts.get('bake_fallback'), 1)
+
+        # Baked images are cached by graph
+        self.assertEqual(converter.materialX_to_glTF(mxdoc, options=options)[0], json_string)
+        self.assertEqual(len(converter.fallback_baker.cache), 1)
+
+        # Outputs using nodes which cannot be evaluated keep the shared fallback texture
+        output = graph.getOutputs()[0]
+        unsupported = graph.addNode('determinant', 'unsupported', 'float')
+        self.assertIsNotNone(converter.fallback_baker.bake([output], 16)[0])
+        mix_node = output.getConnectedNode()
+        mix_node.setConnectedNode('mix', unsupported)
+        uris, error = converter.fallback_baker.bake([output], 16)
+        self.assertIsNone(uris)
+        self.assertIn('determinant', error)
+
+class TestProceduralDefinitions(unittest.TestCase):
+    '''
+    Test export of custom node definitions as shared procedural definitions
+    '''
+
+    def test_procedural_definitions(self):
+
+        stdlib, libFiles = MxGLTFPTUtil.load_standard_libraries()
+        mxdoc = MxGLTFPTUtil.create_working_document([stdlib])
+        nodedef = mxdoc.addNodeDef('ND_tint_color3', 'color3', 'tint')
+        nodedef.setNodeGroup('adjustment')
+        nodedef.setInputValue('in', mx.Color3(1, 1, 1))
+        nodedef.setInputValue('color', mx.Color3(1, 0.5, 0.25))
+        implementation = mxdoc.addNodeGraph('NG_tint_color3')
+        implementation.setNodeDef(nodedef)
+        multiply = implementation.addNode('multiply', 'multiply', 'color3')
+        multiply.addInput('in1', 'color3').setInterfaceName('in')
+        multiply.addInput('in2', 'color3').setInterfaceName('color')
+        implementation.addOutput('out', 'color3').setConnectedNode(multiply)
+
+        graph = mxdoc.addNodeGraph('NG_main')
+        upstream = graph.addNode('checkerboard', 'checkerboard', 'color3')
+        for index in range(3):
+            tint = graph.addNode('tint', f'tint{index}', 'color3')
+            tint.setConnectedNode('in', upstream)
+            upstream = tint
+        graph.addOutput('out', 'color3').setConnectedNode(upstream)
+        self.assertTrue(mxdoc.validate()[0])
+
+        # The definition and its implementation are exported once for all instances
+        converter = MxGLTFPT.glTFMaterialXConverter()
+        self.assertTrue(converter.is_custom_definition(nodedef))
+        self.assertFalse(converter.is_custom_definition(mxdoc.getNodeDef('ND_checkerboard_color3')))
+        diagnostics = MxGLTFPTDiag.Diagnostics(MxGLTFPTDiag.INFO)
+        json_string, status = converter.materialX_to_glTF(mxdoc, diagnostics=diagnostics)
+        extension = json.loads(json_string)['extensions'][MxGLTFPT.KHR_TEXTURE_PROCEDURALS]
+        self.assertEqual(diagnostics.counts.get('export_definition'), 1)
+        procedural = extension[MxGLTFPT.KHR_TEXTURE_PROCEDURALS_PROCEDURALS_BLOCK][0]
+        self.assertEqual([node['nodetype'] for node in procedural['nodes']], ['checkerboard', 'tint', 'tint', 'tint'])
+        definitions = extension[MxGLTFPT.KHR_TEXTURE_PROCEDURALS_DEFINITIONS_BLOCK]
+        self.assertEqual(len(definitions), 2)
+        self.assertEqual(definitions[0]['node'], 'tint')
+        self.assertEqual(definitions[0]['inputs']['color']['value'], [1.0, 0.5, 0.25])
+        self.assertEqual(definitions[1]['nodedef'], 0)
+        self.assertEqual(definitions[1]['nodes'][0]['inputs']['in2']['input'], 'color')
+
+        # Definitions and their implementations are imported back
+        mtlx_doc = converter.gltf_string_to_materialX(json_string, stdlib)
+        imported = mtlx_doc.getNodeDef('ND_tint_color3')
+        self.assertIsNotNone(imported)
+        self.assertEqual(imported.getNodeString(), 'tint')
+        self.assertEqual(imported.getInputValue('color'), mx.Color3(1, 0.5, 0.25))
+        imported_implementation = imported.getImplementation()
+        self.assertIsNotNone(imported_implementation)
+        self.assertEqual(imported_implementation.getName(), 'NG_tint_color3')
+        self.assertEqual(imported_implementation.getNode('multiply').getInput('in2').getInterfaceName(), 'color')
+        mtlx_doc.importLibrary(stdlib)
+        self.assertTrue(mtlx_doc.validate()[0])
+        self.assertEqual(mtlx_doc.getNodeGraph('NG_main').getNode('tint0').getNodeDef(), imported)
+
+        # Identical definitions are shared across the documents of a bundle
+        json_string, status = converter.materialX_documents_to_glTF([mxdoc, mxdoc])
+        extension = json.loads(json_string)['extensions'][MxGLTFPT.KHR_TEXTURE_PROCEDURALS]
+        self.assertEqual(len(extension[MxGLTFPT.KHR_TEXTURE_PROCEDURALS_PROCEDURALS_BLOCK]), 2)
+        self.assertEqual(len(extension[MxGLTFPT.KHR_TEXTURE_PROCEDURALS_DEFINITIONS_BLOCK]), 2)
+
+        # A document with a different definition of the same name is not added
+        conflict = mx.createDocument()
+        conflict.copyContentFrom(mxdoc)
+        conflict.importLibrary(stdlib)
+        conflict.getNodeDef('ND_tint_color3').setInputValue('color', mx.Color3(0, 1, 0))
+        self.assertTrue(conflict.validate()[0])
+        diagnostics = MxGLTFPTDiag.Diagnostics(MxGLTFPTDiag.INFO)
+        json_string, status = converter.materialX_documents_to_glTF([mxdoc, conflict], diagnostics=diagnostics)
+        self.assertEqual(diagnostics.counts.get('definition_conflict'), 1)
+        self.assertIn('conflict', status[1])
+        extension = json.loads(json_string)['extensions'][MxGLTFPT.KHR_TEXTURE_PROCEDURALS]
+        self.assertEqual(len(extension[MxGLTFPT.KHR_TEXTURE_PROCEDURALS_PROCEDURALS_BLOCK]), 1)
+        definitions = extension[MxGLTFPT.KHR_TEXTURE_PROCEDURALS_DEFINITIONS_BLOCK]
+        self.assertEqual(len(definitions), 2)
+        self.assertEqual(definitions[0]['inputs']['color']['value'], [1.0, 0.5, 0.25])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file